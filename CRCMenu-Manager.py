@@ -1,129 +1,600 @@
 import sys
 import json
 import os
-import hashlib
-import re
 import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
 from PySide6.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout, 
-                             QHBoxLayout, QFileDialog, QListWidget, QWidget, 
+                             QHBoxLayout, QFileDialog, QListView, QAbstractItemView, QLineEdit, QWidget, 
                              QLabel, QMessageBox, QProgressBar, QStatusBar, QTextEdit,
-                             QComboBox)
-from PySide6.QtCore import Qt, QThread, Signal, QPropertyAnimation, QEasingCurve, QTimer
-from PySide6.QtGui import QFont, QColor, QPalette
+                             QComboBox, QDialog, QPlainTextEdit)
+from PySide6.QtCore import (Qt, QThread, Signal, QPropertyAnimation, QEasingCurve, QTimer,
+                            QAbstractListModel, QModelIndex, QSortFilterProxyModel, QFileSystemWatcher)
+from PySide6.QtGui import QFont, QColor, QPalette, QTextCursor, QFontDatabase
+from crcmenu_core import (FileProcessor, Manifest, RunControl, run_batch, normalize_config, normalize_pipeline, large_file_threshold,
+                          load_file_list, file_list_path_for, ConfigWriter, manifest_path_for, journal_dir_for, start_journal, create_backup, DEFAULT_CONFIG, DEFAULT_CONFIG_PATH, SETTING_KEYS,
+                          find_journal, journal_status, prepare_resume, remaining_targets, resolve_version,
+                          parse_assets, format_assets, normalize_assets, parse_pipeline, format_pipeline,
+                          DEFAULT_RULES, normalize_root, expand_targets,
+                          PIPELINE_MODE, STATUS_SUCCESS, STATUS_UNCHANGED, STATUS_FAILED)
+from crcmenu_backup import BackupStore, backup_dir_for
+from crcmenu_inventory import Inventory, inventory_path_for
+from crcmenu_report import RunStats, report_dir_for
+from crcmenu_watch import watch_batches
 
 class ProcessThread(QThread):
     progress_updated = Signal(int)
-    file_processed = Signal(str, bool)
+    file_processed = Signal(str, str)
+    stats_updated = Signal(dict)
+    report_saved = Signal(str)
+    diff_ready = Signal(str)
     operation_completed = Signal(bool)
     
-    def __init__(self, file_list, font_awesome_code, js_code, mode):
+    # 信号最短发送间隔（秒），避免大批量文件时刷爆界面事件队列
+    emit_interval = 0.1
+    # 预演时发送到查看器的差异上限（字符），完整内容始终写入补丁文件
+    preview_limit = 5 * 1024 * 1024
+    
+    def __init__(self, file_list, font_awesome_code, js_code, mode, settings=None, config_path=DEFAULT_CONFIG_PATH,
+                 roots=None, resume_journal=None, dry_run=False):
         super().__init__()
         self.file_list = file_list
+        self.roots = roots or []
         self.font_awesome_code = font_awesome_code
         self.js_code = js_code
         self.mode = mode
+        self.settings = normalize_config(settings or {})
+        self.config_path = config_path
         self.common_timestamp = time.time()
+        # 续跑时沿用原运行的日志与参数，只处理尚未完成的文件
+        self.resume_journal = resume_journal
+        self.resume_state = None
+        self.pipeline = self.settings["pipeline"]
+        self.control = RunControl()
+        # 预演：不写入任何文件，差异流式写入临时补丁文件并发送给查看器
+        self.dry_run = dry_run
+        self.patch_path = None
+        self.preview_truncated = False
+    
+    def pause(self):
+        self.control.pause()
+    
+    def resume(self):
+        self.control.resume()
+    
+    def cancel(self):
+        self.control.cancel()
         
+    def create_processor(self):
+        settings = self.settings
+        manifest = Manifest(manifest_path_for(self.config_path)).load() if settings["incremental"] else None
+        journal = self.resume_journal
+        version = None
+        assets = settings["assets"]
+        if journal is not None:
+            self.resume_state = prepare_resume(journal, BackupStore(backup_dir_for(self.config_path)))
+            begin = self.resume_state["begin"]
+            self.font_awesome_code, self.js_code, self.mode = begin["font_awesome_code"], begin["js_code"], begin["mode"]
+            self.common_timestamp = begin["common_timestamp"]
+            self.pipeline = begin.get("pipeline")
+            version = begin.get("version")
+            assets = begin.get("assets")
+        else:
+            version = resolve_version(settings, self.config_path)
+        processor = FileProcessor(self.font_awesome_code, self.js_code, self.mode, self.common_timestamp,
+                                  manifest.entries if manifest is not None else None,
+                                  settings["write_only_on_change"], journal,
+                                  fsync=settings["fsync"], fsync_dir=settings["fsync_dir"],
+                                  backup=None if self.dry_run else create_backup(settings, self.config_path),
+                                  run_id=journal.run_id if journal is not None else None,
+                                  pipeline=self.pipeline,
+                                  large_file_threshold=large_file_threshold(settings),
+                                  dry_run=self.dry_run, version=version, precompress=settings["precompress"],
+                                  assets=assets, precompress_create=settings["precompress_create"])
+        if self.dry_run:
+            return processor, None
+        if settings["journal"] and journal is None:
+            try:
+                processor.journal = start_journal(journal_dir_for(self.config_path), processor,
+                                                  self.file_list + self.roots)
+            except Exception as e:
+                print(f"Error creating journal: {e}")
+        return processor, manifest
+    
     def run(self):
-        success_count = 0
-        total_files = len(self.file_list)
+        settings = self.settings
+        try:
+            processor, manifest = self.create_processor()
+        except Exception as e:
+            print(f"Error starting run: {e}")
+            self.operation_completed.emit(False)
+            return
         
-        for i, file_path in enumerate(self.file_list):
-            result = self._process_file(file_path)
-            self.file_processed.emit(file_path, result)
-            if result:
-                success_count += 1
-            self.progress_updated.emit(int((i + 1) / total_files * 100))
+        success_count = 0
+        processed_count = 0
+        # 目录在处理过程中才扫描，总数未知时不发送进度百分比
+        total_files = None if self.roots else len(self.file_list)
+        last_emit = 0.0
+        last_failed = None
         
-        self.operation_completed.emit(success_count == total_files)
-    
-    def _process_file(self, file_path):
+        stats = RunStats(processor.run_id, processor.mode)
+        if self.resume_state is not None:
+            targets = remaining_targets(self.resume_state)
+            if not any(isinstance(target, dict) for target in self.resume_state["begin"]["targets"]):
+                targets = list(targets)
+                total_files = len(targets)
+        else:
+            targets = expand_targets(self.file_list + self.roots)
+        patch_file = None
+        pending_diffs = []
+        sent_chars = 0
+        if self.dry_run:
+            fd, self.patch_path = tempfile.mkstemp(prefix="CRCMenu-", suffix=".patch")
+            patch_file = open(fd, 'w', encoding='utf-8', errors='surrogateescape', newline='\n')
+        # 处理池、提交或日志写入出错时同样发出统计与完成信号，界面才能退出运行状态
+        run_failed = False
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            backup_path = file_path + '.bak'
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            if self.mode == "update":
-                return self._update_version(content, file_path)
-            elif self.mode == "inject":
-                return self._inject_content(content, file_path)
-            elif self.mode == "delete":
-                return self._delete_content(content, file_path)
+            for file_path, result in run_batch(processor, targets, settings["workers"], settings["executor"],
+                                               manifest, stats, self.control):
+                processed_count += 1
+                if result:
+                    success_count += 1
+                else:
+                    last_failed = file_path
+                if result.diff:
+                    patch_file.write(result.diff)
+                    if sent_chars < self.preview_limit:
+                        pending_diffs.append(result.diff)
+                        sent_chars += len(result.diff)
+                    else:
+                        self.preview_truncated = True
                 
+                now = time.monotonic()
+                if now - last_emit >= self.emit_interval or processed_count == total_files:
+                    last_emit = now
+                    self.emit_progress(file_path, result, last_failed, processed_count, total_files, stats,
+                                       pending_diffs)
+                    last_failed = None
+                    pending_diffs = []
         except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            return False
+            print(f"Error during run: {e}")
+            run_failed = True
+        finally:
+            if patch_file is not None:
+                patch_file.close()
+        
+        try:
+            if pending_diffs:
+                self.diff_ready.emit(''.join(pending_diffs))
+            self.emit_stats(stats)
+            if settings["report"] and not self.dry_run:
+                try:
+                    json_path, csv_path = stats.save(report_dir_for(self.config_path))
+                    self.report_saved.emit(json_path)
+                except OSError as e:
+                    print(f"Error writing report: {e}")
+        finally:
+            self.operation_completed.emit(not run_failed and success_count == processed_count)
     
-    def _update_version(self, content, file_path):
+    def emit_progress(self, file_path, result, last_failed, processed_count, total_files, stats, pending_diffs):
+        if last_failed is not None:
+            self.file_processed.emit(last_failed, STATUS_FAILED)
+        else:
+            self.file_processed.emit(file_path, result.status)
+        if total_files:
+            self.progress_updated.emit(int(processed_count / total_files * 100))
+        if pending_diffs:
+            self.diff_ready.emit(''.join(pending_diffs))
+        self.emit_stats(stats)
+    
+    def emit_stats(self, stats):
+        self.stats_updated.emit({
+            "files": stats.files,
+            "changed": stats.counts[STATUS_SUCCESS],
+            "unchanged": stats.counts[STATUS_UNCHANGED],
+            "failed": stats.counts[STATUS_FAILED],
+            "files_per_second": stats.files_per_second,
+            "mb_per_second": stats.mb_per_second,
+            "errors": dict(stats.errors)
+        })
+
+class WatchThread(ProcessThread):
+    # 监视模式：复用 ProcessThread 的处理器与信号，只对发生变化的文件重新执行操作，直到 stop() 被调用
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = threading.Event()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def run(self):
+        settings = self.settings
+        try:
+            processor, manifest = self.create_processor()
+        except Exception as e:
+            print(f"Error starting watch: {e}")
+            self.operation_completed.emit(False)
+            return
+        
+        # 监视过程中出错（如目录被删除）也要发出完成信号，界面才能退出监视状态
+        all_success = True
         try:
-            hash_value = hashlib.md5(str(self.common_timestamp).encode()).hexdigest()[:8]
-            
-            js_pattern = r'(<script[^>]*src=["\'][^"\']*CRCMenu\.js)(?:\?v=[^"\']*)?(["\'][^>]*)>'
-            new_js = r'\1?v=' + hash_value + r'\2>'
-            new_content = re.sub(js_pattern, new_js, content, flags=re.IGNORECASE)
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
-            return True
+            for file_path, result in watch_batches(processor, self.file_list + self.roots, settings["workers"],
+                                                   settings["executor"], manifest, self.stop_event,
+                                                   debounce=settings["watch_debounce_ms"] / 1000):
+                all_success = all_success and result.status != STATUS_FAILED
+                self.file_processed.emit(file_path, result.status)
         except Exception as e:
-            print(f"Error updating JS version {file_path}: {e}")
-            return False
+            print(f"Error watching files: {e}")
+            all_success = False
+        self.operation_completed.emit(all_success)
+
+class DiffViewer(QDialog):
+    # 预演结果查看器：差异随处理进度追加显示，完成后可另存为补丁文件
+    def __init__(self, texts, parent=None):
+        super().__init__(parent)
+        self.texts = texts
+        self.patch_path = None
+        self.setWindowTitle(texts["preview_title"])
+        self.resize(900, 600)
+        
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel(texts["preview_running_msg"])
+        layout.addWidget(self.summary_label)
+        
+        self.diff_edit = QPlainTextEdit()
+        self.diff_edit.setReadOnly(True)
+        self.diff_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.diff_edit.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        layout.addWidget(self.diff_edit)
+        
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        self.save_btn = QPushButton(texts["save_patch_btn"])
+        self.save_btn.setEnabled(False)
+        self.save_btn.clicked.connect(self.save_patch)
+        button_layout.addWidget(self.save_btn)
+        close_btn = QPushButton(texts["close_btn"])
+        close_btn.clicked.connect(self.reject)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+    
+    def append_diff(self, text):
+        cursor = QTextCursor(self.diff_edit.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+    
+    def set_summary(self, stats):
+        self.summary_label.setText(self.texts["preview_summary_msg"].format(**stats))
     
-    def _inject_content(self, content, file_path):
+    def finish(self, patch_path, truncated):
+        self.patch_path = patch_path
+        self.save_btn.setEnabled(bool(patch_path))
+        if truncated:
+            self.append_diff("\n" + self.texts["preview_truncated_msg"] + "\n")
+        if not self.diff_edit.document().characterCount() > 1:
+            self.diff_edit.setPlainText(self.texts["preview_empty_msg"])
+    
+    def save_patch(self):
+        target, _ = QFileDialog.getSaveFileName(self, self.texts["save_patch_btn"], "CRCMenu.patch",
+                                                "Patch Files (*.patch *.diff);;All Files (*)")
+        if not target:
+            return
         try:
+            shutil.copyfile(self.patch_path, target)
+        except OSError as e:
+            QMessageBox.warning(self, self.texts["partial_fail_title"], str(e))
 
-            new_content = content
-            if self.font_awesome_code:
-                head_index = content.lower().rfind('</head>')
-                if head_index != -1:
-                    new_content = (content[:head_index] + '\n' + self.font_awesome_code + '\n' + 
-                                  content[head_index:])
-
-            body_end = new_content.lower().rfind('</body>')
-            if body_end == -1:
-                return False
-            new_content = new_content[:body_end] + '\n' + self.js_code + '\n' + new_content[body_end:]
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
-            return True
+class InventoryThread(QThread):
+    # 后台更新页面清单：只读取文件，不修改任何内容
+    progress_updated = Signal(int)
+    scan_completed = Signal(dict)
+    
+    emit_interval = 0.1
+    
+    def __init__(self, targets, font_awesome_code, js_code, settings, config_path):
+        super().__init__()
+        self.targets = targets
+        self.font_awesome_code = font_awesome_code
+        self.js_code = js_code
+        self.settings = settings
+        self.config_path = config_path
+        self.control = RunControl()
+        self.error = None
+    
+    def cancel(self):
+        self.control.cancel()
+    
+    def run(self):
+        summary = {}
+        checked = 0
+        last_emit = 0.0
+        try:
+            with Inventory(inventory_path_for(self.config_path)) as inventory:
+                for file_path, status in inventory.update(self.targets, self.font_awesome_code, self.js_code,
+                                                          self.settings["workers"], self.settings["executor"],
+                                                          large_file_threshold=large_file_threshold(self.settings),
+                                                          control=self.control):
+                    checked += 1
+                    now = time.monotonic()
+                    if now - last_emit >= self.emit_interval:
+                        self.progress_updated.emit(checked)
+                        last_emit = now
+                summary = inventory.summary()
         except Exception as e:
-            print(f"Error injecting content {file_path}: {e}")
-            return False
+            print(f"Error updating inventory: {e}")
+            self.error = str(e)
+        self.progress_updated.emit(checked)
+        self.scan_completed.emit(summary)
 
-    def _delete_content(self, content, file_path):
-        try:
+class InventoryDialog(QDialog):
+    # 页面清单：扫描当前文件列表，按版本号与已引入的代码筛选页面，结果可直接交给处理线程
+    process_requested = Signal(list)
+    filters = ("outdated", "version", "missing_js", "missing_font_awesome", "missing_body", "duplicates", "failed")
+    
+    def __init__(self, texts, targets, font_awesome_code, js_code, settings, config_path, parent=None):
+        super().__init__(parent)
+        self.texts = texts
+        self.targets = targets
+        self.font_awesome_code = font_awesome_code
+        self.js_code = js_code
+        self.settings = settings
+        self.config_path = config_path
+        self.inventory_path = inventory_path_for(config_path)
+        self.scan_thread = None
+        self.matches = []
+        self.setWindowTitle(texts["inventory_title"])
+        self.resize(800, 600)
+        
+        layout = QVBoxLayout(self)
+        self.summary_edit = QPlainTextEdit()
+        self.summary_edit.setReadOnly(True)
+        self.summary_edit.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        layout.addWidget(self.summary_edit)
+        
+        scan_layout = QHBoxLayout()
+        self.scan_label = QLabel()
+        scan_layout.addWidget(self.scan_label, 1)
+        self.scan_btn = QPushButton(texts["inventory_scan_btn"])
+        self.scan_btn.clicked.connect(self.start_scan)
+        scan_layout.addWidget(self.scan_btn)
+        layout.addLayout(scan_layout)
+        
+        query_layout = QHBoxLayout()
+        self.filter_combobox = QComboBox()
+        self.filter_combobox.addItems([texts["inventory_filter_labels"][key] for key in self.filters])
+        query_layout.addWidget(self.filter_combobox, 1)
+        self.version_edit = QLineEdit()
+        self.version_edit.setPlaceholderText(texts["inventory_version_placeholder"])
+        query_layout.addWidget(self.version_edit, 1)
+        self.query_btn = QPushButton(texts["inventory_query_btn"])
+        self.query_btn.clicked.connect(self.run_query)
+        query_layout.addWidget(self.query_btn)
+        layout.addLayout(query_layout)
+        
+        self.result_label = QLabel()
+        layout.addWidget(self.result_label)
+        self.result_edit = QPlainTextEdit()
+        self.result_edit.setReadOnly(True)
+        self.result_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        layout.addWidget(self.result_edit, 2)
+        
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        self.process_btn = QPushButton(texts["inventory_process_btn"])
+        self.process_btn.setEnabled(False)
+        self.process_btn.clicked.connect(lambda: self.process_requested.emit(list(self.matches)))
+        button_layout.addWidget(self.process_btn)
+        close_btn = QPushButton(texts["close_btn"])
+        close_btn.clicked.connect(self.reject)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+        
+        self.show_summary()
+    
+    def show_summary(self, summary=None):
+        texts = self.texts
+        if summary is None:
+            if not os.path.exists(self.inventory_path):
+                self.summary_edit.setPlainText(texts["inventory_empty_msg"])
+                return
+            with Inventory(self.inventory_path) as inventory:
+                summary = inventory.summary()
+        updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["updated"])) if summary["updated"] else "-"
+        lines = [texts["inventory_summary_msg"].format(**dict(summary, updated=updated))]
+        if summary["versions"]:
+            lines.append(texts["inventory_versions_label"])
+            lines.extend(f"  {version or texts['inventory_no_version']:<12} {count}"
+                         for version, count in summary["versions"])
+        self.summary_edit.setPlainText('\n'.join(lines))
+    
+    def set_busy(self, busy):
+        for widget in (self.scan_btn, self.query_btn, self.process_btn):
+            widget.setEnabled(not busy)
+        if not busy:
+            self.process_btn.setEnabled(bool(self.matches))
+    
+    def start_scan(self):
+        self.scan_thread = InventoryThread(self.targets, self.font_awesome_code, self.js_code, self.settings,
+                                           self.config_path)
+        self.scan_thread.progress_updated.connect(
+            lambda checked: self.scan_label.setText(self.texts["inventory_scanning_msg"].format(checked)))
+        self.scan_thread.scan_completed.connect(self.on_scan_complete)
+        self.set_busy(True)
+        self.scan_thread.start()
+    
+    def on_scan_complete(self, summary):
+        if self.scan_thread is None:
+            return
+        self.scan_thread.wait()
+        error = self.scan_thread.error
+        self.scan_thread = None
+        self.set_busy(False)
+        self.scan_label.setText("")
+        if error:
+            QMessageBox.warning(self, self.texts["partial_fail_title"], error)
+        else:
+            self.show_summary(summary)
+    
+    def run_query(self):
+        texts = self.texts
+        key = self.filters[self.filter_combobox.currentIndex()]
+        value = self.version_edit.text().strip()
+        criteria = {}
+        if key == "outdated":
+            # 未填写版本号时与 CRCMenu.js 当前的内容版本比较
+            if not value:
+                try:
+                    value = resolve_version(self.settings, self.config_path)
+                except (ValueError, OSError) as e:
+                    QMessageBox.warning(self, texts["partial_fail_title"], str(e))
+                    return
+            if not value:
+                QMessageBox.information(self, texts["inventory_title"], texts["inventory_version_required_msg"])
+                return
+            criteria["other_version"] = value
+        elif key == "version":
+            criteria["version"] = value
+        elif key.startswith("missing_"):
+            criteria["missing"] = (key[len("missing_"):],)
+        else:
+            criteria[key] = True
+        if not os.path.exists(self.inventory_path):
+            QMessageBox.information(self, texts["inventory_title"], texts["inventory_empty_msg"])
+            return
+        with Inventory(self.inventory_path) as inventory:
+            self.matches = inventory.query(**criteria)
+        self.result_label.setText(texts["inventory_result_msg"].format(len(self.matches)))
+        self.result_edit.setPlainText('\n'.join(self.matches))
+        self.process_btn.setEnabled(bool(self.matches))
+    
+    def done(self, result):
+        # 扫描中关闭：在途文件完成后停止，已扫描的页面保留在清单中
+        if self.scan_thread is not None:
+            scan_thread, self.scan_thread = self.scan_thread, None
+            scan_thread.cancel()
+            scan_thread.wait()
+        super().done(result)
 
-            new_content = content
-            if self.font_awesome_code:
-                new_content = new_content.replace(self.font_awesome_code, '')
+class FileListModel(QAbstractListModel):
+    # 目标列表：文件路径为 str，目录根为 {"path", "rules"}；用集合索引去重，批量增删只发送一次信号
+    # 删除的不连续区间超过这一数量时整体重建列表，逐段删除每段都要移动一次列表并发送一对信号
+    max_remove_ranges = 8
 
-            if self.js_code:
-                new_content = new_content.replace(self.js_code, '')
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.targets = []
+        self.keys = set()
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
-            return True
-        except Exception as e:
-            print(f"Error deleting content {file_path}: {e}")
-            return False
+    @staticmethod
+    def target_key(target):
+        return ("root", target["path"]) if isinstance(target, dict) else target
+
+    @staticmethod
+    def display_text(target):
+        if isinstance(target, dict):
+            return f"{target['path']}  [{', '.join(target['rules'])}]"
+        return target
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.targets)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        target = self.targets[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.display_text(target)
+        if role == Qt.UserRole:
+            return target
+        return None
+
+    def add_targets(self, targets):
+        new_targets = []
+        for target in targets:
+            key = self.target_key(target)
+            if key not in self.keys:
+                self.keys.add(key)
+                new_targets.append(target)
+        if new_targets:
+            start = len(self.targets)
+            self.beginInsertRows(QModelIndex(), start, start + len(new_targets) - 1)
+            self.targets.extend(new_targets)
+            self.endInsertRows()
+        return len(new_targets)
+
+    def remove_rows(self, rows):
+        # 按连续区间删除，连续选中的大量条目只需一次 beginRemoveRows；区间很多时（如筛选后全选删除）一次重建
+        rows = sorted(set(rows))
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        if len(ranges) > self.max_remove_ranges:
+            removed = set(rows)
+            self.beginResetModel()
+            for row in rows:
+                self.keys.discard(self.target_key(self.targets[row]))
+            self.targets = [target for row, target in enumerate(self.targets) if row not in removed]
+            self.endResetModel()
+            return
+        # 从后往前删除，前面区间的行号不受影响
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for target in self.targets[first:last + 1]:
+                self.keys.discard(self.target_key(target))
+            del self.targets[first:last + 1]
+            self.endRemoveRows()
+
+    def set_targets(self, targets):
+        self.beginResetModel()
+        self.targets = []
+        self.keys = set()
+        for target in targets:
+            key = self.target_key(target)
+            if key not in self.keys:
+                self.keys.add(key)
+                self.targets.append(target)
+        self.endResetModel()
+
+    def apply_diff(self, targets):
+        # 只删除不再存在的条目并追加新条目，未变化的行保持不动（包括选中状态）
+        new_keys = {self.target_key(target) for target in targets}
+        self.remove_rows([row for row, target in enumerate(self.targets) if self.target_key(target) not in new_keys])
+        self.add_targets(targets)
+
+    def split_targets(self):
+        file_list = []
+        roots = []
+        for target in self.targets:
+            if isinstance(target, dict):
+                roots.append(target)
+            else:
+                file_list.append(target)
+        return file_list, roots
 
 class CRCMenuManager(QMainWindow):
     def __init__(self):
         super().__init__()
         
-        self.file_list_path = "CRCMenu-Manager_file_list.json"
+        self.file_list_path = DEFAULT_CONFIG_PATH
         self.language = "zh"
         self.font_awesome_code = ''
         self.js_code = ''
-        self.last_json_mtime = 0
+        self.settings = {key: DEFAULT_CONFIG[key] for key in SETTING_KEYS}
+        self.file_list_txt_path = file_list_path_for(self.file_list_path)
+        # 最近一次加载时配置文件和列表文件的 mtime_ns
+        self.loaded_mtimes = {}
+        # 目录根随配置一起保存；文件列表只在变化后才交给后台写入
+        self.roots = []
+        self.files_dirty = False
         
-        self.is_saving = False
         self.is_loading = False
-        self.pending_save = False
+        self.config_writer = ConfigWriter(self.file_list_path)
         
         self.save_timer = QTimer(self)
         self.save_timer.setInterval(500)
@@ -134,6 +605,54 @@ class CRCMenuManager(QMainWindow):
                 "title": "CRCMenu 管理工具",
                 "file_list_label": "已选择的文件：",
                 "add_file_btn": "选择文件",
+                "add_dir_btn": "添加目录",
+                "watch_btn": "开始监视",
+                "stop_watch_btn": "停止监视",
+                "watching_msg": "正在监视文件变化，变化的文件将自动{}",
+                "watch_stopped_msg": "已停止监视",
+                "stats_msg": "{files} 个文件 · {files_per_second:.0f} 个/秒 · {mb_per_second:.1f} MB/秒 · 失败 {failed}",
+                "report_saved_msg": "运行报告已保存：{}",
+                "preview_btn": "预览更改",
+                "preview_title": "预览更改",
+                "preview_running_msg": "正在计算更改...",
+                "preview_summary_msg": "将修改 {changed} 个文件 · 无变化 {unchanged} 个 · 将失败 {failed} 个",
+                "preview_truncated_msg": "…… 差异过多，此处只显示前一部分，完整内容请保存补丁后查看",
+                "preview_empty_msg": "没有文件会被修改",
+                "save_patch_btn": "保存补丁",
+                "close_btn": "关闭",
+                "inventory_btn": "页面清单",
+                "inventory_title": "页面清单",
+                "inventory_scan_btn": "更新清单",
+                "inventory_scanning_msg": "正在扫描：已检查 {} 个文件",
+                "inventory_empty_msg": "尚未建立页面清单，点击“更新清单”扫描当前文件列表（只读取，不修改文件）",
+                "inventory_summary_msg": "共 {pages} 个页面（更新于 {updated}），{failed} 个无法读取\n缺少 JS 代码：{missing[js]} · 缺少 Font Awesome：{missing[font_awesome]} · 缺少 </head>：{missing[head]} · 缺少 </body>：{missing[body]}\n重复引入 CRCMenu.js：{duplicates}",
+                "inventory_versions_label": "CRCMenu.js 版本号（页面数）：",
+                "inventory_no_version": "(无版本号)",
+                "inventory_filter_labels": {
+                    "outdated": "引用了其他版本号的页面",
+                    "version": "引用了指定版本号的页面",
+                    "missing_js": "缺少 JS 代码的页面",
+                    "missing_font_awesome": "缺少 Font Awesome 的页面",
+                    "missing_body": "缺少 </body> 的页面",
+                    "duplicates": "重复引入 CRCMenu.js 的页面",
+                    "failed": "无法读取的页面"
+                },
+                "inventory_version_placeholder": "版本号（留空：当前内容版本 / 无版本号）",
+                "inventory_version_required_msg": "请输入版本号，或在配置中启用基于内容的版本号（\"version_source\": \"content\"）",
+                "inventory_query_btn": "查询",
+                "inventory_result_msg": "{} 个页面符合条件",
+                "inventory_process_btn": "处理这些页面",
+                "inventory_busy_msg": "请等待当前操作完成",
+                "pause_btn": "暂停",
+                "resume_btn": "继续",
+                "cancel_btn": "取消",
+                "paused_msg": "已暂停，正在处理的文件完成后停止",
+                "cancelling_msg": "正在取消，等待正在处理的文件完成...",
+                "cancelled_msg": "操作已取消。已完成的文件已记录，下次执行时可以只处理剩余的文件。",
+                "cancelled_no_journal_msg": "操作已取消。",
+                "resume_title": "继续上次运行",
+                "resume_run_msg": "上次运行（{0}，{1}）未完成，已完成 {2} 个文件。\n是否只处理剩余的文件？\n选择“否”将开始新的运行。",
+                "filter_placeholder": "筛选文件列表…",
                 "remove_file_btn": "移除选中文件",
                 "clear_files_btn": "清空文件列表",
                 "execute_btn": "执行操作",
@@ -148,6 +667,7 @@ class CRCMenuManager(QMainWindow):
                 "file_processed_msg": "处理 {}：{}",
                 "success_status": "成功",
                 "fail_status": "失败",
+                "unchanged_status": "无变化",
                 "toggle_lang_btn": "Switch to English",
                 "confirm_title": "确认操作",
                 "complete_title": "完成",
@@ -157,16 +677,74 @@ class CRCMenuManager(QMainWindow):
                 "js_code_label": "JS 引入代码（必填）：",
                 "save_success_msg": "配置已保存",
                 "invalid_config_msg": "配置文件格式不正确，已重置",
+                "confirm_roots_msg": "\n另有 {} 个目录，将在处理过程中扫描。",
+                "confirm_pipeline_msg": "确定要对 {0} 个文件依次执行：{1} 吗？\n每个文件只读写一次，操作前会自动创建备份文件。",
+                "pipeline_error_msg": "组合操作配置无效：{}\n请在“组合操作步骤”中按顺序每行填写一个操作。",
+                "pipeline_steps_label": "组合操作步骤（按顺序每行一个：update、inject、delete，或带独立代码的 JSON 对象）：",
+                "pipeline_steps_placeholder": "{\"op\": \"delete\", \"js_code\": \"<script src=\\\"/cdn/CRCMenu.js?v=8\\\"></script>\"}\ninject\nupdate",
+                "pipeline_steps_msg": "执行顺序：{}",
+                "asset_versions_label": "同时更新版本号的资源（每行一个文件名，可用 = 指定版本号，未指定时使用本次运行的版本号）：",
+                "asset_versions_placeholder": "CRCMenu.css\nall.min.css=6.5.1",
+                "asset_error_msg": "资源版本配置无效：{}\n文件名不能包含路径、空格或引号，版本号不能包含空格或引号。",
                 "mode_labels": {
                     "update": "更新JS版本",
                     "inject": "注入内容",
-                    "delete": "删除内容"
+                    "delete": "删除内容",
+                    "pipeline": "组合操作（按步骤顺序）"
                 }
             },
             "en": {
                 "title": "CRCMenu Manager",
                 "file_list_label": "Selected Files:",
                 "add_file_btn": "Select Files",
+                "add_dir_btn": "Add Directory",
+                "watch_btn": "Start Watching",
+                "stop_watch_btn": "Stop Watching",
+                "watching_msg": "Watching for changes, changed files will be processed with: {}",
+                "watch_stopped_msg": "Stopped watching",
+                "stats_msg": "{files} files · {files_per_second:.0f} files/s · {mb_per_second:.1f} MB/s · {failed} failed",
+                "report_saved_msg": "Run report saved: {}",
+                "preview_btn": "Preview Changes",
+                "preview_title": "Preview Changes",
+                "preview_running_msg": "Computing changes...",
+                "preview_summary_msg": "{changed} files would change · {unchanged} unchanged · {failed} would fail",
+                "preview_truncated_msg": "... Too many changes to show here, save the patch to see all of them",
+                "preview_empty_msg": "No files would change",
+                "save_patch_btn": "Save Patch",
+                "close_btn": "Close",
+                "inventory_btn": "Page Inventory",
+                "inventory_title": "Page Inventory",
+                "inventory_scan_btn": "Update Index",
+                "inventory_scanning_msg": "Scanning: {} files checked",
+                "inventory_empty_msg": "No inventory yet, click \"Update Index\" to scan the current file list (files are only read, never modified)",
+                "inventory_summary_msg": "{pages} pages (updated {updated}), {failed} could not be read\nMissing JS code: {missing[js]} · missing Font Awesome: {missing[font_awesome]} · missing </head>: {missing[head]} · missing </body>: {missing[body]}\nLoading CRCMenu.js more than once: {duplicates}",
+                "inventory_versions_label": "CRCMenu.js versions (pages):",
+                "inventory_no_version": "(none)",
+                "inventory_filter_labels": {
+                    "outdated": "Pages loading another version",
+                    "version": "Pages loading this version",
+                    "missing_js": "Pages without the JS code",
+                    "missing_font_awesome": "Pages without Font Awesome",
+                    "missing_body": "Pages without </body>",
+                    "duplicates": "Pages loading CRCMenu.js more than once",
+                    "failed": "Pages that could not be read"
+                },
+                "inventory_version_placeholder": "Version (empty: current content version / no version)",
+                "inventory_version_required_msg": "Enter a version, or enable content-based versions in the configuration (\"version_source\": \"content\")",
+                "inventory_query_btn": "Query",
+                "inventory_result_msg": "{} pages match",
+                "inventory_process_btn": "Process Matches",
+                "inventory_busy_msg": "Please wait for the current operation to finish",
+                "pause_btn": "Pause",
+                "resume_btn": "Resume",
+                "cancel_btn": "Cancel",
+                "paused_msg": "Paused, stopping after the files in progress",
+                "cancelling_msg": "Cancelling, waiting for the files in progress...",
+                "cancelled_msg": "Operation cancelled. Completed files have been recorded, the next run can process only the remaining files.",
+                "cancelled_no_journal_msg": "Operation cancelled.",
+                "resume_title": "Resume Previous Run",
+                "resume_run_msg": "The previous run ({0}, {1}) did not finish, {2} files are done.\nProcess only the remaining files?\nChoose \"No\" to start a new run.",
+                "filter_placeholder": "Filter file list…",
                 "remove_file_btn": "Remove Selected Files",
                 "clear_files_btn": "Clear File List",
                 "execute_btn": "Execute Operation",
@@ -181,6 +759,7 @@ class CRCMenuManager(QMainWindow):
                 "file_processed_msg": "Processing {}: {}",
                 "success_status": "Success",
                 "fail_status": "Failed",
+                "unchanged_status": "Unchanged",
                 "toggle_lang_btn": "切换到中文",
                 "confirm_title": "Confirm Operation",
                 "complete_title": "Completed",
@@ -190,17 +769,26 @@ class CRCMenuManager(QMainWindow):
                 "js_code_label": "JS Include Code (Required):",
                 "save_success_msg": "Configuration saved",
                 "invalid_config_msg": "Invalid configuration format, resetting",
+                "confirm_roots_msg": "\nPlus {} directories, scanned while processing.",
+                "confirm_pipeline_msg": "Are you sure you want to apply {1} to {0} files?\nEach file is read and written once. Backup files will be created automatically.",
+                "pipeline_error_msg": "Invalid pipeline configuration: {}\nList the operations in order, one per line, under \"Pipeline Steps\".",
+                "pipeline_steps_label": "Pipeline Steps (in order, one per line: update, inject, delete, or a JSON object with its own codes):",
+                "pipeline_steps_placeholder": "{\"op\": \"delete\", \"js_code\": \"<script src=\\\"/cdn/CRCMenu.js?v=8\\\"></script>\"}\ninject\nupdate",
+                "pipeline_steps_msg": "Order: {}",
+                "asset_versions_label": "Also update the version of these assets (one file name per line, optionally =version; defaults to the run's version):",
+                "asset_versions_placeholder": "CRCMenu.css\nall.min.css=6.5.1",
+                "asset_error_msg": "Invalid asset versions: {}\nFile names cannot contain paths, spaces or quotes, and versions cannot contain spaces or quotes.",
                 "mode_labels": {
                     "update": "Update JS Version",
                     "inject": "Inject Content",
-                    "delete": "Delete Content"
+                    "delete": "Delete Content",
+                    "pipeline": "Pipeline (Ordered Steps)"
                 }
             }
         }
         
         self.init_ui()
-        self.load_json()
-        self.load_file_list()
+        self.load_config_file()
         self.start_json_watcher()
         
         QTimer.singleShot(0, self.showMaximized)
@@ -252,7 +840,7 @@ class CRCMenuManager(QMainWindow):
                 color: #212121;
             }
         """)
-        self.font_awesome_edit.setText(self.font_awesome_code)
+        self.font_awesome_edit.setPlainText(self.font_awesome_code)
         self.font_awesome_edit.textChanged.connect(self.schedule_save)
         main_layout.addWidget(self.font_awesome_edit)
 
@@ -271,17 +859,88 @@ class CRCMenuManager(QMainWindow):
                 color: #212121;
             }
         """)
-        self.js_code_edit.setText(self.js_code)
+        self.js_code_edit.setPlainText(self.js_code)
         self.js_code_edit.textChanged.connect(self.schedule_save)
         main_layout.addWidget(self.js_code_edit)
 
+        # 资源版本表：只在更新版本号和组合模式下显示
+        self.asset_label = QLabel(self.texts[self.language]["asset_versions_label"])
+        self.asset_label.setStyleSheet("color: #555555; margin-bottom: 5px;")
+        self.asset_label.setWordWrap(True)
+        main_layout.addWidget(self.asset_label)
+        
+        self.asset_edit = QPlainTextEdit()
+        self.asset_edit.setStyleSheet("""
+            QPlainTextEdit {
+                background-color: #ffffff;
+                border: 1px solid #d0d0d0;
+                border-radius: 5px;
+                padding: 5px;
+                color: #212121;
+            }
+        """)
+        self.asset_edit.setPlaceholderText(self.texts[self.language]["asset_versions_placeholder"])
+        self.asset_edit.setMaximumHeight(80)
+        self.asset_edit.setPlainText(format_assets(self.settings["assets"]))
+        self.asset_edit.textChanged.connect(self.schedule_save)
+        main_layout.addWidget(self.asset_edit)
+
+        # 组合操作步骤：只在组合模式下显示，编辑时即时校验并显示执行顺序
+        self.pipeline_label = QLabel(self.texts[self.language]["pipeline_steps_label"])
+        self.pipeline_label.setStyleSheet("color: #555555; margin-bottom: 5px;")
+        self.pipeline_label.setWordWrap(True)
+        main_layout.addWidget(self.pipeline_label)
+        
+        self.pipeline_edit = QPlainTextEdit()
+        self.pipeline_edit.setStyleSheet("""
+            QPlainTextEdit {
+                background-color: #ffffff;
+                border: 1px solid #d0d0d0;
+                border-radius: 5px;
+                padding: 5px;
+                color: #212121;
+            }
+        """)
+        self.pipeline_edit.setPlaceholderText(self.texts[self.language]["pipeline_steps_placeholder"])
+        self.pipeline_edit.setMaximumHeight(80)
+        self.pipeline_edit.setPlainText(format_pipeline(self.settings["pipeline"]))
+        self.pipeline_edit.textChanged.connect(self.schedule_save)
+        main_layout.addWidget(self.pipeline_edit)
+        
+        self.pipeline_status_label = QLabel()
+        self.pipeline_status_label.setWordWrap(True)
+        main_layout.addWidget(self.pipeline_status_label)
+
         self.list_label = QLabel(self.texts[self.language]["file_list_label"])
         self.list_label.setStyleSheet("color: #555555; margin-bottom: 5px;")
         main_layout.addWidget(self.list_label)
         
-        self.file_list_widget = QListWidget()
-        self.file_list_widget.setStyleSheet("""
-            QListWidget {
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText(self.texts[self.language]["filter_placeholder"])
+        self.filter_edit.setStyleSheet("""
+            QLineEdit {
+                background-color: #ffffff;
+                border: 1px solid #d0d0d0;
+                border-radius: 5px;
+                padding: 5px;
+                color: #212121;
+            }
+        """)
+        main_layout.addWidget(self.filter_edit)
+        
+        # 模型/视图结构：只绘制可见行，筛选由代理模型完成，不重建列表
+        self.file_model = FileListModel(self)
+        self.file_proxy = QSortFilterProxyModel(self)
+        self.file_proxy.setSourceModel(self.file_model)
+        self.file_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.filter_edit.textChanged.connect(self.file_proxy.setFilterFixedString)
+        
+        self.file_list_view = QListView()
+        self.file_list_view.setModel(self.file_proxy)
+        self.file_list_view.setUniformItemSizes(True)
+        self.file_list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.file_list_view.setStyleSheet("""
+            QListView {
                 background-color: #ffffff;
                 border: 1px solid #d0d0d0;
                 border-radius: 5px;
@@ -289,26 +948,26 @@ class CRCMenuManager(QMainWindow):
                 color: #212121;
                 outline: none;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 8px;
                 border-radius: 3px;
                 margin: 2px 0;
                 background-color: transparent;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #0078d7;
                 color: #ffffff;
                 border: none;
                 outline: none;
             }
-            QListWidget::item:hover {
+            QListView::item:hover {
                 background-color: #f0f5ff;
             }
-            QListWidget::item:selected:hover {
+            QListView::item:selected:hover {
                 background-color: #006ab3;
             }
         """)
-        main_layout.addWidget(self.file_list_widget)
+        main_layout.addWidget(self.file_list_view)
 
         button_layout = QHBoxLayout()
         button_layout.setSpacing(10)
@@ -318,6 +977,11 @@ class CRCMenuManager(QMainWindow):
         self.style_button(self.add_file_btn)
         button_layout.addWidget(self.add_file_btn)
         
+        self.add_dir_btn = QPushButton(self.texts[self.language]["add_dir_btn"])
+        self.add_dir_btn.clicked.connect(self.select_directory)
+        self.style_button(self.add_dir_btn)
+        button_layout.addWidget(self.add_dir_btn)
+        
         self.remove_file_btn = QPushButton(self.texts[self.language]["remove_file_btn"])
         self.remove_file_btn.clicked.connect(self.remove_selected_files)
         self.style_button(self.remove_file_btn)
@@ -358,6 +1022,43 @@ class CRCMenuManager(QMainWindow):
             }
         """)
         main_layout.addWidget(self.execute_btn)
+        
+        # 运行中可用：暂停/继续与取消都在文件之间生效
+        run_control_layout = QHBoxLayout()
+        self.preview_btn = QPushButton(self.texts[self.language]["preview_btn"])
+        self.preview_btn.clicked.connect(self.preview_changes)
+        self.style_button(self.preview_btn)
+        run_control_layout.addWidget(self.preview_btn)
+        
+        self.pause_btn = QPushButton(self.texts[self.language]["pause_btn"])
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.style_button(self.pause_btn)
+        self.pause_btn.setEnabled(False)
+        run_control_layout.addWidget(self.pause_btn)
+        
+        self.cancel_btn = QPushButton(self.texts[self.language]["cancel_btn"])
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        self.style_button(self.cancel_btn)
+        self.cancel_btn.setEnabled(False)
+        run_control_layout.addWidget(self.cancel_btn)
+        main_layout.addLayout(run_control_layout)
+        self.process_thread = None
+        self.diff_viewer = None
+        
+        tools_layout = QHBoxLayout()
+        self.watch_btn = QPushButton(self.texts[self.language]["watch_btn"])
+        self.watch_btn.clicked.connect(self.toggle_watch)
+        self.style_button(self.watch_btn)
+        tools_layout.addWidget(self.watch_btn)
+        self.watch_thread = None
+        
+        self.inventory_btn = QPushButton(self.texts[self.language]["inventory_btn"])
+        self.inventory_btn.clicked.connect(self.open_inventory)
+        self.style_button(self.inventory_btn)
+        tools_layout.addWidget(self.inventory_btn)
+        main_layout.addLayout(tools_layout)
+        self.inventory_dialog = None
+        self.report_path = None
 
         self.statusBar = QStatusBar()
         self.statusBar.setStyleSheet("""
@@ -384,6 +1085,9 @@ class CRCMenuManager(QMainWindow):
                 border-radius: 3px;
             }
         """)
+        self.stats_label = QLabel()
+        self.stats_label.setStyleSheet("color: #555555; padding: 0 8px;")
+        self.statusBar.addPermanentWidget(self.stats_label)
         self.statusBar.addPermanentWidget(self.progress_bar, 1)
         
         self.update_input_labels()
@@ -395,11 +1099,12 @@ class CRCMenuManager(QMainWindow):
         self.mode_combobox.addItems([
             mode_labels["update"],
             mode_labels["inject"],
-            mode_labels["delete"]
+            mode_labels["delete"],
+            mode_labels["pipeline"]
         ])
         reverse_map = {v: k for k, v in mode_labels.items()}
         if current_mode in reverse_map.values():
-            for i in range(3):
+            for i in range(self.mode_combobox.count()):
                 if reverse_map.get(self.mode_combobox.itemText(i)) == current_mode:
                     self.mode_combobox.setCurrentIndex(i)
                     break
@@ -419,12 +1124,14 @@ class CRCMenuManager(QMainWindow):
             "font_awesome": {
                 "update": "Font Awesome 引入代码（选填）：",
                 "inject": "Font Awesome 引入代码（选填）：",
-                "delete": "要删除的 Font Awesome 代码（选填）："
+                "delete": "要删除的 Font Awesome 代码（选填）：",
+                "pipeline": "Font Awesome 代码（选填，未单独配置的步骤使用）："
             },
             "js": {
                 "update": "JS 引入代码（必填）：",
                 "inject": "JS 引入代码（必填）：",
-                "delete": "要删除的 JS 代码（必填）："
+                "delete": "要删除的 JS 代码（必填）：",
+                "pipeline": "JS 代码（未单独配置的步骤使用）："
             }
         }
         
@@ -433,12 +1140,14 @@ class CRCMenuManager(QMainWindow):
                 "font_awesome": {
                     "update": "Font Awesome Include Code (Optional):",
                     "inject": "Font Awesome Include Code (Optional):",
-                    "delete": "Font Awesome Code to Delete (Optional):"
+                    "delete": "Font Awesome Code to Delete (Optional):",
+                    "pipeline": "Font Awesome Code (Optional, used by steps without their own):"
                 },
                 "js": {
                     "update": "JS Include Code (Required):",
                     "inject": "JS Include Code (Required):",
-                    "delete": "JS Code to Delete (Required):"
+                    "delete": "JS Code to Delete (Required):",
+                    "pipeline": "JS Code (used by steps without their own):"
                 }
             }
             return en_labels[code_type][mode]
@@ -448,6 +1157,42 @@ class CRCMenuManager(QMainWindow):
     def update_input_labels(self):
         self.font_awesome_label.setText(self.get_mode_specific_label("font_awesome"))
         self.js_code_label.setText(self.get_mode_specific_label("js"))
+        self.asset_label.setText(self.texts[self.language]["asset_versions_label"])
+        self.asset_edit.setPlaceholderText(self.texts[self.language]["asset_versions_placeholder"])
+        uses_versions = self.get_current_mode() in ("update", PIPELINE_MODE)
+        self.asset_label.setVisible(uses_versions)
+        self.asset_edit.setVisible(uses_versions)
+        self.pipeline_label.setText(self.texts[self.language]["pipeline_steps_label"])
+        self.pipeline_edit.setPlaceholderText(self.texts[self.language]["pipeline_steps_placeholder"])
+        uses_pipeline = self.get_current_mode() == PIPELINE_MODE
+        self.pipeline_label.setVisible(uses_pipeline)
+        self.pipeline_edit.setVisible(uses_pipeline)
+        self.pipeline_status_label.setVisible(uses_pipeline)
+        self.update_pipeline_status()
+    
+    def check_pipeline(self):
+        # 按输入框中的步骤校验组合操作，返回规范化后的步骤；无效时抛出 ValueError
+        pipeline = normalize_pipeline(parse_pipeline(self.pipeline_edit.toPlainText().splitlines()),
+                                      self.font_awesome_code, self.js_code)
+        if not pipeline:
+            raise ValueError("[]")
+        return pipeline
+    
+    def format_steps(self, pipeline):
+        mode_labels = self.texts[self.language]["mode_labels"]
+        return " → ".join(mode_labels[step["op"]] for step in pipeline)
+    
+    def update_pipeline_status(self):
+        if not self.pipeline_edit.toPlainText().strip():
+            self.pipeline_status_label.clear()
+            return
+        try:
+            text = self.texts[self.language]["pipeline_steps_msg"].format(self.format_steps(self.check_pipeline()))
+            self.pipeline_status_label.setStyleSheet("color: #555555;")
+        except ValueError as e:
+            text = str(e)
+            self.pipeline_status_label.setStyleSheet("color: #c62828;")
+        self.pipeline_status_label.setText(text)
     
     def style_button(self, button):
         button.setStyleSheet("""
@@ -465,6 +1210,9 @@ class CRCMenuManager(QMainWindow):
             QPushButton:pressed {
                 background-color: #b0b0b0;
             }
+            QPushButton:disabled {
+                color: #9e9e9e;
+            }
         """)
         button.clicked.connect(lambda: self.animate_button(button))
     
@@ -498,20 +1246,33 @@ class CRCMenuManager(QMainWindow):
         self.title_label.setText(self.texts[self.language]["title"])
         self.list_label.setText(self.texts[self.language]["file_list_label"])
         self.add_file_btn.setText(self.texts[self.language]["add_file_btn"])
+        self.add_dir_btn.setText(self.texts[self.language]["add_dir_btn"])
+        self.filter_edit.setPlaceholderText(self.texts[self.language]["filter_placeholder"])
         self.remove_file_btn.setText(self.texts[self.language]["remove_file_btn"])
         self.clear_files_btn.setText(self.texts[self.language]["clear_files_btn"])
         self.execute_btn.setText(self.texts[self.language]["execute_btn"])
+        self.preview_btn.setText(self.texts[self.language]["preview_btn"])
+        paused = self.process_thread is not None and self.process_thread.control.paused
+        self.pause_btn.setText(self.texts[self.language]["resume_btn" if paused else "pause_btn"])
+        self.cancel_btn.setText(self.texts[self.language]["cancel_btn"])
+        self.watch_btn.setText(self.texts[self.language]["stop_watch_btn" if self.watch_thread else "watch_btn"])
+        self.inventory_btn.setText(self.texts[self.language]["inventory_btn"])
         self.toggle_lang_btn.setText(self.texts[self.language]["toggle_lang_btn"])
     
-    def schedule_save(self):
+    def schedule_save(self, files_changed=False):
         self.font_awesome_code = self.font_awesome_edit.toPlainText().strip()
         self.js_code = self.js_code_edit.toPlainText().strip()
+        self.settings["assets"] = parse_assets(self.asset_edit.toPlainText().splitlines())
+        # 步骤中的 JSON 尚未写完时保留上一次有效的步骤，执行前会再次校验输入框中的内容
+        try:
+            self.settings["pipeline"] = parse_pipeline(self.pipeline_edit.toPlainText().splitlines())
+        except ValueError:
+            pass
+        self.update_pipeline_status()
+        self.files_dirty = self.files_dirty or files_changed
         
-        if self.is_saving:
-            self.pending_save = True
-        else:
-            if not self.save_timer.isActive():
-                self.save_timer.start()
+        if not self.save_timer.isActive():
+            self.save_timer.start()
     
     def perform_save(self):
         self.save_timer.stop()
@@ -519,48 +1280,77 @@ class CRCMenuManager(QMainWindow):
         if self.is_loading:
             self.schedule_save()
             return
-            
-        self.is_saving = True
         
-        try:
-            data = {
-                "files": [self.file_list_widget.item(i).text() for i in range(self.file_list_widget.count())],
-                "font_awesome_code": self.font_awesome_code,
-                "js_code": self.js_code
-            }
-            
-            with open(self.file_list_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4)
-            
-            self.last_json_mtime = os.path.getmtime(self.file_list_path)
-            self.statusBar.showMessage(self.texts[self.language]["save_success_msg"], 2000)
-            
-        except Exception as e:
-            print(f"保存配置文件出错: {e}")
-        finally:
-            self.is_saving = False
-            if self.pending_save:
-                self.pending_save = False
-                self.perform_save()
+        # 序列化和写盘都在后台线程完成；只修改代码时不会复制文件列表
+        file_list = None
+        if self.files_dirty:
+            file_list, self.roots = self.file_model.split_targets()
+            self.files_dirty = False
+        data = {
+            "roots": self.roots,
+            "font_awesome_code": self.font_awesome_code,
+            "js_code": self.js_code
+        }
+        data.update(self.settings)
+        self.config_writer.submit(data, file_list)
+        self.statusBar.showMessage(self.texts[self.language]["save_success_msg"], 2000)
     
-    def load_json(self):
+    def config_mtimes(self):
+        mtimes = {}
+        for path in (self.file_list_path, self.file_list_txt_path):
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+    
+    def load_config_file(self):
+        # 配置只解析一次：代码、设置和文件列表都来自同一次读取，列表按差异更新
         self.is_loading = True
         
         try:
+            self.loaded_mtimes = self.config_mtimes()
             if os.path.exists(self.file_list_path):
                 with open(self.file_list_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.font_awesome_code = data.get("font_awesome_code", '')
-                    self.js_code = data.get("js_code", '')
-
-                    self.font_awesome_edit.textChanged.disconnect()
-                    self.js_code_edit.textChanged.disconnect()
-                    
-                    self.font_awesome_edit.setText(self.font_awesome_code)
-                    self.js_code_edit.setText(self.js_code)
-                    
-                    self.font_awesome_edit.textChanged.connect(self.schedule_save)
-                    self.js_code_edit.textChanged.connect(self.schedule_save)
+                # 旧版配置中的文件列表在下次保存时迁移到单独的列表文件
+                legacy_files = "files" in data
+                if not legacy_files:
+                    data["files"] = load_file_list(self.file_list_path)
+                config = normalize_config(data)
+                
+                self.font_awesome_code = config["font_awesome_code"]
+                self.js_code = config["js_code"]
+                self.settings = {key: config[key] for key in SETTING_KEYS}
+                
+                self.font_awesome_edit.textChanged.disconnect()
+                self.js_code_edit.textChanged.disconnect()
+                self.asset_edit.textChanged.disconnect()
+                self.pipeline_edit.textChanged.disconnect()
+                
+                # 内容未变时不重设文本，避免打断正在进行的编辑
+                if self.font_awesome_edit.toPlainText().strip() != self.font_awesome_code:
+                    self.font_awesome_edit.setPlainText(self.font_awesome_code)
+                if self.js_code_edit.toPlainText().strip() != self.js_code:
+                    self.js_code_edit.setPlainText(self.js_code)
+                if parse_assets(self.asset_edit.toPlainText().splitlines()) != self.settings["assets"]:
+                    self.asset_edit.setPlainText(format_assets(self.settings["assets"]))
+                try:
+                    pipeline_changed = parse_pipeline(self.pipeline_edit.toPlainText().splitlines()) != self.settings["pipeline"]
+                except ValueError:
+                    pipeline_changed = True
+                if pipeline_changed:
+                    self.pipeline_edit.setPlainText(format_pipeline(self.settings["pipeline"]))
+                
+                self.font_awesome_edit.textChanged.connect(self.schedule_save)
+                self.js_code_edit.textChanged.connect(self.schedule_save)
+                self.asset_edit.textChanged.connect(self.schedule_save)
+                self.pipeline_edit.textChanged.connect(self.schedule_save)
+                self.update_pipeline_status()
+                
+                self.roots = [normalize_root(root) for root in config["roots"]]
+                self.file_model.apply_diff(config["files"] + self.roots)
+                self.files_dirty = self.files_dirty or legacy_files
         except Exception as e:
             print(f"加载配置文件出错: {e}")
             QMessageBox.warning(self, self.texts[self.language]["load_error_title"], 
@@ -568,134 +1358,376 @@ class CRCMenuManager(QMainWindow):
         finally:
             self.is_loading = False
     
-    def load_file_list(self):
-        if os.path.exists(self.file_list_path):
-            try:
-                with open(self.file_list_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    file_list = data.get("files", [])
-                    self.file_list_widget.clear()
-                    for file_path in file_list:
-                        self.file_list_widget.addItem(file_path)
-            except Exception as e:
-                QMessageBox.warning(self, self.texts[self.language]["load_error_title"], 
-                                  self.texts[self.language]["load_error_msg"].format(str(e)))
-    
     def select_files(self):
         file_paths, _ = QFileDialog.getOpenFileNames(
-            self, self.texts[self.language]["add_file_btn"], "", "HTML/PHP Files (*.html *.htm *.php);;All Files (*)"
+            self, self.texts[self.language]["add_file_btn"], "",
+            "HTML/PHP Files (*.html *.htm *.php);;"
+            "Archives (*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tbz2 *.tar.xz *.txz);;All Files (*)"
         )
         
-        for file_path in file_paths:
-            if file_path not in [self.file_list_widget.item(i).text() for i in range(self.file_list_widget.count())]:
-                self.file_list_widget.addItem(file_path)
+        self.file_model.add_targets(file_paths)
+        self.schedule_save(files_changed=True)
+    
+    def select_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, self.texts[self.language]["add_dir_btn"])
+        if not directory:
+            return
         
-        self.schedule_save()
+        self.file_model.add_targets([{"path": directory, "rules": list(DEFAULT_RULES)}])
+        self.schedule_save(files_changed=True)
     
     def remove_selected_files(self):
-        for item in self.file_list_widget.selectedItems():
-            self.file_list_widget.takeItem(self.file_list_widget.row(item))
-        
-        self.schedule_save()
+        rows = [self.file_proxy.mapToSource(index).row()
+                for index in self.file_list_view.selectionModel().selectedRows()]
+        self.file_model.remove_rows(rows)
+        self.schedule_save(files_changed=True)
     
     def clear_file_list(self):
-        self.file_list_widget.clear()
-        self.schedule_save()
+        self.file_model.set_targets([])
+        self.schedule_save(files_changed=True)
     
-    def process_files(self):
-        mode = self.get_current_mode()
-        file_count = self.file_list_widget.count()
-        
-        if file_count == 0:
+    def validate_operation(self, mode, file_list, roots):
+        # 返回组合操作的步骤说明；输入无效时提示并返回 None
+        if not file_list and not roots:
             QMessageBox.information(self, self.texts[self.language]["complete_title"], 
                                   self.texts[self.language]["no_files_msg"])
-            return
+            return None
 
         if (mode == "inject" or mode == "delete") and not self.js_code:
             QMessageBox.warning(self, self.texts[self.language]["partial_fail_title"], 
                               "请提供JS代码（必填）" if self.language == "zh" else 
                               "Please provide JS code (required)")
+            return None
+
+        if mode in ("update", PIPELINE_MODE):
+            try:
+                normalize_assets(self.settings["assets"])
+            except ValueError as e:
+                QMessageBox.warning(self, self.texts[self.language]["partial_fail_title"],
+                                  self.texts[self.language]["asset_error_msg"].format(str(e)))
+                return None
+
+        steps_text = ""
+        if mode == PIPELINE_MODE:
+            try:
+                steps_text = self.format_steps(self.check_pipeline())
+            except ValueError as e:
+                QMessageBox.warning(self, self.texts[self.language]["partial_fail_title"],
+                                  self.texts[self.language]["pipeline_error_msg"].format(str(e)))
+                return None
+        return steps_text
+    
+    def set_controls_enabled(self, enabled):
+        for widget in (self.execute_btn, self.preview_btn, self.add_file_btn, self.add_dir_btn, self.remove_file_btn,
+                       self.clear_files_btn, self.toggle_lang_btn, self.mode_combobox,
+                       self.font_awesome_edit, self.js_code_edit, self.asset_edit, self.pipeline_edit):
+            widget.setEnabled(enabled)
+    
+    def find_resumable_run(self):
+        # 最近一次运行被取消或中断（且未回滚）时返回其日志
+        if not self.settings["journal"]:
+            return None
+        try:
+            journal = find_journal(journal_dir_for(self.file_list_path))
+            if journal is None:
+                return None
+            state = journal.state()
+        except (OSError, ValueError) as e:
+            print(f"Error reading journal: {e}")
+            return None
+        if state["begin"] is None or journal_status(state) not in ("interrupted", "cancelled"):
+            return None
+        return journal, state
+    
+    def process_files(self):
+        resumable = self.find_resumable_run()
+        if resumable is not None:
+            journal, state = resumable
+            mode_label = self.texts[self.language]["mode_labels"].get(state["begin"].get("mode"), "?")
+            reply = QMessageBox.question(
+                self, self.texts[self.language]["resume_title"],
+                self.texts[self.language]["resume_run_msg"].format(journal.run_id, mode_label, len(state["done"])),
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes
+            )
+            if reply == QMessageBox.Cancel:
+                return
+            if reply == QMessageBox.Yes:
+                indeterminate = any(isinstance(target, dict) for target in state["begin"]["targets"])
+                self.start_processing(ProcessThread([], "", "", state["begin"]["mode"], self.settings,
+                                                    self.file_list_path, resume_journal=journal), indeterminate)
+                return
+        
+        file_list, roots = self.file_model.split_targets()
+        self.confirm_and_process(self.get_current_mode(), file_list, roots)
+    
+    def confirm_and_process(self, mode, file_list, roots):
+        file_count = len(file_list)
+        steps_text = self.validate_operation(mode, file_list, roots)
+        if steps_text is None:
             return
 
         confirm_msg_key = {
             "update": "confirm_update_msg",
             "inject": "confirm_inject_msg",
-            "delete": "confirm_delete_msg"
+            "delete": "confirm_delete_msg",
+            "pipeline": "confirm_pipeline_msg"
         }[mode]
         confirm_msg = self.texts[self.language][confirm_msg_key]
         reply = QMessageBox.question(
             self, self.texts[self.language]["confirm_title"], 
-            confirm_msg.format(file_count),
+            confirm_msg.format(file_count, steps_text) +
+            (self.texts[self.language]["confirm_roots_msg"].format(len(roots)) if roots else ""),
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
-            file_list = [self.file_list_widget.item(i).text() for i in range(file_count)]
-
-            self.process_thread = ProcessThread(
+            self.start_processing(ProcessThread(
                 file_list, 
                 self.font_awesome_code,
                 self.js_code,
-                mode
-            )
-            self.process_thread.progress_updated.connect(self.update_progress)
-            self.process_thread.file_processed.connect(self.on_file_processed)
-            self.process_thread.operation_completed.connect(self.on_operation_complete)
-
-            self.execute_btn.setEnabled(False)
-            self.add_file_btn.setEnabled(False)
-            self.remove_file_btn.setEnabled(False)
-            self.clear_files_btn.setEnabled(False)
-            self.toggle_lang_btn.setEnabled(False)
-            self.font_awesome_edit.setEnabled(False)
-            self.js_code_edit.setEnabled(False)
+                mode,
+                self.settings,
+                self.file_list_path,
+                roots
+            ), bool(roots))
+    
+    def open_inventory(self):
+        if self.inventory_dialog is not None:
+            self.inventory_dialog.raise_()
+            self.inventory_dialog.activateWindow()
+            return
+        file_list, roots = self.file_model.split_targets()
+        if not file_list and not roots:
+            QMessageBox.information(self, self.texts[self.language]["complete_title"],
+                                  self.texts[self.language]["no_files_msg"])
+            return
+        self.inventory_dialog = InventoryDialog(self.texts[self.language], file_list + roots, self.font_awesome_code,
+                                                self.js_code, self.settings, self.file_list_path, self)
+        self.inventory_dialog.process_requested.connect(self.process_matches)
+        self.inventory_dialog.finished.connect(self.on_inventory_closed)
+        self.inventory_dialog.show()
+    
+    def on_inventory_closed(self):
+        self.inventory_dialog = None
+    
+    def process_matches(self, file_list):
+        # 清单查询结果直接作为本次运行的文件列表，不改变已保存的列表
+        if self.process_thread is not None or self.watch_thread is not None:
+            QMessageBox.information(self, self.texts[self.language]["inventory_title"],
+                                  self.texts[self.language]["inventory_busy_msg"])
+            return
+        self.confirm_and_process(self.get_current_mode(), file_list, [])
+    
+    def preview_changes(self):
+        mode = self.get_current_mode()
+        file_list, roots = self.file_model.split_targets()
+        if self.validate_operation(mode, file_list, roots) is None:
+            return
+        
+        self.diff_viewer = DiffViewer(self.texts[self.language], self)
+        self.diff_viewer.finished.connect(self.on_preview_closed)
+        process_thread = ProcessThread(file_list, self.font_awesome_code, self.js_code, mode, self.settings,
+                                       self.file_list_path, roots, dry_run=True)
+        process_thread.diff_ready.connect(self.diff_viewer.append_diff)
+        process_thread.stats_updated.connect(self.diff_viewer.set_summary)
+        self.start_processing(process_thread, bool(roots), self.on_preview_complete)
+        self.diff_viewer.show()
+    
+    def on_preview_complete(self, all_success):
+        process_thread = self.process_thread
+        self.finish_processing()
+        if self.diff_viewer is not None:
+            self.diff_viewer.finish(process_thread.patch_path, process_thread.preview_truncated)
+        elif process_thread.patch_path:
+            os.remove(process_thread.patch_path)
+    
+    def on_preview_closed(self):
+        viewer = self.diff_viewer
+        self.diff_viewer = None
+        if viewer.patch_path is not None:
+            os.remove(viewer.patch_path)
+        elif self.process_thread is not None and self.process_thread.dry_run:
+            # 预演尚未完成就关闭查看器：取消剩余文件，临时补丁在完成时删除
+            self.cancel_processing()
+    
+    def start_processing(self, process_thread, indeterminate, on_complete=None):
+        self.process_thread = process_thread
+        self.process_thread.progress_updated.connect(self.update_progress)
+        self.process_thread.file_processed.connect(self.on_file_processed)
+        self.process_thread.stats_updated.connect(self.on_stats_updated)
+        self.process_thread.report_saved.connect(self.on_report_saved)
+        self.process_thread.operation_completed.connect(on_complete or self.on_operation_complete)
+
+        self.set_controls_enabled(False)
+        self.watch_btn.setEnabled(False)
+        self.pause_btn.setText(self.texts[self.language]["pause_btn"])
+        self.pause_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(True)
+        self.statusBar.showMessage(self.texts[self.language]["processing_msg"])
+        self.progress_bar.setValue(0)
+        if indeterminate:
+            self.progress_bar.setRange(0, 0)
+        
+        self.process_thread.start()
+    
+    def toggle_pause(self):
+        if self.process_thread is None:
+            return
+        if self.process_thread.control.paused:
+            self.process_thread.resume()
+            self.pause_btn.setText(self.texts[self.language]["pause_btn"])
             self.statusBar.showMessage(self.texts[self.language]["processing_msg"])
-            self.progress_bar.setValue(0)
-            
-            self.process_thread.start()
+        else:
+            self.process_thread.pause()
+            self.pause_btn.setText(self.texts[self.language]["resume_btn"])
+            self.statusBar.showMessage(self.texts[self.language]["paused_msg"])
+    
+    def cancel_processing(self):
+        if self.process_thread is None:
+            return
+        self.process_thread.cancel()
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.statusBar.showMessage(self.texts[self.language]["cancelling_msg"])
     
     def update_progress(self, value):
         self.progress_bar.setValue(value)
     
-    def on_file_processed(self, file_path, success):
-        status = self.texts[self.language]["success_status"] if success else self.texts[self.language]["fail_status"]
+    def on_file_processed(self, file_path, status_code):
+        status = self.texts[self.language][{
+            STATUS_SUCCESS: "success_status",
+            STATUS_UNCHANGED: "unchanged_status",
+            STATUS_FAILED: "fail_status"
+        }[status_code]]
         self.statusBar.showMessage(self.texts[self.language]["file_processed_msg"].format(os.path.basename(file_path), status))
     
+    def on_stats_updated(self, stats):
+        text = self.texts[self.language]["stats_msg"].format(**stats)
+        if stats["errors"]:
+            text += " (" + ", ".join(f"{category} {count}" for category, count in stats["errors"].items()) + ")"
+        self.stats_label.setText(text)
+    
+    def on_report_saved(self, report_path):
+        self.report_path = report_path
+    
+    def finish_processing(self):
+        cancelled = self.process_thread.control.cancelled
+        self.process_thread.wait()
+        self.process_thread = None
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.pause_btn.setText(self.texts[self.language]["pause_btn"])
+        self.set_controls_enabled(True)
+        self.watch_btn.setEnabled(True)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(100)
+        return cancelled
+    
     def on_operation_complete(self, all_success):
-        if all_success:
+        cancelled = self.finish_processing()
+        
+        report_text = ""
+        if self.report_path:
+            report_text = "\n" + self.texts[self.language]["report_saved_msg"].format(self.report_path)
+            self.report_path = None
+        if cancelled:
+            QMessageBox.information(self, self.texts[self.language]["complete_title"],
+                                  self.texts[self.language]["cancelled_msg" if self.settings["journal"]
+                                                            else "cancelled_no_journal_msg"] + report_text)
+        elif all_success:
             QMessageBox.information(self, self.texts[self.language]["complete_title"], 
-                                  self.texts[self.language]["success_msg"])
+                                  self.texts[self.language]["success_msg"] + report_text)
         else:
             QMessageBox.warning(self, self.texts[self.language]["partial_fail_title"], 
-                              self.texts[self.language]["partial_fail_msg"])
-
-        self.execute_btn.setEnabled(True)
-        self.add_file_btn.setEnabled(True)
-        self.remove_file_btn.setEnabled(True)
-        self.clear_files_btn.setEnabled(True)
-        self.toggle_lang_btn.setEnabled(True)
-        self.font_awesome_edit.setEnabled(True)
-        self.js_code_edit.setEnabled(True)
+                              self.texts[self.language]["partial_fail_msg"] + report_text)
         self.schedule_save()
+    
+    def toggle_watch(self):
+        if self.watch_thread is not None:
+            self.watch_btn.setEnabled(False)
+            self.watch_thread.stop()
+            return
+        
+        mode = self.get_current_mode()
+        file_list, roots = self.file_model.split_targets()
+        steps_text = self.validate_operation(mode, file_list, roots)
+        if steps_text is None:
+            return
+        
+        self.watch_thread = WatchThread(file_list, self.font_awesome_code, self.js_code, mode,
+                                        self.settings, self.file_list_path, roots)
+        self.watch_thread.file_processed.connect(self.on_file_processed)
+        self.watch_thread.operation_completed.connect(self.on_watch_stopped)
+        self.set_controls_enabled(False)
+        self.watch_btn.setText(self.texts[self.language]["stop_watch_btn"])
+        self.statusBar.showMessage(self.texts[self.language]["watching_msg"].format(
+            steps_text or self.texts[self.language]["mode_labels"][mode]))
+        self.watch_thread.start()
+    
+    def on_watch_stopped(self, all_success):
+        self.watch_thread.wait()
+        self.watch_thread = None
+        self.set_controls_enabled(True)
+        self.watch_btn.setEnabled(True)
+        self.watch_btn.setText(self.texts[self.language]["watch_btn"])
+        self.statusBar.showMessage(self.texts[self.language]["watch_stopped_msg"], 3000)
 
     def start_json_watcher(self):
-        self.json_watcher = QTimer(self)
-        self.json_watcher.timeout.connect(self.check_json_changes)
-        self.json_watcher.start(1000)
-
+        # 由文件系统事件触发，短时间内的多次事件合并为一次重新加载；
+        # 同时监视所在目录，原子替换后文件会被重新创建
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(300)
+        self.reload_timer.timeout.connect(self.check_json_changes)
+        
+        self.json_watcher = QFileSystemWatcher(self)
+        self.json_watcher.fileChanged.connect(self.on_config_path_changed)
+        self.json_watcher.directoryChanged.connect(self.on_config_path_changed)
+        self.watch_config_paths()
+    
+    def watch_config_paths(self):
+        directory = os.path.dirname(os.path.abspath(self.file_list_path))
+        watched = set(self.json_watcher.files() + self.json_watcher.directories())
+        for path in (directory, self.file_list_path, self.file_list_txt_path):
+            if path not in watched and os.path.exists(path):
+                self.json_watcher.addPath(path)
+    
+    def on_config_path_changed(self, path):
+        self.reload_timer.start()
+    
     def check_json_changes(self):
-        if self.is_saving or self.is_loading:
+        self.watch_config_paths()
+        if self.config_writer.busy() or self.is_loading:
+            self.reload_timer.start()
             return
-            
-        if os.path.exists(self.file_list_path):
-            mtime = os.path.getmtime(self.file_list_path)
-            if mtime != self.last_json_mtime:
-                print(f"检测到JSON文件变化，重新加载 (当前状态: 保存={self.is_saving}, 加载={self.is_loading})")
-                self.last_json_mtime = mtime
-                self.load_json()
-                self.load_file_list()
+        
+        mtimes = self.config_mtimes()
+        changed = [path for path, mtime in mtimes.items()
+                   if mtime != self.loaded_mtimes.get(path) and mtime != self.config_writer.written_mtimes.get(path)]
+        self.loaded_mtimes = mtimes
+        if changed:
+            print("检测到配置文件变化，重新加载")
+            self.load_config_file()
+
+    def closeEvent(self, event):
+        if self.process_thread is not None:
+            # 关闭窗口时在当前文件完成后停止，日志保留进度，下次可继续
+            self.process_thread.cancel()
+            self.process_thread.wait()
+            if self.process_thread.patch_path and os.path.exists(self.process_thread.patch_path):
+                os.remove(self.process_thread.patch_path)
+        if self.watch_thread is not None:
+            self.watch_thread.stop()
+            self.watch_thread.wait()
+        if self.inventory_dialog is not None:
+            self.inventory_dialog.reject()
+        if self.save_timer.isActive():
+            self.perform_save()
+        self.config_writer.close()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = CRCMenuManager()
     sys.exit(app.exec())
@@ -0,0 +1,210 @@
+import bz2
+import copy
+import gzip
+import io
+import lzma
+import os
+import shutil
+import struct
+import sys
+import tarfile
+import time
+import zipfile
+
+from crcmenu_scan import DEFAULT_RULES, Rules
+
+# 按文件名后缀识别的归档格式；tar 的压缩流单独打开，压缩级别与常用命令行工具的默认值一致
+ARCHIVE_FORMATS = (
+    (".zip", "zip"),
+    (".tar", "tar"),
+    (".tar.gz", "gz"),
+    (".tgz", "gz"),
+    (".tar.bz2", "bz2"),
+    (".tbz2", "bz2"),
+    (".tar.xz", "xz"),
+    (".txz", "xz"),
+)
+TAR_OPENERS = {
+    "tar": lambda path: open(path, 'wb'),
+    "gz": lambda path: gzip.open(path, 'wb', compresslevel=6),
+    "bz2": lambda path: bz2.open(path, 'wb'),
+    "xz": lambda path: lzma.open(path, 'wb'),
+}
+COPY_CHUNK_SIZE = 1024 * 1024
+# zip 本地文件头：文件名长度与扩展字段长度是最后两个字段
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+ZIP64_EXTRA_ID = 0x0001
+# 通用标志位 3：大小与 CRC 写在数据之后的数据描述符中
+DATA_DESCRIPTOR_FLAG = 0x08
+# 原样复制依赖 zipfile 的内部结构（ZipInfo.FileHeader、ZipFile.fp/filelist/NameToInfo/start_dir），
+# 只在验证过的 Python 版本上使用；其他版本解压后按原压缩方式重新写入
+RAW_COPY_VERSIONS = ((3, 8), (3, 13))
+
+
+def archive_format(path):
+    # 返回 ARCHIVE_FORMATS 中的格式名；不是归档时返回 None
+    lower = path.lower()
+    for suffix, name in ARCHIVE_FORMATS:
+        if lower.endswith(suffix):
+            return name
+    return None
+
+
+class ArchiveResult:
+    __slots__ = ("members", "changed", "failed")
+
+    def __init__(self):
+        # 经过 transform 的成员数、实际修改的成员数，以及无法处理、原样保留的成员名
+        self.members = 0
+        self.changed = 0
+        self.failed = []
+
+
+def rewrite_archive(source_path, target_path, transform, rules=DEFAULT_RULES, timestamp=None):
+    # 逐个读取匹配规则的成员交给 transform(name, data)，返回新的字节串；返回 None 表示该成员无法处理，
+    # 按原样保留并记录在结果中。target_path 为 None 时只读取不写出（预演）。
+    # 修改过的成员使用 timestamp 作为修改时间，其余成员与原归档一致
+    if not isinstance(rules, Rules):
+        rules = Rules(rules)
+    timestamp = time.time() if timestamp is None else timestamp
+    name = archive_format(source_path)
+    if name == "zip":
+        return _rewrite_zip(source_path, target_path, transform, rules, timestamp)
+    if name is None:
+        raise ValueError(f"Unsupported archive: {source_path}")
+    return _rewrite_tar(source_path, target_path, TAR_OPENERS[name], transform, rules, timestamp)
+
+
+def _apply(result, transform, member_name, data):
+    # 返回修改后的内容；没有修改或无法处理时返回 None
+    result.members += 1
+    new_data = transform(member_name, data)
+    if new_data is None:
+        result.failed.append(member_name)
+        return None
+    if new_data == data:
+        return None
+    result.changed += 1
+    return new_data
+
+
+def _rewrite_zip(source_path, target_path, transform, rules, timestamp):
+    result = ArchiveResult()
+    date_time = time.localtime(timestamp)[:6]
+    with zipfile.ZipFile(source_path) as source:
+        target = zipfile.ZipFile(target_path, 'w') if target_path else None
+        try:
+            if target is not None:
+                target.comment = source.comment
+            for info in source.infolist():
+                if not info.is_dir() and rules.match(info.filename):
+                    new_data = _apply(result, transform, info.filename, source.read(info))
+                    if new_data is not None:
+                        if target is not None:
+                            target.writestr(_zip_member(info, date_time), new_data)
+                        continue
+                if target is None:
+                    continue
+                if _raw_copy_supported(target):
+                    _copy_zip_member(source, target, info)
+                else:
+                    _recompress_zip_member(source, target, info)
+        finally:
+            if target is not None:
+                target.close()
+    return result
+
+
+def _zip_member(info, date_time):
+    # 新成员沿用原成员的压缩方式、属性与注释
+    member = zipfile.ZipInfo(info.filename, date_time)
+    member.compress_type = info.compress_type
+    member.comment = info.comment
+    member.create_system = info.create_system
+    member.external_attr = info.external_attr
+    return member
+
+
+def _raw_copy_supported(target):
+    return (RAW_COPY_VERSIONS[0] <= sys.version_info[:2] <= RAW_COPY_VERSIONS[1] and
+            hasattr(zipfile.ZipInfo, "FileHeader") and
+            all(hasattr(target, name) for name in ("fp", "filelist", "NameToInfo", "start_dir")))
+
+
+def _recompress_zip_member(source, target, info):
+    # 通过公开接口流式解压并重新压缩，修改时间与原成员相同
+    member = _zip_member(info, info.date_time)
+    if info.is_dir():
+        target.writestr(member, b'')
+        return
+    with source.open(info) as reader, target.open(member, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) \
+            as writer:
+        shutil.copyfileobj(reader, writer, COPY_CHUNK_SIZE)
+
+
+def _strip_zip64(extra):
+    # 去掉 zip64 扩展字段，由 FileHeader 按实际大小重新生成
+    fields = []
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, length = struct.unpack("<HH", extra[position:position + 4])
+        if field_id != ZIP64_EXTRA_ID:
+            fields.append(extra[position:position + 4 + length])
+        position += 4 + length
+    return b''.join(fields)
+
+
+def _copy_zip_member(source, target, info):
+    # 原样复制已压缩的数据，不解压也不重新压缩：写出本地文件头与数据，
+    # 并登记到目标的中央目录（与 ZipFile.writestr 维护的状态一致）
+    source.fp.seek(info.header_offset)
+    fields = LOCAL_HEADER.unpack(source.fp.read(LOCAL_HEADER.size))
+    source.fp.seek(fields[-2] + fields[-1], os.SEEK_CUR)
+    member = copy.copy(info)
+    member.header_offset = target.fp.tell()
+    # 大小与 CRC 已知，直接写入本地文件头，不再需要数据描述符
+    member.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+    member.extra = _strip_zip64(info.extra)
+    target.fp.write(member.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        chunk = source.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated member: {info.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+    target.filelist.append(member)
+    target.NameToInfo[member.filename] = member
+    target.start_dir = target.fp.tell()
+
+
+def _rewrite_tar(source_path, target_path, opener, transform, rules, timestamp):
+    # 流式读写：成员按顺序处理，未匹配的成员直接复制数据
+    result = ArchiveResult()
+    with tarfile.open(source_path, 'r|*') as source:
+        stream = opener(target_path) if target_path else None
+        target = tarfile.open(fileobj=stream, mode='w|', format=tarfile.PAX_FORMAT) if stream else None
+        try:
+            for info in source:
+                if info.isreg() and rules.match(info.name):
+                    data = source.extractfile(info).read()
+                    new_data = _apply(result, transform, info.name, data)
+                    if target is None:
+                        continue
+                    if new_data is not None:
+                        member = copy.copy(info)
+                        member.size = len(new_data)
+                        member.mtime = int(timestamp)
+                        # pax 扩展头中的 mtime/size 会覆盖头部字段
+                        member.pax_headers = {key: value for key, value in info.pax_headers.items()
+                                              if key not in ("mtime", "size")}
+                        target.addfile(member, io.BytesIO(new_data))
+                    else:
+                        target.addfile(info, io.BytesIO(data))
+                elif target is not None:
+                    target.addfile(info, source.extractfile(info) if info.isreg() else None)
+        finally:
+            if target is not None:
+                target.close()
+                stream.close()
+    return result
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+
+BACKUP_DIR_NAME = "CRCMenu-Manager_backups"
+BACKUP_MODES = ("store", "bak", "none")
+STORE_PREFIX = "store:"
+
+# zlib 预设字典的最大长度
+ZDICT_SIZE = 32 * 1024
+PACK_BUFFER_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def backup_dir_for(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), BACKUP_DIR_NAME)
+
+
+def _write_json(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+class BakBackup:
+    # 旧行为：在原文件旁写入完整的 .bak 副本
+    def save(self, file_path, data):
+        backup_path = file_path + '.bak'
+        with open(backup_path, 'wb') as f:
+            f.write(data)
+        return backup_path
+
+    def save_path(self, file_path):
+        backup_path = file_path + '.bak'
+        shutil.copyfile(file_path, backup_path)
+        return backup_path
+
+    def paths(self):
+        return []
+
+    def flush(self, sync=False):
+        pass
+
+    def load(self, ref):
+        with open(ref, 'rb') as f:
+            return f.read()
+
+
+class _PackWriter:
+    def __init__(self, pack_path, level):
+        self.pack_path = pack_path
+        self.index_path = pack_path[:-len(".pack")] + ".idx"
+        self.level = level
+        self.pack = open(pack_path, 'ab', buffering=PACK_BUFFER_SIZE)
+        self.index = open(self.index_path, 'a', encoding='utf-8', buffering=PACK_BUFFER_SIZE)
+        self.offset = self.pack.tell()
+        self.zdict = None
+        self.dirty = False
+
+    def add(self, digest, data):
+        if self.level == 0:
+            codec, payload = "raw", data
+        elif self.zdict is None:
+            codec, payload = "zlib", zlib.compress(data, self.level)
+            # 第一个备份同时作为本 pack 后续备份的压缩字典，相似页面只需存储差异部分
+            self.zdict = data[-ZDICT_SIZE:]
+        else:
+            compressor = zlib.compressobj(self.level, zdict=self.zdict)
+            codec, payload = "zdict", compressor.compress(data) + compressor.flush()
+
+        self.pack.write(payload)
+        self.index.write(json.dumps({"hash": digest, "offset": self.offset, "length": len(payload),
+                                     "size": len(data), "codec": codec}) + '\n')
+        self.offset += len(payload)
+        self.dirty = True
+
+    def add_stream(self, digest, source):
+        # 大文件分块压缩后追加，不使用预设字典，也不作为后续备份的字典
+        compressor = zlib.compressobj(self.level) if self.level else None
+        length = size = 0
+        for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+            size += len(chunk)
+            payload = compressor.compress(chunk) if compressor is not None else chunk
+            self.pack.write(payload)
+            length += len(payload)
+        if compressor is not None:
+            payload = compressor.flush()
+            self.pack.write(payload)
+            length += len(payload)
+
+        # "stream" 与 "zlib" 解压方式相同，区分开是为了不把它当作 pack 的压缩字典
+        codec = "stream" if compressor is not None else "raw"
+        self.index.write(json.dumps({"hash": digest, "offset": self.offset, "length": length,
+                                     "size": size, "codec": codec}) + '\n')
+        self.offset += length
+        self.dirty = True
+
+    def flush(self, sync=False):
+        if not self.dirty:
+            return
+        self.pack.flush()
+        self.index.flush()
+        if sync:
+            os.fsync(self.pack.fileno())
+            os.fsync(self.index.fileno())
+        self.dirty = False
+
+    def close(self):
+        self.flush()
+        self.pack.close()
+        self.index.close()
+
+
+class BackupStore:
+    # 内容寻址的备份库：按 SHA-256 去重，每个工作线程/进程把本次运行的备份追加到自己的 pack 文件中，
+    # runs/<run_id>.json 记录每次运行中各文件对应的备份哈希
+    def __init__(self, store_dir, level=6, keep_runs=20, max_bytes=0):
+        self.store_dir = store_dir
+        self.pack_dir = os.path.join(store_dir, "packs")
+        self.run_dir = os.path.join(store_dir, "runs")
+        self.level = level
+        self.keep_runs = keep_runs
+        self.max_bytes = max_bytes
+        self.run_id = None
+        self.known_hashes = set()
+        self._local = threading.local()
+        self._writers = []
+        self._lock = threading.Lock()
+        self._index = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_local", "_writers", "_lock", "_index"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._writers = []
+        self._lock = threading.Lock()
+        self._index = None
+
+    def begin_run(self, run_id):
+        os.makedirs(self.pack_dir, exist_ok=True)
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.run_id = run_id
+        # 监视模式会多次开始同一运行，重新读取索引以包含上一批写入的备份
+        self._index = None
+        self.known_hashes = set(self.index())
+        return self
+
+    def _writer(self):
+        writer = getattr(self._local, "writer", None)
+        if writer is None:
+            name = f"{self.run_id}-{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:6]}.pack"
+            writer = _PackWriter(os.path.join(self.pack_dir, name), self.level)
+            self._local.writer = writer
+            self._local.written = set()
+            with self._lock:
+                self._writers.append(writer)
+        return writer
+
+    def save(self, file_path, data):
+        digest = hashlib.sha256(data).hexdigest()
+        writer = self._writer()
+        if digest not in self.known_hashes and digest not in self._local.written:
+            writer.add(digest, data)
+            self._local.written.add(digest)
+        return STORE_PREFIX + digest
+
+    def save_path(self, file_path):
+        # 大文件模式：先流式计算哈希，需要存储时再流式压缩写入，整个过程不把文件读入内存
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                sha.update(chunk)
+            digest = sha.hexdigest()
+            writer = self._writer()
+            if digest not in self.known_hashes and digest not in self._local.written:
+                f.seek(0)
+                writer.add_stream(digest, f)
+                self._local.written.add(digest)
+        return STORE_PREFIX + digest
+
+    # 备份与被替换的文件在同一个线程中处理，因此提交前只需刷新当前线程的 pack
+    def paths(self):
+        writer = getattr(self._local, "writer", None)
+        return [writer.pack_path, writer.index_path] if writer is not None else []
+
+    def flush(self, sync=False):
+        writer = getattr(self._local, "writer", None)
+        if writer is not None:
+            writer.flush(sync)
+
+    def close(self):
+        with self._lock:
+            writers, self._writers = self._writers, []
+        for writer in writers:
+            writer.close()
+        self._local = threading.local()
+
+    def index(self):
+        if self._index is not None:
+            return self._index
+        index = {}
+        if os.path.isdir(self.pack_dir):
+            for name in sorted(os.listdir(self.pack_dir)):
+                if not name.endswith(".idx"):
+                    continue
+                pack_name = name[:-len(".idx")] + ".pack"
+                with open(os.path.join(self.pack_dir, name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            break
+                        entry["pack"] = pack_name
+                        index.setdefault(entry["hash"], entry)
+        self._index = index
+        return index
+
+    def _read_blob(self, entry, pack_file):
+        pack_file.seek(entry["offset"])
+        payload = pack_file.read(entry["length"])
+        if entry["codec"] == "raw":
+            return payload
+        if entry["codec"] in ("zlib", "stream"):
+            return zlib.decompress(payload)
+        # zdict 编码需要先还原 pack 中第一个 zlib 编码的备份作为字典
+        pack_file.seek(0)
+        first = self._first_entry(entry["pack"])
+        zdict = self._read_blob(first, pack_file)[-ZDICT_SIZE:]
+        decompressor = zlib.decompressobj(zdict=zdict)
+        return decompressor.decompress(payload) + decompressor.flush()
+
+    def _first_entry(self, pack_name):
+        index_path = os.path.join(self.pack_dir, pack_name[:-len(".pack")] + ".idx")
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["codec"] == "zlib":
+                    entry["pack"] = pack_name
+                    return entry
+        raise KeyError(f"No dictionary entry in {pack_name}")
+
+    def load(self, ref):
+        digest = ref[len(STORE_PREFIX):] if ref.startswith(STORE_PREFIX) else ref
+        entry = self.index().get(digest)
+        if entry is None:
+            self._index = None
+            entry = self.index().get(digest)
+        if entry is None:
+            raise KeyError(f"Backup {digest} not found")
+        with open(os.path.join(self.pack_dir, entry["pack"]), 'rb') as f:
+            data = self._read_blob(entry, f)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Backup {digest} is corrupted")
+        return data
+
+    def record_run(self, run_id, files, info=None):
+        # files: {abs_path: digest}
+        os.makedirs(self.run_dir, exist_ok=True)
+        snapshot_path = os.path.join(self.run_dir, run_id + ".json")
+        if os.path.exists(snapshot_path):
+            # 恢复运行时合并之前记录的文件
+            previous = self.run_snapshot(run_id)["files"]
+            previous.update(files)
+            files = previous
+        snapshot = {"run": run_id, "time": time.time(), "files": files}
+        if info:
+            snapshot.update(info)
+        _write_json(snapshot_path, snapshot)
+
+    def runs(self):
+        if not os.path.isdir(self.run_dir):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.run_dir) if name.endswith(".json"))
+
+    def run_snapshot(self, run_id):
+        with open(os.path.join(self.run_dir, run_id + ".json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def find_backup(self, file_path, run_id=None):
+        file_path = os.path.abspath(file_path)
+        run_ids = [run_id] if run_id else reversed(self.runs())
+        for candidate in run_ids:
+            digest = self.run_snapshot(candidate)["files"].get(file_path)
+            if digest is not None:
+                return candidate, digest
+        return None, None
+
+    def _pack_sizes(self):
+        sizes = {}
+        for name in os.listdir(self.pack_dir):
+            if name.endswith(".pack"):
+                sizes[name] = os.path.getsize(os.path.join(self.pack_dir, name))
+        return sizes
+
+    def evict(self):
+        # 按运行数量与总大小淘汰最旧的运行，然后删除不再被任何运行引用的 pack
+        if not os.path.isdir(self.pack_dir):
+            return 0
+        runs = self.runs()
+        removed_runs = []
+        if self.keep_runs and len(runs) > self.keep_runs:
+            removed_runs = runs[:len(runs) - self.keep_runs]
+            runs = runs[len(runs) - self.keep_runs:]
+        if self.max_bytes:
+            total = sum(self._pack_sizes().values())
+            while total > self.max_bytes and len(runs) > 1:
+                removed_runs.append(runs.pop(0))
+                total = self._live_size(runs)
+        for run_id in removed_runs:
+            os.remove(os.path.join(self.run_dir, run_id + ".json"))
+        if not removed_runs:
+            return 0
+
+        live_hashes = set()
+        for run_id in runs:
+            live_hashes.update(self.run_snapshot(run_id)["files"].values())
+        live_packs = {entry["pack"] for digest, entry in self.index().items() if digest in live_hashes}
+        # 只删除被淘汰运行写入且不再被引用的 pack；未完成记录的运行（例如崩溃）的 pack 保留给日志回滚使用。
+        # zdict 编码的备份依赖 pack 内第一个备份，因此只能整体删除 pack
+        removed_prefixes = tuple(run_id + "-" for run_id in removed_runs)
+        for name in self._pack_sizes():
+            if name not in live_packs and name.startswith(removed_prefixes):
+                os.remove(os.path.join(self.pack_dir, name))
+                index_path = os.path.join(self.pack_dir, name[:-len(".pack")] + ".idx")
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+        self._index = None
+        return len(removed_runs)
+
+    def _live_size(self, runs):
+        live_hashes = set()
+        for run_id in runs:
+            live_hashes.update(self.run_snapshot(run_id)["files"].values())
+        index = self.index()
+        live_packs = {index[digest]["pack"] for digest in live_hashes if digest in index}
+        return sum(size for name, size in self._pack_sizes().items() if name in live_packs)
@@ -0,0 +1,311 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# 峰值内存按进程的最大常驻内存（RSS）测量；Windows 没有 resource 模块，不测量内存
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from crcmenu_backup import BACKUP_MODES
+from crcmenu_core import (FileProcessor, run_batch, expand_targets, create_backup, EXECUTORS, FSYNC_MODES,
+                          STATUS_FAILED)
+from crcmenu_report import RunStats, STAGES
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baselines")
+BENCH_MODES = ("inject", "update", "delete")
+FONT_AWESOME_CODE = '<link rel="stylesheet" href="/css/font-awesome.min.css">'
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+         "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua")
+
+
+def _paragraphs(rng, size):
+    parts = []
+    length = 0
+    while length < size:
+        text = "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))) + "</p>\n"
+        parts.append(text)
+        length += len(text)
+    return ''.join(parts)
+
+
+def _page(rng, size, head_close="</head>", body_close="</body>", scripts=2, php=False):
+    script_tags = [f'<script src="/js/lib{i}.js"></script>\n' for i in range(scripts)]
+    script_tags.insert(rng.randint(0, len(script_tags)), '<script src="/js/CRCMenu.js?v=0123abcd"></script>\n')
+    header = '<?php include "header.php"; ?>\n' if php else ''
+    return (f'{header}<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>Page</title>\n{head_close}\n'
+            f'<body>\n{_paragraphs(rng, size)}{"".join(script_tags)}{body_close}\n</html>\n')
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(content)
+
+
+def generate_small(directory, rng, scale):
+    # 大量小页面，分布在多级目录中，其中一部分为 PHP
+    for i in range(int(2000 * scale)):
+        extension = ".php" if i % 5 == 0 else ".html"
+        _write(os.path.join(directory, f"section{i % 20}", f"page{i}{extension}"),
+               _page(rng, rng.randint(2 * 1024, 8 * 1024), php=extension == ".php"))
+
+
+def generate_huge(directory, rng, scale):
+    # 少量超大页面，超过默认的大文件阈值
+    for i in range(max(1, int(4 * scale))):
+        _write(os.path.join(directory, f"huge{i}.html"), _page(rng, 20 * 1024 * 1024))
+
+
+def generate_mixed_case(directory, rng, scale):
+    cases = ("</HEAD>", "</Head>", "</head>")
+    bodies = ("</BODY>", "</Body>", "</body>")
+    for i in range(int(1000 * scale)):
+        content = _page(rng, rng.randint(4 * 1024, 16 * 1024), cases[i % 3], bodies[i % 3])
+        content = content.replace('<script src="/js/CRCMenu.js', '<SCRIPT SRC="/js/CRCMenu.js')
+        _write(os.path.join(directory, f"mixed{i}.html"), content)
+
+
+def generate_scripts(directory, rng, scale):
+    for i in range(int(500 * scale)):
+        _write(os.path.join(directory, f"scripts{i}.html"), _page(rng, 4 * 1024, scripts=200))
+
+
+CORPORA = {
+    "small": generate_small,
+    "huge": generate_huge,
+    "mixed_case": generate_mixed_case,
+    "scripts": generate_scripts
+}
+
+
+def generate_corpus(name, directory, scale=1.0, seed=0):
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    CORPORA[name](directory, random.Random(seed), scale)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+def run_mode(work_dir, mode, args):
+    processor = FileProcessor(FONT_AWESOME_CODE, JS_CODE, mode, fsync=args.fsync,
+                              write_only_on_change=True,
+                              backup=create_backup({"backup": args.backup, "backup_compression": 6,
+                                                    "backup_keep_runs": 0, "backup_max_mb": 0},
+                                                   os.path.join(work_dir, "bench.json")),
+                              large_file_threshold=int(args.large_file_mb * 1024 * 1024))
+    stats = RunStats(processor.run_id, mode)
+    for file_path, result in run_batch(processor, expand_targets([os.path.join(work_dir, "site")]),
+                                       args.workers, args.executor, None, stats):
+        pass
+    return stats
+
+
+def _rss_mb(usage):
+    # ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _measure_mode(work_dir, mode, args, connection):
+    # 在新启动的进程中执行，峰值 RSS 只反映这一次操作，包括大文件模式 mmap 读入的页面；
+    # 进程池的工作进程在 run_batch 结束时已回收，RUSAGE_CHILDREN 为其中最大的一个
+    run_mode(work_dir, mode, args)
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN)
+    connection.send((_rss_mb(resource.getrusage(resource.RUSAGE_SELF)),
+                     _rss_mb(workers) if workers.ru_maxrss else None))
+    connection.close()
+
+
+def measure_mode(work_dir, mode, args):
+    # 返回 (运行进程的峰值 RSS, 最大工作进程的峰值 RSS)，单位 MB；没有工作进程时后者为 None
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_mode, args=(work_dir, mode, args, sender))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"Measuring the memory of {mode} failed (exit code {process.exitcode})")
+    finally:
+        receiver.close()
+        process.join()
+
+
+def bench_corpus(name, base_dir, args):
+    # 每次重复都从原始语料的副本开始，依次执行 inject → update → delete
+    results = {mode: {"runs": []} for mode in BENCH_MODES}
+    for repeat in range(args.repeat + 1):
+        # 最后一轮在单独的进程中测量峰值内存，不计入耗时
+        measure_memory = repeat == args.repeat
+        if measure_memory and (args.no_memory or resource is None):
+            break
+        work_dir = tempfile.mkdtemp(prefix=f"crcmenu-bench-{name}-", dir=args.work_dir)
+        try:
+            shutil.copytree(base_dir, os.path.join(work_dir, "site"))
+            for mode in BENCH_MODES:
+                if measure_memory:
+                    results[mode]["peak_rss_mb"], results[mode]["worker_rss_mb"] = measure_mode(work_dir, mode, args)
+                else:
+                    results[mode]["runs"].append(run_mode(work_dir, mode, args))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {}
+    for mode, data in results.items():
+        runs = data["runs"]
+        # 取耗时的中位数那一轮作为代表，避免偶然抖动
+        runs.sort(key=lambda stats: stats.elapsed)
+        stats = runs[len(runs) // 2]
+        latencies = [row[len(STAGES) + 2] for row in stats.rows]
+        summary[mode] = {
+            "files": stats.files,
+            "failed": stats.counts[STATUS_FAILED],
+            "elapsed": statistics.median(run.elapsed for run in runs),
+            "files_per_second": statistics.median(run.files_per_second for run in runs),
+            "mb_per_second": statistics.median(run.mb_per_second for run in runs),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies, default=0.0) * 1000,
+            "peak_rss_mb": data.get("peak_rss_mb"),
+            "worker_rss_mb": data.get("worker_rss_mb"),
+            "stage_seconds": {stage: stats.stage_totals.get(stage, 0.0) for stage in STAGES}
+        }
+    return summary
+
+
+def compare(results, baseline, threshold):
+    # 吞吐量下降或峰值内存增加超过阈值视为退化
+    regressions = []
+    for corpus, modes in results.items():
+        for mode, current in modes.items():
+            previous = baseline.get("results", {}).get(corpus, {}).get(mode)
+            if previous is None:
+                continue
+            if previous["files_per_second"] and \
+                    current["files_per_second"] < previous["files_per_second"] * (1 - threshold):
+                regressions.append(f"{corpus}/{mode}: {current['files_per_second']:.1f} files/s, "
+                                   f"baseline {previous['files_per_second']:.1f}")
+            # 只比较同一种测量方式的结果：旧基线中 tracemalloc 测得的 peak_mb 不参与比较
+            for key, label in (("peak_rss_mb", "peak RSS"), ("worker_rss_mb", "worker RSS")):
+                if previous.get(key) and current.get(key) and current[key] > previous[key] * (1 + threshold):
+                    regressions.append(f"{corpus}/{mode}: {label} {current[key]:.1f} MB, "
+                                       f"baseline {previous[key]:.1f} MB")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'corpus':<11} {'mode':<7} {'files':>6} {'files/s':>9} {'MB/s':>7} {'p50 ms':>8} {'p90 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'RSS MB':>8} {'wkr MB':>8}")
+    for corpus, modes in results.items():
+        for mode, row in modes.items():
+            peak, worker = (f"{row[key]:8.1f}" if row[key] is not None else f"{'-':>8}"
+                            for key in ("peak_rss_mb", "worker_rss_mb"))
+            print(f"{corpus:<11} {mode:<7} {row['files']:>6} {row['files_per_second']:>9.1f} "
+                  f"{row['mb_per_second']:>7.1f} {row['p50_ms']:>8.2f} {row['p90_ms']:>8.2f} "
+                  f"{row['p99_ms']:>8.2f} {row['max_ms']:>8.2f} {peak} {worker}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="crcmenu_bench",
+        description="Benchmark update/inject/delete against synthetic HTML/PHP corpora."
+    )
+    parser.add_argument("corpora", nargs="*",
+                        help=f"corpora to run (default: all of {', '.join(CORPORA)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of pages (default: 1.0)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed repetitions per corpus (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated pages")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of workers, 0 = one per CPU core")
+    parser.add_argument("--executor", choices=EXECUTORS, default="thread", help="worker pool type")
+    parser.add_argument("--fsync", choices=FSYNC_MODES, default="none", help="sync mode (default: none)")
+    parser.add_argument("--backup", choices=BACKUP_MODES, default="none", help="backup mode (default: none)")
+    parser.add_argument("--large-file-mb", type=float, default=16, help="large file threshold in MB")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra pass that measures peak RSS")
+    parser.add_argument("--work-dir", help="directory for generated corpora (default: a temporary directory)")
+    parser.add_argument("--save-baseline", metavar="NAME", help="save the results as a named baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown or memory growth counted as a regression (default: 0.10)")
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR, help=f"baseline directory (default: {BASELINE_DIR})")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    corpora = args.corpora or list(CORPORA)
+    unknown = [name for name in corpora if name not in CORPORA]
+    if unknown:
+        parser.error(f"unknown corpus: {', '.join(unknown)}")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    work_root = tempfile.mkdtemp(prefix="crcmenu-bench-", dir=args.work_dir)
+    args.work_dir = work_root
+
+    results = {}
+    try:
+        for name in corpora:
+            base_dir = os.path.join(work_root, "corpus-" + name)
+            start = time.monotonic()
+            generate_corpus(name, base_dir, args.scale, args.seed)
+            print(f"Generated {name} corpus in {time.monotonic() - start:.1f}s", file=sys.stderr)
+            results[name] = bench_corpus(name, base_dir, args)
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        "time": time.time(),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "options": {"scale": args.scale, "repeat": args.repeat, "seed": args.seed, "workers": args.workers,
+                    "executor": args.executor, "fsync": args.fsync, "backup": args.backup},
+        "results": results
+    }
+
+    if args.save_baseline:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        path = os.path.join(args.baseline_dir, args.save_baseline + ".json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline saved: {path}")
+
+    if args.compare:
+        path = os.path.join(args.baseline_dir, args.compare + ".json")
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        # 重复次数不影响可比性，其余选项不同时给出提示
+        if {key: value for key, value in baseline.get("options", {}).items() if key != "repeat"} != \
+                {key: value for key, value in report["options"].items() if key != "repeat"}:
+            print(f"Warning: baseline was recorded with different options: {baseline.get('options')}",
+                  file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions against baseline " + args.compare + ":")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"No regressions against baseline {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
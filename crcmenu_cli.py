@@ -0,0 +1,529 @@
+import argparse
+import contextlib
+import os
+import signal
+import sys
+import time
+from collections import Counter
+
+from crcmenu_backup import BackupStore, BACKUP_MODES, backup_dir_for
+from crcmenu_core import (FileProcessor, Manifest, RunControl, run_batch, load_config, expand_targets, config_targets,
+                          large_file_threshold, manifest_path_for, journal_dir_for, start_journal, list_journals,
+                          find_journal, journal_status, prepare_resume, remaining_targets, rollback_journal,
+                          create_backup, restore_run, resolve_version, parse_assets,
+                          MODES, PIPELINE_MODE, EXECUTORS, FSYNC_MODES, VERSION_SOURCES, DEFAULT_CONFIG_PATH,
+                          STATUS_SUCCESS, STATUS_UNCHANGED, STATUS_FAILED)
+from crcmenu_inventory import Inventory, inventory_path_for, FEATURES
+from crcmenu_report import RunStats, report_dir_for
+from crcmenu_watch import watch_batches
+
+
+def add_common_arguments(sub):
+    sub.add_argument("-c", "--config", default=DEFAULT_CONFIG_PATH,
+                     help=f"config JSON (default: {DEFAULT_CONFIG_PATH})")
+
+
+def add_run_arguments(sub):
+    sub.add_argument("-w", "--workers", type=int, help="number of workers, 0 = one per CPU core")
+    sub.add_argument("--executor", choices=EXECUTORS, help="worker pool type")
+    sub.add_argument("--fsync", choices=FSYNC_MODES,
+                     help="sync every file, once per batch of files, or not at all")
+    sub.add_argument("--fsync-dir", action="store_true", default=None,
+                     help="fsync the parent directories after replacing files even with --fsync none")
+    sub.add_argument("--large-file-mb", dest="large_file_threshold_mb", type=float,
+                     help="stream files of at least this size through mmap instead of reading them whole, 0 = never")
+    sub.add_argument("--precompress", metavar="CODECS",
+                     help="comma separated codecs such as gzip,br:11 whose existing .gz/.br/.zst copies are "
+                          "regenerated for every changed page, '' = none (br and zstd need the brotli and zstandard "
+                          "packages)")
+    sub.add_argument("--precompress-create", action="store_true", default=None,
+                     help="also create the compressed copies for changed pages that do not have them yet")
+    sub.add_argument("-q", "--quiet", action="store_true", help="only print failures and the summary")
+
+
+def add_target_arguments(sub):
+    sub.add_argument("targets", nargs="*",
+                     help="files, glob patterns or directories (default: the files and roots in the config)")
+    sub.add_argument("--rule", dest="rules", action="append",
+                     help="include glob for directory targets such as '**/*.html', or an exclude "
+                          "such as '!vendor/**'; repeatable (default: html, htm and php files)")
+    sub.add_argument("--files-from", metavar="FILE",
+                     help="also process the paths listed in FILE, one per line; '-' reads standard input, "
+                          "e.g. the output of the query command")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="crcmenu_cli",
+        description="Headless CRCMenu Manager: update, inject or delete CRCMenu snippets without the GUI."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for mode in MODES:
+        sub = subparsers.add_parser(mode, help={
+            "update": "update the CRCMenu.js ?v= version",
+            "inject": "inject Font Awesome and JS include code",
+            "delete": "delete Font Awesome and JS include code",
+            "pipeline": "apply the configured chain of operations in a single read and write per file"
+        }[mode])
+        add_target_arguments(sub)
+        add_common_arguments(sub)
+        sub.add_argument("--js", dest="js_code", help="JS include code, overrides the config")
+        sub.add_argument("--font-awesome", dest="font_awesome_code",
+                         help="Font Awesome include code, overrides the config")
+        sub.add_argument("--version-source", choices=VERSION_SOURCES,
+                         help="derive the ?v= version from the run time or from the CRCMenu.js content")
+        sub.add_argument("--js-file", dest="js_file_path",
+                         help="CRCMenu.js to hash for content versions, implies --version-source content")
+        sub.add_argument("--asset", dest="assets", action="append", metavar="NAME[=VERSION]",
+                         help="also update the ?v= version of this asset file name, e.g. CRCMenu.css or "
+                              "all.min.css=6.5.1 (default version: the run's version); repeatable, "
+                              "added to the assets in the config")
+        if mode == PIPELINE_MODE:
+            sub.add_argument("--steps", help="comma separated operations, e.g. delete,inject,update "
+                                             "(default: the pipeline in the config)")
+        sub.add_argument("--full", action="store_true",
+                         help="process every file even if the manifest says it is up to date")
+        sub.add_argument("--no-manifest", action="store_true",
+                         help="neither read nor update the incremental manifest")
+        sub.add_argument("--always-write", action="store_true",
+                         help="rewrite and back up files even when the content did not change")
+        sub.add_argument("--no-journal", action="store_true", help="do not record a rollback journal")
+        sub.add_argument("--no-report", action="store_true", help="do not export the JSON/CSV run report")
+        sub.add_argument("--watch", action="store_true",
+                         help="after the run, keep watching the targets and re-apply the operation to files "
+                              "that change until interrupted with Ctrl+C")
+        sub.add_argument("--dry-run", action="store_true",
+                         help="compute the changes without writing, backing up or journaling anything and "
+                              "print them as a unified diff")
+        sub.add_argument("--patch", metavar="FILE",
+                         help="with --dry-run, write the diff to FILE instead of standard output")
+        sub.add_argument("--backup", choices=BACKUP_MODES,
+                         help="back up into the deduplicated store, as .bak files next to each file, or not at all")
+        add_run_arguments(sub)
+
+    sub = subparsers.add_parser("runs", help="list recorded runs")
+    add_common_arguments(sub)
+
+    sub = subparsers.add_parser("rollback", help="restore every file changed by a run from its backup")
+    sub.add_argument("run_id", nargs="?", help="run to roll back (default: the latest run)")
+    add_common_arguments(sub)
+
+    sub = subparsers.add_parser("restore", help="restore files from the backup store")
+    sub.add_argument("run_id", nargs="?", help="run whose backups to restore (default: the latest run)")
+    sub.add_argument("files", nargs="*", help="only restore these files (default: every file of the run)")
+    sub.add_argument("--list", action="store_true", help="list the runs in the backup store instead")
+    add_common_arguments(sub)
+
+    sub = subparsers.add_parser("resume", help="continue an interrupted run with the files it did not finish")
+    sub.add_argument("run_id", nargs="?", help="run to resume (default: the latest run)")
+    add_common_arguments(sub)
+    add_run_arguments(sub)
+
+    sub = subparsers.add_parser("index", help="scan the pages into the inventory index without modifying them")
+    add_target_arguments(sub)
+    add_common_arguments(sub)
+    sub.add_argument("--js", dest="js_code", help="JS include code to look for, overrides the config")
+    sub.add_argument("--font-awesome", dest="font_awesome_code",
+                     help="Font Awesome include code to look for, overrides the config")
+    sub.add_argument("--full", action="store_true", help="rescan every page even if its size and mtime did not change")
+    add_run_arguments(sub)
+
+    sub = subparsers.add_parser("query", help="list the indexed pages that match every given filter")
+    add_common_arguments(sub)
+    sub.add_argument("--version", help="pages that load CRCMenu.js with this ?v= version ('' = without version)")
+    sub.add_argument("--other-version", metavar="VERSION", help="pages that load CRCMenu.js with any other version")
+    sub.add_argument("--outdated", action="store_true",
+                     help="pages that load a version other than the current content version of CRCMenu.js")
+    sub.add_argument("--js-file", dest="js_file_path", help="CRCMenu.js whose content version --outdated compares to")
+    sub.add_argument("--missing", action="append", choices=FEATURES, default=[],
+                     help="pages without the JS include, the Font Awesome include, </head> or </body>; repeatable")
+    sub.add_argument("--present", action="append", choices=FEATURES, default=[],
+                     help="pages with the JS include, the Font Awesome include, </head> or </body>; repeatable")
+    sub.add_argument("--duplicates", action="store_true", help="pages that load CRCMenu.js more than once")
+    sub.add_argument("--failed", action="store_true", help="pages that could not be scanned")
+    sub.add_argument("--path", metavar="GLOB", help="only paths matching this glob, e.g. '*/blog/*'")
+    sub.add_argument("--summary", action="store_true", help="print the counts per version and feature instead")
+    sub.add_argument("-o", "--output", help="write the matching paths to this file instead of standard output")
+
+    return parser
+
+
+def apply_overrides(config, args, keys):
+    for key in keys:
+        value = getattr(args, key, None)
+        if value is not None:
+            config[key] = value
+
+
+@contextlib.contextmanager
+def cancel_on_interrupt(control):
+    # 第一次 Ctrl+C 在当前文件完成后停止，第二次立即中断
+    def interrupt(signum, frame):
+        print("Cancelling after the files in progress, press Ctrl+C again to abort", file=sys.stderr)
+        control.cancel()
+        signal.signal(signal.SIGINT, previous)
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        yield control
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def run_files(processor, file_paths, config, manifest, quiet, report_dir=None, control=None):
+    stats = RunStats(processor.run_id, processor.mode)
+    control = control or RunControl()
+
+    with cancel_on_interrupt(control):
+        for file_path, result in run_batch(processor, file_paths, config["workers"], config["executor"], manifest,
+                                           stats, control):
+            if result.status == STATUS_FAILED:
+                category, message = result.error or ("other", "")
+                print(f"Failed: {file_path} ({category}: {message})", file=sys.stderr)
+            elif not quiet:
+                print(f"{result.status.capitalize()}: {file_path}")
+
+    counts = stats.counts
+    print(f"{stats.files} files, {counts[STATUS_SUCCESS]} succeeded, "
+          f"{counts[STATUS_UNCHANGED]} unchanged, {counts[STATUS_FAILED]} failed in {stats.elapsed:.2f}s")
+    if not quiet:
+        print(stats.format_summary())
+    if processor.journal is not None:
+        print(f"Run ID: {processor.journal.run_id}")
+        if control.cancelled:
+            print(f"Cancelled, continue with: crcmenu_cli.py resume {processor.journal.run_id}")
+    if report_dir is not None:
+        try:
+            json_path, csv_path = stats.save(report_dir)
+            print(f"Report: {json_path}, {csv_path}")
+        except OSError as e:
+            print(f"Error writing report: {e}", file=sys.stderr)
+    return 1 if counts[STATUS_FAILED] or control.cancelled else 0
+
+
+def preview_files(processor, file_paths, config, quiet, patch_path=None):
+    # 预演：差异按完成顺序流式写出，状态与汇总写到另一个流，避免混入补丁
+    stats = RunStats(processor.run_id, processor.mode)
+    control = RunControl()
+    # 非 UTF-8 页面的原始字节在差异中以 surrogateescape 保留，写出时还原
+    out = open(patch_path, 'w', encoding='utf-8', errors='surrogateescape', newline='\n') if patch_path else sys.stdout
+    if out is sys.stdout:
+        sys.stdout.reconfigure(errors='surrogateescape')
+    log = sys.stderr if out is sys.stdout else sys.stdout
+    try:
+        with cancel_on_interrupt(control):
+            for file_path, result in run_batch(processor, file_paths, config["workers"], config["executor"],
+                                               stats=stats, control=control):
+                if result.status == STATUS_FAILED:
+                    category, message = result.error or ("other", "")
+                    print(f"Would fail: {file_path} ({category}: {message})", file=sys.stderr)
+                elif result.diff:
+                    out.write(result.diff)
+                    if not quiet and out is not sys.stdout:
+                        print(f"Would change: {file_path}", file=log)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    counts = stats.counts
+    print(f"{stats.files} files, {counts[STATUS_SUCCESS]} would change, {counts[STATUS_UNCHANGED]} unchanged, "
+          f"{counts[STATUS_FAILED]} would fail in {stats.elapsed:.2f}s", file=log)
+    if patch_path:
+        print(f"Patch: {patch_path}", file=log)
+    return 1 if counts[STATUS_FAILED] or control.cancelled else 0
+
+
+def read_file_list(path):
+    # 每行一个路径，"-" 表示标准输入
+    f = sys.stdin if path == "-" else open(path, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def resolve_targets(args, config):
+    # 命令行目标与 --files-from 列表都未给出时使用配置中的文件和目录根；
+    # --files-from 的列表为空时不回退到配置，避免筛选结果为空却处理整个站点
+    targets = [os.path.abspath(target) for target in args.targets]
+    if args.rules:
+        targets = [{"path": target, "rules": args.rules} if os.path.isdir(target) else target
+                   for target in targets]
+    if args.files_from:
+        return targets + [os.path.abspath(path) for path in read_file_list(args.files_from)]
+    return targets or config_targets(config)
+
+
+def command_process(args, config):
+    apply_overrides(config, args, ("js_code", "font_awesome_code", "workers", "executor", "fsync", "fsync_dir",
+                                   "backup", "large_file_threshold_mb", "version_source", "precompress",
+                                   "precompress_create"))
+    if args.js_file_path:
+        config["js_file_path"] = os.path.abspath(args.js_file_path)
+        if args.version_source is None:
+            config["version_source"] = "content"
+
+    if args.dry_run and args.watch:
+        print("--dry-run cannot be combined with --watch", file=sys.stderr)
+        return 2
+    if args.patch and not args.dry_run:
+        print("--patch requires --dry-run", file=sys.stderr)
+        return 2
+
+    if args.command in ("inject", "delete") and not config["js_code"]:
+        print("Please provide JS code (required)", file=sys.stderr)
+        return 2
+
+    targets = resolve_targets(args, config)
+    if not targets:
+        print("Please select files to process first", file=sys.stderr)
+        return 2
+
+    manifest = None
+    known_entries = None
+    if config["incremental"] and not args.no_manifest:
+        manifest = Manifest(manifest_path_for(args.config)).load()
+        known_entries = {} if args.full else manifest.entries
+
+    if getattr(args, "steps", None):
+        config["pipeline"] = [step.strip() for step in args.steps.split(",") if step.strip()]
+    if args.assets:
+        config["assets"] = dict(config["assets"], **parse_assets(args.assets))
+
+    try:
+        version = resolve_version(config, args.config)
+        processor = FileProcessor(config["font_awesome_code"], config["js_code"], args.command,
+                                  manifest=known_entries,
+                                  write_only_on_change=config["write_only_on_change"] and not args.always_write,
+                                  fsync=config["fsync"], fsync_dir=config["fsync_dir"],
+                                  backup=None if args.dry_run else create_backup(config, args.config),
+                                  pipeline=config["pipeline"], large_file_threshold=large_file_threshold(config),
+                                  dry_run=args.dry_run, version=version, precompress=config["precompress"],
+                                  assets=config["assets"], precompress_create=config["precompress_create"])
+    except (ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.dry_run:
+        return preview_files(processor, expand_targets(targets), config, args.quiet, args.patch)
+    if config["journal"] and not args.no_journal:
+        processor.journal = start_journal(journal_dir_for(args.config), processor, targets)
+
+    report_dir = report_dir_for(args.config) if config["report"] and not args.no_report else None
+    control = RunControl()
+    exit_code = run_files(processor, expand_targets(targets), config, manifest, args.quiet, report_dir, control)
+    if args.watch and not control.cancelled:
+        exit_code = watch_files(processor, targets, config, manifest, args.quiet)
+    return exit_code
+
+
+def watch_files(processor, targets, config, manifest, quiet):
+    print("Watching for changes, press Ctrl+C to stop")
+    counts = {STATUS_SUCCESS: 0, STATUS_UNCHANGED: 0, STATUS_FAILED: 0}
+    try:
+        for file_path, result in watch_batches(processor, targets, config["workers"], config["executor"], manifest,
+                                               debounce=config["watch_debounce_ms"] / 1000):
+            counts[result.status] += 1
+            if result.status == STATUS_FAILED:
+                category, message = result.error or ("other", "")
+                print(f"Failed: {file_path} ({category}: {message})", file=sys.stderr)
+            elif not quiet:
+                print(f"{time.strftime('%H:%M:%S')} {result.status.capitalize()}: {file_path}")
+    except KeyboardInterrupt:
+        pass
+    print(f"Stopped watching: {counts[STATUS_SUCCESS]} succeeded, "
+          f"{counts[STATUS_UNCHANGED]} unchanged, {counts[STATUS_FAILED]} failed")
+    return 1 if counts[STATUS_FAILED] else 0
+
+
+def command_runs(args, config):
+    for journal in list_journals(journal_dir_for(args.config)):
+        state = journal.state()
+        begin = state["begin"] or {}
+        print(f"{journal.run_id}  {begin.get('mode', '?'):<7} {len(state['done']):>7} files  "
+              f"{journal_status(state)}")
+    return 0
+
+
+def command_rollback(args, config):
+    journal = find_journal(journal_dir_for(args.config), args.run_id)
+    if journal is None:
+        print("No matching run found", file=sys.stderr)
+        return 2
+    restored, failed = rollback_journal(journal, BackupStore(backup_dir_for(args.config)))
+    print(f"Run {journal.run_id}: {restored} files restored, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def command_restore(args, config):
+    store = BackupStore(backup_dir_for(args.config))
+    runs = store.runs()
+    if args.list:
+        for run_id in runs:
+            snapshot = store.run_snapshot(run_id)
+            print(f"{run_id}  {snapshot.get('mode', '?'):<7} {len(snapshot['files']):>7} files")
+        return 0
+
+    files = list(args.files)
+    run_id = args.run_id
+    if run_id is not None and run_id not in runs and os.path.exists(run_id):
+        files.insert(0, run_id)
+        run_id = None
+
+    if run_id is None and files:
+        # 未指定运行时，每个文件恢复到它最近一次运行前的备份
+        restored = 0
+        failed = []
+        for file_path in files:
+            found_run, _ = store.find_backup(file_path)
+            if found_run is None:
+                print(f"No backup found for {file_path}", file=sys.stderr)
+                failed.append(file_path)
+                continue
+            count, errors = restore_run(store, found_run, [file_path])
+            restored += count
+            failed.extend(errors)
+        print(f"{restored} files restored, {len(failed)} failed")
+        return 1 if failed else 0
+
+    run_id = run_id or (runs[-1] if runs else None)
+    if run_id not in runs:
+        print("No matching run found in the backup store", file=sys.stderr)
+        return 2
+    restored, failed = restore_run(store, run_id, files or None)
+    print(f"Run {run_id}: {restored} files restored, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def command_resume(args, config):
+    apply_overrides(config, args, ("workers", "executor", "fsync", "fsync_dir", "large_file_threshold_mb",
+                                   "precompress", "precompress_create"))
+    journal = find_journal(journal_dir_for(args.config), args.run_id)
+    if journal is None:
+        print("No matching run found", file=sys.stderr)
+        return 2
+    try:
+        state = prepare_resume(journal, BackupStore(backup_dir_for(args.config)))
+    except Exception as e:
+        print(f"Cannot resume: {e}", file=sys.stderr)
+        return 2
+
+    begin = state["begin"]
+    manifest = Manifest(manifest_path_for(args.config)).load() if config["incremental"] else None
+    try:
+        processor = FileProcessor(begin["font_awesome_code"], begin["js_code"], begin["mode"],
+                                  begin["common_timestamp"],
+                                  manifest.entries if manifest is not None else None,
+                                  config["write_only_on_change"], journal,
+                                  config["fsync"], config["fsync_dir"],
+                                  create_backup(config, args.config), journal.run_id, begin.get("pipeline"),
+                                  large_file_threshold(config), version=begin.get("version"),
+                                  precompress=config["precompress"], assets=begin.get("assets"),
+                                  precompress_create=config["precompress_create"])
+    except (ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(f"Resuming run {journal.run_id}, {len(state['done'])} files already done, "
+          f"{len(state['checked'])} already checked")
+    return run_files(processor, remaining_targets(state), config, manifest, args.quiet,
+                     report_dir_for(args.config) if config["report"] else None)
+
+
+def format_inventory(summary):
+    updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["updated"])) if summary["updated"] else "never"
+    lines = [f"{summary['pages']} pages indexed (updated {updated}), {summary['failed']} could not be scanned",
+             "Missing: " + ", ".join(f"{feature} {count}" for feature, count in summary["missing"].items()),
+             f"Loading CRCMenu.js more than once: {summary['duplicates']}"]
+    if summary["versions"]:
+        lines.append("CRCMenu.js versions:")
+        lines.extend(f"  {version or '(none)':<12} {count} pages" for version, count in summary["versions"])
+    return '\n'.join(lines)
+
+
+def command_index(args, config):
+    apply_overrides(config, args, ("js_code", "font_awesome_code", "workers", "executor", "large_file_threshold_mb"))
+    targets = resolve_targets(args, config)
+    if not targets:
+        print("Please select files to index first", file=sys.stderr)
+        return 2
+
+    counts = Counter()
+    control = RunControl()
+    start = time.monotonic()
+    with Inventory(inventory_path_for(args.config)) as inventory, cancel_on_interrupt(control):
+        for file_path, status in inventory.update(targets, config["font_awesome_code"], config["js_code"],
+                                                  config["workers"], config["executor"], args.full,
+                                                  large_file_threshold(config), control):
+            counts[status] += 1
+            if status == "failed":
+                print(f"Failed: {file_path}", file=sys.stderr)
+            elif status == "scanned" and not args.quiet:
+                print(f"Scanned: {file_path}")
+        summary = inventory.summary()
+    print(f"{sum(counts.values())} files, {counts['scanned']} scanned, {counts['unchanged']} unchanged, "
+          f"{counts['failed']} failed in {time.monotonic() - start:.2f}s")
+    print(format_inventory(summary))
+    if control.cancelled:
+        print("Cancelled, pages not reached keep their previous entries")
+    return 1 if counts["failed"] or control.cancelled else 0
+
+
+def command_query(args, config):
+    inventory_path = inventory_path_for(args.config)
+    if not os.path.exists(inventory_path):
+        print("No inventory yet, run the index command first", file=sys.stderr)
+        return 2
+    other_version = args.other_version
+    if args.outdated:
+        if args.js_file_path:
+            config["version_source"], config["js_file_path"] = "content", os.path.abspath(args.js_file_path)
+        try:
+            other_version = resolve_version(config, args.config)
+        except (ValueError, OSError) as e:
+            print(e, file=sys.stderr)
+            return 2
+        if other_version is None:
+            print("--outdated requires content versions: set \"version_source\": \"content\" or pass --js-file",
+                  file=sys.stderr)
+            return 2
+
+    with Inventory(inventory_path) as inventory:
+        if args.summary:
+            print(format_inventory(inventory.summary()))
+            return 0
+        paths = inventory.query(args.version, other_version, args.missing, args.present, args.duplicates,
+                                args.failed, args.path)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.writelines(path + '\n' for path in paths)
+        print(f"{len(paths)} pages written to {args.output}")
+    else:
+        sys.stdout.writelines(path + '\n' for path in paths)
+        print(f"{len(paths)} pages", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+    except Exception as e:
+        print(f"Failed to load configuration: {e}", file=sys.stderr)
+        return 2
+
+    if args.command in MODES:
+        return command_process(args, config)
+    return {
+        "runs": command_runs,
+        "rollback": command_rollback,
+        "restore": command_restore,
+        "resume": command_resume,
+        "index": command_index,
+        "query": command_query
+    }[args.command](args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
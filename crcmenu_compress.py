@@ -0,0 +1,125 @@
+import os
+import zlib
+
+# 可选依赖：未安装时对应的编码不可用
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 编码名: (兄弟文件后缀, 默认级别, 级别范围)；与 nginx gzip_static/brotli_static 等使用的文件名一致
+CODECS = {
+    "gzip": (".gz", 9, (1, 9)),
+    "br": (".br", 11, (0, 11)),
+    "zstd": (".zst", 19, (1, 22)),
+}
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+def codec_available(name):
+    return name == "gzip" or (name == "br" and brotli is not None) or (name == "zstd" and zstandard is not None)
+
+
+def parse_codecs(specs):
+    # "gzip"、"br:11" 形式的列表（或逗号分隔的字符串）解析为 [(编码, 级别, 后缀)]；
+    # 未知、未安装的编码或超出范围的级别抛出 ValueError
+    if isinstance(specs, str):
+        specs = specs.split(',')
+    codecs = []
+    for spec in specs or []:
+        name, _, level = spec.strip().partition(':')
+        if not name:
+            continue
+        if name not in CODECS:
+            raise ValueError(f"Unknown precompress codec: {name} (choose from {', '.join(CODECS)})")
+        if not codec_available(name):
+            raise ValueError(f"Precompress codec {name} requires the "
+                             f"{'brotli' if name == 'br' else 'zstandard'} package")
+        suffix, default, (low, high) = CODECS[name]
+        level = int(level) if level else default
+        if not low <= level <= high:
+            raise ValueError(f"Precompress level for {name} must be between {low} and {high}")
+        codecs.append((name, level, suffix))
+    return codecs
+
+
+class _Compressor:
+    # 三种编码统一为 compress(chunk) / flush() 的流式接口
+    def __init__(self, name, level):
+        if name == "gzip":
+            # wbits=31 生成 gzip 格式；头部不含文件名，mtime 为 0，相同内容得到相同的压缩结果
+            self.stream = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress, self.flush = self.stream.compress, self.stream.flush
+        elif name == "br":
+            self.stream = brotli.Compressor(quality=level)
+            self.compress, self.flush = self.stream.process, self.stream.finish
+        else:
+            self.stream = zstandard.ZstdCompressor(level=level).compressobj()
+            self.compress, self.flush = self.stream.compress, self.stream.flush
+
+
+def compress_to(name, level, chunks, out):
+    compressor = _Compressor(name, level)
+    for chunk in chunks:
+        out.write(compressor.compress(chunk))
+    out.write(compressor.flush())
+
+
+def file_chunks(path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COMPRESS_CHUNK_SIZE), b''):
+            yield chunk
+
+
+def sibling_codecs(file_path, codecs, create=False):
+    # 默认只重新生成页面旁已经存在的兄弟文件；create 为真时也为还没有副本的页面新建
+    if create:
+        return codecs
+    return [codec for codec in codecs if os.path.exists(file_path + codec[2])]
+
+
+def write_siblings(source, codecs, temp_prefix):
+    # 为 source（文件路径或内存中的内容）生成各编码的临时兄弟文件，返回 [(临时路径, 后缀)]；
+    # 提交时与页面一起替换。失败时删除已写入的临时文件
+    written = []
+    base = source if isinstance(source, str) else None
+    try:
+        for name, level, suffix in codecs:
+            temp_path = temp_prefix + suffix
+            written.append((temp_path, suffix))
+            with open(temp_path, 'wb') as out:
+                compress_to(name, level, file_chunks(base) if base is not None else (source,), out)
+    except Exception:
+        for temp_path, suffix in written:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+    return written
+
+
+def commit_siblings(file_path, siblings):
+    # 页面替换后再替换兄弟文件，并把兄弟文件的修改时间设为与页面相同
+    stat = os.stat(file_path)
+    for temp_path, suffix in siblings:
+        os.replace(temp_path, file_path + suffix)
+        os.utime(file_path + suffix, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def discard_siblings(siblings):
+    for temp_path, suffix in siblings:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def refresh_siblings(file_path, data):
+    # 从备份恢复页面后，按默认级别重新生成已经存在的兄弟文件，避免继续提供修改后的内容
+    codecs = [(name, default, suffix) for name, (suffix, default, levels) in CODECS.items()
+              if codec_available(name) and os.path.exists(file_path + suffix)]
+    if not codecs:
+        return
+    temp_prefix = os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.{os.getpid()}.restore")
+    commit_siblings(file_path, write_siblings(data, codecs, temp_prefix))
@@ -0,0 +1,1533 @@
+import codecs
+import glob
+import hashlib
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+
+from crcmenu_archive import archive_format, rewrite_archive
+from crcmenu_compress import (commit_siblings, discard_siblings, parse_codecs, refresh_siblings, sibling_codecs,
+                              write_siblings)
+from crcmenu_backup import BakBackup, BackupStore, BACKUP_MODES, STORE_PREFIX, backup_dir_for
+from crcmenu_diff import unified_diff, region_diff
+from crcmenu_html import SnippetLocator
+from crcmenu_scan import DEFAULT_RULES, normalize_root, scan_root
+
+OPERATIONS = ("update", "inject", "delete")
+PIPELINE_MODE = "pipeline"
+MODES = OPERATIONS + (PIPELINE_MODE,)
+EXECUTORS = ("thread", "process")
+DEFAULT_CONFIG_PATH = "CRCMenu-Manager_file_list.json"
+MANIFEST_NAME = "CRCMenu-Manager_manifest.json"
+JOURNAL_DIR_NAME = "CRCMenu-Manager_journal"
+VERSION_CACHE_NAME = "CRCMenu-Manager_versions.json"
+# timestamp: 每次运行生成新的版本号；content: 使用 CRCMenu.js 内容哈希，脚本不变时版本号不变
+VERSION_SOURCES = ("timestamp", "content")
+VERSION_LENGTH = 8
+# 无需修改的文件按批写入日志，恢复运行时跳过
+CHECKED_BATCH = 256
+# file: 每个文件单独 fsync；batch: 每个分块统一同步一次；none: 不主动同步
+FSYNC_MODES = ("file", "batch", "none")
+
+STATUS_SUCCESS = "success"
+STATUS_UNCHANGED = "unchanged"
+STATUS_FAILED = "failed"
+
+DEFAULT_CONFIG = {
+    "files": [],
+    "roots": [],
+    "font_awesome_code": "",
+    "js_code": "",
+    "version_source": "timestamp",
+    "js_file_path": "",
+    "assets": {},
+    "pipeline": [],
+    "workers": 0,
+    "executor": "process",
+    "incremental": True,
+    "write_only_on_change": True,
+    "large_file_threshold_mb": 16,
+    "precompress": [],
+    "precompress_create": False,
+    "watch_debounce_ms": 100,
+    "journal": True,
+    "fsync": "batch",
+    "fsync_dir": False,
+    "backup": "store",
+    "backup_compression": 6,
+    "backup_keep_runs": 20,
+    "backup_max_mb": 0,
+    "report": True
+}
+
+
+SETTING_KEYS = tuple(key for key in DEFAULT_CONFIG if key not in ("files", "roots", "font_awesome_code", "js_code"))
+
+
+def normalize_pipeline(steps, font_awesome_code, js_code):
+    # 步骤可以写成 "inject" 这样的字符串，或带有独立代码的对象；未填写的代码使用全局配置
+    pipeline = []
+    for step in steps:
+        if isinstance(step, str):
+            step = {"op": step}
+        if not isinstance(step, dict):
+            raise ValueError(f"Invalid pipeline step: {step!r}")
+        op = step.get("op")
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown pipeline operation: {op}")
+        step_js_code = step.get("js_code", js_code)
+        if op in ("inject", "delete") and not step_js_code:
+            raise ValueError(f"Pipeline step '{op}' requires JS code")
+        pipeline.append({
+            "op": op,
+            "font_awesome_code": step.get("font_awesome_code", font_awesome_code),
+            "js_code": step_js_code
+        })
+    return pipeline
+
+
+def parse_pipeline(lines):
+    # 界面中每行一个步骤：操作名称，或带有独立代码的 JSON 对象；JSON 无效时抛出 ValueError
+    steps = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            try:
+                steps.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"Invalid pipeline step {line!r}: {e}")
+        else:
+            steps.append(line)
+    return steps
+
+
+def format_pipeline(steps):
+    return '\n'.join(step if isinstance(step, str) else json.dumps(step, ensure_ascii=False) for step in steps)
+
+
+def file_list_path_for(config_path):
+    # 文件列表单独保存为每行一个路径的文本文件，修改代码或设置时无需重写整个列表
+    return os.path.splitext(config_path)[0] + ".txt"
+
+
+def load_file_list(config_path):
+    file_list_path = file_list_path_for(config_path)
+    if not os.path.exists(file_list_path):
+        return []
+    with open(file_list_path, 'r', encoding='utf-8') as f:
+        return [line for line in f.read().split('\n') if line]
+
+
+def load_config(config_path=DEFAULT_CONFIG_PATH):
+    data = {}
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    # 旧版配置把文件列表直接写在 JSON 中，此时以 JSON 为准
+    if "files" not in data:
+        data["files"] = load_file_list(config_path)
+    return normalize_config(data)
+
+
+def save_config(config_path, config, file_list=None):
+    # file_list 为 None 时只写入配置本身；先写文件列表，配置中不再保存 "files"
+    if file_list is not None:
+        atomic_write(file_list_path_for(config_path), ''.join(path + '\n' for path in file_list).encode('utf-8'))
+    config = {key: value for key, value in config.items() if key != "files"}
+    atomic_write(config_path, (json.dumps(config, indent=4, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+class ConfigWriter:
+    # 后台写入配置：短时间内的多次提交合并为一次写入，只保留最新的配置和文件列表
+    def __init__(self, config_path, delay=0.2):
+        self.config_path = config_path
+        self.delay = delay
+        # 最近一次写入后配置文件和列表文件的 mtime_ns，用于区分外部修改与自身写入
+        self.written_mtimes = {}
+        self._config = None
+        self._file_list = None
+        self._busy = False
+        self._closed = False
+        self._last_submit = 0.0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="ConfigWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, config, file_list=None):
+        with self._condition:
+            self._config = config
+            if file_list is not None:
+                self._file_list = file_list
+            self._busy = True
+            self._last_submit = time.monotonic()
+            self._condition.notify_all()
+
+    def busy(self):
+        with self._condition:
+            return self._busy
+
+    def flush(self, timeout=None):
+        with self._condition:
+            self._last_submit = 0.0
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._busy, timeout)
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._config is not None or self._closed)
+                if self._config is None:
+                    return
+                # 等到一段时间内没有新的提交再写入
+                while True:
+                    remaining = self._last_submit + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                config, self._config = self._config, None
+                file_list, self._file_list = self._file_list, None
+
+            try:
+                save_config(self.config_path, config, file_list)
+                written_paths = [self.config_path]
+                if file_list is not None:
+                    written_paths.append(file_list_path_for(self.config_path))
+                for path in written_paths:
+                    self.written_mtimes[path] = os.stat(path).st_mtime_ns
+            except Exception as e:
+                print(f"Error saving configuration: {e}")
+
+            with self._condition:
+                if self._config is None:
+                    self._busy = False
+                    self._condition.notify_all()
+
+
+def normalize_config(data):
+    config = dict(DEFAULT_CONFIG)
+    config.update(data)
+    if config["executor"] not in EXECUTORS:
+        config["executor"] = DEFAULT_CONFIG["executor"]
+    if config["backup"] not in BACKUP_MODES:
+        config["backup"] = DEFAULT_CONFIG["backup"]
+    if config["fsync"] not in FSYNC_MODES:
+        config["fsync"] = DEFAULT_CONFIG["fsync"]
+    if config["version_source"] not in VERSION_SOURCES:
+        config["version_source"] = DEFAULT_CONFIG["version_source"]
+    if not isinstance(config["assets"], dict):
+        config["assets"] = {}
+    config["workers"] = int(config["workers"] or 0)
+    return config
+
+
+def large_file_threshold(config):
+    # 配置中以 MB 为单位，0 表示关闭大文件模式
+    return int(float(config["large_file_threshold_mb"] or 0) * 1024 * 1024)
+
+
+def config_targets(config):
+    # 配置中的文件列表与目录根（含各自的 include/exclude 规则）
+    return list(config["files"]) + [normalize_root(root) for root in config["roots"]]
+
+
+def expand_targets(targets, rules=DEFAULT_RULES):
+    # 目标可以是文件、glob、目录或 {"path", "rules"} 形式的目录根；按顺序惰性产出去重后的文件路径
+    seen = set()
+    for target in targets:
+        if isinstance(target, dict):
+            paths = scan_root(target["path"], target.get("rules") or rules)
+        elif os.path.isdir(target):
+            paths = scan_root(target, rules)
+        elif glob.has_magic(target):
+            paths = (path for path in glob.iglob(target, recursive=True) if os.path.isfile(path))
+        else:
+            paths = (target,)
+        for path in paths:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                yield path
+
+
+JS_PATTERN = re.compile(r'(<script[^>]*src=["\'][^"\']*CRCMenu\.js)(?:\?v=[^"\']*)?(["\'][^>]*)>', re.IGNORECASE)
+
+# 多资源版本更新：一次扫描匹配所有 script/link 标签的 src/href，再按 URL 中的文件名查版本表，
+# 耗时与配置的资源数量无关。分组依次为：文件名之前的部分、文件名、引号之后的部分
+ASSET_PATTERN = re.compile(r'''(<(?:script|link)\b[^>]*?\b(?:src|href)=["'](?:[^"'?#/>]*/)*)([^"'?#/>]+)'''
+                           r'''(?:\?v=[^"']*)?(["'][^>]*)>''', re.IGNORECASE)
+ASSET_NAME = re.compile(r'''[^\s"'<>/?#=]+''')
+ASSET_VERSION = re.compile(r'''[^\s"'<>]*''')
+
+# 大文件模式使用的字节版本
+JS_PATTERN_BYTES = re.compile(JS_PATTERN.pattern.encode('ascii'), re.IGNORECASE)
+ASSET_PATTERN_BYTES = re.compile(ASSET_PATTERN.pattern.encode('ascii'), re.IGNORECASE)
+COPY_CHUNK_SIZE = 1024 * 1024
+# 带 BOM 的 UTF-16/32 页面无法按字节匹配标签，解码后处理，写回时保留原 BOM 与字节序；
+# 其余页面（UTF-8、GBK、Shift-JIS 等 ASCII 兼容编码）直接按字节修改，不经过解码。
+# UTF-32-LE 的 BOM 以 UTF-16-LE 的 BOM 开头，需要先判断
+WIDE_BOMS = ((codecs.BOM_UTF32_LE, 'utf-32-le'), (codecs.BOM_UTF32_BE, 'utf-32-be'),
+             (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be'))
+# 插入非 ASCII 代码时，在文件开头这一范围内查找页面声明的 charset
+CHARSET_WINDOW = 8192
+CHARSET_PATTERN = re.compile(rb'''<meta\b[^>]*?charset\s*=\s*["']?([\w.:-]+)''', re.IGNORECASE)
+
+
+def parse_assets(lines):
+    # "文件名" 或 "文件名=版本号" 形式的行（命令行 --asset 与界面使用）转换为资源版本表
+    assets = {}
+    for line in lines:
+        name, _, version = line.partition('=')
+        if name.strip():
+            assets[name.strip()] = version.strip()
+    return assets
+
+
+def format_assets(assets):
+    return '\n'.join(f"{name}={version}" if version else name for name, version in assets.items())
+
+
+def normalize_assets(assets):
+    # 校验资源版本表 {文件名: 版本号}，返回以小写文件名为键的副本；版本号为空时使用本次运行的版本号
+    versions = {}
+    for name, version in (assets or {}).items():
+        version = '' if version is None else str(version)
+        if not ASSET_NAME.fullmatch(name):
+            raise ValueError(f"Invalid asset name: {name!r}")
+        if not ASSET_VERSION.fullmatch(version):
+            raise ValueError(f"Invalid version for {name}: {version!r}")
+        versions[name.lower()] = version
+    return versions
+
+
+def content_hash(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def wide_encoding(buffer):
+    # 返回 (编码, BOM)；ASCII 兼容的页面返回 (None, b'')
+    head = bytes(buffer[:4])
+    for bom, encoding in WIDE_BOMS:
+        if head.startswith(bom):
+            return encoding, bom
+    return None, b''
+
+
+def detect_newline(content):
+    # 以第一个换行符为准：使用 \r\n 的页面插入的代码同样使用 \r\n
+    index = content.find(b'\n' if not isinstance(content, str) else '\n')
+    if index > 0 and content[index - 1:index] in (b'\r', '\r'):
+        return '\r\n'
+    return '\n'
+
+
+def insert_encoding(buffer):
+    # 向 ASCII 兼容的页面插入非 ASCII 代码时使用的编码：页面声明的 charset，其次是合法的 UTF-8；
+    # 无法确定时返回 None
+    match = CHARSET_PATTERN.search(buffer[:CHARSET_WINDOW])
+    if match:
+        try:
+            name = codecs.lookup(match.group(1).decode('ascii')).name
+            # 与页面实际字节不符的声明（如 ASCII 页面声明 utf-16）不予采用
+            if '<a>'.encode(name) == b'<a>':
+                return name
+        except LookupError:
+            pass
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for position in range(0, len(buffer), COPY_CHUNK_SIZE):
+            decoder.decode(buffer[position:position + COPY_CHUNK_SIZE])
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return None
+    return 'utf-8'
+
+
+def snippet_encoding(content, ascii_codes):
+    # bytes 页面中查找和插入代码片段使用的编码；代码都是 ASCII 时与页面编码无关，
+    # str 页面或无法确定编码时返回 None
+    if isinstance(content, str):
+        return None
+    return 'utf-8' if ascii_codes else insert_encoding(content)
+
+
+def diff_text(data, encoding=None, bom=b''):
+    # 差异中使用的文本：ASCII 兼容的页面按 UTF-8 解码，无法解码的字节以 surrogateescape 保留，
+    # 补丁按同样方式写出后与磁盘上的字节完全一致
+    if encoding is None:
+        return data.decode('utf-8', 'surrogateescape')
+    return data[len(bom):].decode(encoding, 'replace')
+
+
+def _splice(content, edits):
+    # 与 _write_with_edits 相同的修改列表，在内存中的 str 或 bytes 上一次性拼接
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(content[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(content[position:])
+    return content[:0].join(parts)
+
+
+def _write_with_edits(buffer, edits, out, digest=None):
+    # edits: 按位置排序、互不重叠的 (start, end, replacement)；其余部分按块从 buffer 原样复制
+    position = 0
+    for start, end, replacement in edits + [(len(buffer), len(buffer), b'')]:
+        while position < start:
+            chunk = buffer[position:min(start, position + COPY_CHUNK_SIZE)]
+            out.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            position += len(chunk)
+        if replacement:
+            out.write(replacement)
+            if digest is not None:
+                digest.update(replacement)
+        position = end
+
+
+def _temp_path_for(file_path):
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+
+
+def fsync_path(path):
+    # 临时文件此时已恢复原页面的权限，只读页面以写方式打开会失败；fsync 只需要只读描述符
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(directory):
+    # Windows 不支持对目录 fsync
+    if os.name == 'nt':
+        return
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_paths(paths):
+    # 只同步本批写入的文件；os.sync() 会刷新整台机器上所有文件系统的缓存
+    for path in dict.fromkeys(paths):
+        fsync_path(path)
+
+
+def atomic_write(file_path, data, fsync=True, fsync_dir=False):
+    temp_path = _temp_path_for(file_path)
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if fsync_dir:
+        fsync_directory(os.path.dirname(file_path))
+
+
+def manifest_path_for(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), MANIFEST_NAME)
+
+
+class Manifest:
+    # 记录每个文件最后一次成功处理后的状态：大小、mtime、内容哈希和所应用操作的哈希
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get("entries", {})
+            except Exception as e:
+                print(f"Error loading manifest {self.manifest_path}: {e}")
+                self.entries = {}
+        return self
+
+    def update(self, key, entry):
+        self.entries[key] = entry
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = json.dumps({"version": 1, "entries": self.entries}, separators=(',', ':'))
+        atomic_write(self.manifest_path, data.encode('utf-8'))
+        self.dirty = False
+
+
+def version_cache_path_for(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), VERSION_CACHE_NAME)
+
+
+def script_version(js_file_path, cache_path=None):
+    # 流式计算脚本内容哈希作为版本号；大小与 mtime 未变时直接使用缓存结果
+    stat = os.stat(js_file_path)
+    cache = Manifest(cache_path).load() if cache_path else None
+    key = os.path.abspath(js_file_path)
+    if cache is not None:
+        entry = cache.entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["version"]
+    version = file_hash(js_file_path)[:VERSION_LENGTH]
+    if cache is not None:
+        cache.update(key, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "version": version})
+        cache.save()
+    return version
+
+
+def resolve_version(config, config_path):
+    # 返回 None 表示沿用时间戳版本号；相对路径以配置文件所在目录为基准
+    if config["version_source"] != "content":
+        return None
+    if not config["js_file_path"]:
+        raise ValueError("Content versioning requires js_file_path")
+    js_file_path = os.path.join(os.path.dirname(os.path.abspath(config_path)), config["js_file_path"])
+    return script_version(js_file_path, version_cache_path_for(config_path))
+
+
+def new_run_id():
+    # 按名称排序即按开始时间排序（备份淘汰与最近一次日志都依赖这一点），同一秒内的运行以微秒区分
+    now = time.time()
+    return time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now % 1 * 1000000):06d}-" + \
+        uuid.uuid4().hex[:6]
+
+
+def create_backup(config, config_path):
+    if config["backup"] == "bak":
+        return BakBackup()
+    if config["backup"] == "store":
+        return BackupStore(backup_dir_for(config_path), int(config["backup_compression"]),
+                           int(config["backup_keep_runs"]), int(config["backup_max_mb"]) * 1024 * 1024)
+    return None
+
+
+def journal_dir_for(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), JOURNAL_DIR_NAME)
+
+
+class Journal:
+    # 每次运行一个 JSON Lines 文件，工作进程/线程以追加方式写入 commit/done 记录
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.run_id = os.path.splitext(os.path.basename(journal_path))[0]
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"journal_path": self.journal_path, "run_id": self.run_id}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, journal_dir, run_id, **info):
+        os.makedirs(journal_dir, exist_ok=True)
+        journal = cls(os.path.join(journal_dir, run_id + ".jsonl"))
+        journal.append([dict(info, event="begin", run=run_id, time=time.time())], sync=True)
+        return journal
+
+    def append(self, records, sync=False):
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        with self._lock:
+            if self._fd is None:
+                flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+                self._fd = os.open(self.journal_path, flags, 0o644)
+            fd = self._fd
+        os.write(fd, data)
+        if sync:
+            os.fsync(fd)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def read(self):
+        records = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时最后一行可能不完整
+                    break
+        return records
+
+    def state(self):
+        # checked 为检查过但无需修改的文件，恢复运行时与 done 一起跳过
+        state = {"begin": None, "committed": {}, "done": set(), "checked": set(), "end": None,
+                 "rolled_back": False}
+        for record in self.read():
+            event = record.get("event")
+            if event == "begin":
+                state["begin"] = record
+            elif event == "commit":
+                state["committed"][record["path"]] = record["backup"]
+            elif event == "done":
+                state["done"].add(record["path"])
+            elif event == "checked":
+                state["checked"].update(record["paths"])
+            elif event == "end":
+                state["end"] = record
+            elif event == "rolled_back":
+                state["rolled_back"] = True
+        return state
+
+
+def journal_status(state):
+    if state["rolled_back"]:
+        return "rolled back"
+    if state["end"] is not None:
+        return state["end"]["status"]
+    return "interrupted"
+
+
+def list_journals(journal_dir):
+    if not os.path.isdir(journal_dir):
+        return []
+    names = sorted(name for name in os.listdir(journal_dir) if name.endswith(".jsonl"))
+    return [Journal(os.path.join(journal_dir, name)) for name in names]
+
+
+def find_journal(journal_dir, run_id=None):
+    journals = list_journals(journal_dir)
+    if run_id is None:
+        return journals[-1] if journals else None
+    for journal in journals:
+        if journal.run_id == run_id:
+            return journal
+    return None
+
+
+def start_journal(journal_dir, processor, targets):
+    return Journal.create(journal_dir, processor.run_id, mode=processor.mode,
+                          font_awesome_code=processor.font_awesome_code, js_code=processor.js_code,
+                          pipeline=processor.pipeline, common_timestamp=processor.common_timestamp,
+                          version=processor.hash_value, assets=processor.assets,
+                          targets=list(targets))
+
+
+def prepare_resume(journal, store=None):
+    # 已提交但未记录完成的文件可能处于任意状态，先从备份恢复再重新处理；
+    # 没有备份时（"backup": "none"）替换是原子的，文件要么是原内容要么已修改完成，重新处理即可校验
+    state = journal.state()
+    if state["begin"] is None:
+        raise ValueError(f"Journal {journal.run_id} has no begin record")
+    if state["rolled_back"]:
+        raise ValueError(f"Run {journal.run_id} has been rolled back")
+    for file_path, backup_ref in state["committed"].items():
+        if file_path not in state["done"] and backup_ref is not None:
+            restore_file(file_path, backup_ref, store)
+    journal.append([{"event": "resume", "time": time.time()}], sync=True)
+    return state
+
+
+def remaining_targets(state):
+    # 断点续跑：重新展开原始目标，跳过已完成或已检查的文件
+    finished = state["done"] | state["checked"]
+    return (path for path in expand_targets(state["begin"]["targets"]) if os.path.abspath(path) not in finished)
+
+
+def restore_file(file_path, backup_ref, store=None, fsync=True):
+    if backup_ref is None:
+        raise ValueError(f"No backup recorded for {file_path}")
+    if backup_ref.startswith(STORE_PREFIX):
+        if store is None:
+            raise ValueError(f"Backup store required to restore {file_path}")
+        data = store.load(backup_ref)
+    else:
+        data = BakBackup().load(backup_ref)
+    atomic_write(file_path, data, fsync=fsync, fsync_dir=fsync)
+    try:
+        refresh_siblings(file_path, data)
+    except Exception as e:
+        print(f"Error refreshing compressed copies of {file_path}: {e}")
+
+
+def restore_run(store, run_id, file_paths=None):
+    files = store.run_snapshot(run_id)["files"]
+    if file_paths is not None:
+        wanted = {os.path.abspath(path) for path in file_paths}
+        files = {path: digest for path, digest in files.items() if path in wanted}
+    restored = 0
+    failed = []
+    for file_path, digest in files.items():
+        try:
+            restore_file(file_path, STORE_PREFIX + digest, store)
+            restored += 1
+        except Exception as e:
+            print(f"Error restoring {file_path}: {e}")
+            failed.append(file_path)
+    return restored, failed
+
+
+def rollback_journal(journal, store=None):
+    state = journal.state()
+    restored = 0
+    failed = []
+    for file_path, backup_ref in reversed(list(state["committed"].items())):
+        try:
+            restore_file(file_path, backup_ref, store)
+            restored += 1
+        except Exception as e:
+            print(f"Error restoring {file_path}: {e}")
+            failed.append(file_path)
+    journal.append([{"event": "rolled_back", "restored": restored, "failed": len(failed), "time": time.time()}],
+                   sync=True)
+    journal.close()
+    return restored, failed
+
+
+def error_category(error):
+    if isinstance(error, UnicodeDecodeError):
+        return "decode"
+    if isinstance(error, UnicodeError):
+        return "encoding"
+    if isinstance(error, PermissionError):
+        return "permission"
+    if isinstance(error, FileNotFoundError):
+        return "not_found"
+    if isinstance(error, OSError):
+        return "io"
+    return "other"
+
+
+class StageTimer:
+    # 把相邻两次 mark 之间的耗时累加到对应阶段
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+class RunControl:
+    # 运行控制：暂停与取消都在文件之间生效，正在处理的文件会先完成并提交。
+    # 使用进程间共享的事件，进程池的工作进程同样逐文件检查
+    def __init__(self):
+        self._running = multiprocessing.Event()
+        self._running.set()
+        self._cancelled = multiprocessing.Event()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()
+
+    def wait(self):
+        # 暂停时阻塞；返回 False 表示已取消，不应再开始新的文件
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+
+class FileResult:
+    __slots__ = ("path", "status", "entry", "backup", "pending", "siblings", "timings", "bytes_in", "bytes_out", "error",
+                 "diff")
+
+    def __init__(self, path, status=STATUS_SUCCESS, entry=None):
+        self.path = path
+        self.status = status
+        self.entry = entry
+        self.backup = None
+        # 已写入临时文件、等待提交时为 (temp_path, digest)
+        self.pending = None
+        # 与页面一起提交的预压缩兄弟文件 [(临时路径, 后缀)]
+        self.siblings = []
+        # 各阶段耗时（秒）：read/transform/backup/write/compress/commit
+        self.timings = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # 失败时为 (category, message)
+        self.error = None
+        # 预演模式下将要写入的修改（统一差异格式）
+        self.diff = None
+
+    def finish(self, status, entry=None):
+        self.status = status
+        self.entry = entry
+        return self
+
+    def fail(self, category, message=""):
+        self.status = STATUS_FAILED
+        self.error = (category, message)
+        return self
+
+    @property
+    def success(self):
+        return self.status != STATUS_FAILED
+
+    def __bool__(self):
+        return self.success
+
+
+class FileProcessor:
+    def __init__(self, font_awesome_code, js_code, mode, common_timestamp=None, manifest=None,
+                 write_only_on_change=True, journal=None, fsync="batch", fsync_dir=False, backup=None,
+                 run_id=None, pipeline=None, large_file_threshold=16 * 1024 * 1024, dry_run=False, version=None,
+                 precompress=None, assets=None, precompress_create=False):
+        self.font_awesome_code = font_awesome_code
+        self.js_code = js_code
+        self.mode = mode
+        self.common_timestamp = time.time() if common_timestamp is None else common_timestamp
+        # 指定 version 时（如脚本内容哈希）不再由时间戳生成版本号
+        self.hash_value = version or hashlib.md5(str(self.common_timestamp).encode()).hexdigest()[:VERSION_LENGTH]
+        # 除 CRCMenu.js 外需要更新版本号的资源 {小写文件名: 版本号}；为空时只更新 CRCMenu.js
+        self.assets = normalize_assets(assets)
+        # manifest 为 None 时关闭增量处理
+        self.manifest = manifest
+        self.write_only_on_change = write_only_on_change
+        self.journal = journal
+        self.fsync = fsync
+        self.fsync_dir = fsync_dir
+        self.backup = backup
+        # 超过该大小（字节）的文件使用 mmap 流式处理，0 表示关闭
+        self.large_file_threshold = large_file_threshold
+        # 预演：只在内存中计算修改并生成差异，不备份也不写入任何文件
+        self.dry_run = dry_run
+        # 写入后为修改过的页面重新生成的预压缩文件 [(编码, 级别, 后缀)]，如 page.html.gz
+        self.precompress = parse_codecs(precompress)
+        # 为还没有预压缩文件的页面新建副本；默认只更新已有的副本
+        self.precompress_create = precompress_create
+        self.run_id = run_id or new_run_id()
+        # 组合模式下按顺序在内存中应用每个步骤，只读写一次文件
+        self.pipeline = None
+        self.steps = []
+        if mode == PIPELINE_MODE:
+            self.pipeline = normalize_pipeline(pipeline or [], font_awesome_code, js_code)
+            if not self.pipeline:
+                raise ValueError("Pipeline mode requires at least one operation")
+            self.steps = [FileProcessor(step["font_awesome_code"], step["js_code"], step["op"], self.common_timestamp,
+                                        version=self.hash_value, assets=self.assets)
+                          for step in self.pipeline]
+        self.operation_key = self._operation_key()
+        # 每次运行只构建一次的替换串与插入片段
+        self._js_replacement = r'\1?v=' + self.hash_value + r'\2>'
+        self._js_replacement_bytes = self._js_replacement.encode('ascii')
+        self._hash_bytes = self.hash_value.encode('ascii')
+        # CRCMenu.js 未单独配置时使用本次运行的版本号
+        self._asset_versions = {}
+        if self.assets:
+            self._asset_versions = {"crcmenu.js": self.hash_value}
+            self._asset_versions.update((name, version or self.hash_value) for name, version in self.assets.items())
+        self._asset_versions_bytes = {name.encode('utf-8'): version.encode('utf-8')
+                                      for name, version in self._asset_versions.items()}
+        # 两段代码都是 ASCII 时插入的字节与页面编码无关
+        self._ascii_codes = (font_awesome_code + js_code).isascii()
+        # {(编码, 换行符): (Font Awesome 插入片段, JS 插入片段)}，编码为 None 时是 str
+        self._inserts = {}
+        # 注入/删除时定位真正的 </head>、</body> 与已有引用，跳过注释、脚本和 PHP 代码块；
+        # 按页面的换行符分别编译，精确匹配的片段在 \r\n 页面中同样能找到
+        self._locators = {'\n': SnippetLocator(font_awesome_code, js_code)}
+
+    def _operation_key(self):
+        operation = [self.mode, self.font_awesome_code, self.js_code]
+        if self.pipeline is not None:
+            operation.append(self.pipeline)
+        if self.mode == "update" or any(step["op"] == "update" for step in self.pipeline or []):
+            operation.append(self.hash_value)
+            if self.assets:
+                operation.append(self.assets)
+        return content_hash(json.dumps(operation))
+
+    def _manifest_entry(self, file_path, digest):
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest, "op": self.operation_key}
+
+    def process_file(self, file_path):
+        return self.process_files([file_path])[0]
+
+    def process_files(self, file_paths, control=None):
+        # 取消后只返回已处理的文件，未开始的文件不出现在结果中
+        if self.fsync != "batch":
+            results = []
+            for file_path in file_paths:
+                if control is not None and not control.wait():
+                    break
+                result = self._prepare_file(file_path)
+                if result.pending is not None:
+                    self._commit([result])
+                results.append(result)
+            return results
+
+        results = []
+        for file_path in file_paths:
+            if control is not None and not control.wait():
+                break
+            results.append(self._prepare_file(file_path))
+        pending = [result for result in results if result.pending is not None]
+        if pending:
+            self._commit(pending)
+        return results
+
+    def _prepare_file(self, file_path):
+        result = FileResult(file_path)
+        timer = StageTimer(result.timings)
+        temp_path = None
+        try:
+            entry = None
+            if self.manifest is not None:
+                entry = self.manifest.get(os.path.abspath(file_path))
+                if entry is not None and entry.get("op") != self.operation_key:
+                    entry = None
+            if entry is not None:
+                stat = os.stat(file_path)
+                if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+                    timer.mark("read")
+                    return result.finish(STATUS_UNCHANGED)
+
+            if archive_format(file_path) is not None:
+                return self._prepare_archive(result, entry, timer)
+
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                result.bytes_in = size
+                if self.large_file_threshold and size >= self.large_file_threshold:
+                    # UTF-16/32 页面无法按字节定位标签，仍整体读入解码处理
+                    if wide_encoding(f.read(4))[0] is None:
+                        return self._prepare_large_file(result, entry, timer)
+                    f.seek(0)
+                raw = f.read()
+            timer.mark("read")
+
+            if entry is not None and hashlib.sha1(raw).hexdigest() == entry["hash"]:
+                timer.mark("transform")
+                return result.finish(STATUS_UNCHANGED, self._manifest_entry(file_path, entry["hash"]))
+
+            data = self.transform_bytes(raw)
+            timer.mark("transform")
+            if data is None:
+                return result.fail("no_body_tag", "</body> not found")
+
+            # 比较会先比较长度，内容相同时才逐字节比较，无需额外计算哈希
+            if (self.write_only_on_change or self.dry_run) and data == raw:
+                if self.manifest is None:
+                    return result.finish(STATUS_UNCHANGED)
+                return result.finish(STATUS_UNCHANGED, self._manifest_entry(file_path, hashlib.sha1(raw).hexdigest()))
+
+            if self.dry_run:
+                result.diff = self._diff(file_path, raw, data)
+                result.bytes_out = len(data)
+                timer.mark("transform")
+                return result
+
+            sync_each = self.fsync == "file"
+            result.backup = self.backup.save(file_path, raw) if self.backup is not None else None
+            timer.mark("backup")
+
+            # 先写入同目录下的临时文件，提交时再用 os.replace 原子替换
+            temp_path = _temp_path_for(file_path)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                if sync_each:
+                    os.fsync(f.fileno())
+            result.bytes_out = len(data)
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+            timer.mark("write")
+            codecs = sibling_codecs(file_path, self.precompress, self.precompress_create) if self.precompress else None
+            if codecs:
+                result.siblings = write_siblings(data, codecs, temp_path)
+                timer.mark("compress")
+            result.pending = (temp_path, hashlib.sha1(data).hexdigest() if self.manifest is not None else None)
+            return result
+
+        except Exception as e:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return result.fail(error_category(e), str(e))
+
+    def _diff(self, label, raw, data):
+        encoding, bom = wide_encoding(raw)
+        return unified_diff(label, diff_text(raw, encoding, bom), diff_text(data, encoding, bom))
+
+    def _prepare_archive(self, result, entry, timer):
+        # zip/tar 归档整体作为一个文件：匹配的成员逐个修改后写出新的归档，再与普通文件一样原子替换。
+        # 有成员无法处理时整个归档失败，保持不变
+        file_path = result.path
+        result.bytes_in = os.path.getsize(file_path)
+        if entry is not None and file_hash(file_path) == entry["hash"]:
+            timer.mark("read")
+            return result.finish(STATUS_UNCHANGED, self._manifest_entry(file_path, entry["hash"]))
+
+        diffs = []
+        errors = {}
+
+        def transform(name, data):
+            try:
+                new_data = self.transform_bytes(data)
+            except Exception as e:
+                errors[name] = error_category(e)
+                return None
+            if new_data is None:
+                errors[name] = "no_body_tag"
+            elif self.dry_run and new_data != data:
+                diffs.append(self._diff(os.path.join(file_path, name), data, new_data))
+            return new_data
+
+        temp_path = None if self.dry_run else _temp_path_for(file_path)
+        try:
+            archive = rewrite_archive(file_path, temp_path, transform, timestamp=self.common_timestamp)
+            timer.mark("transform")
+            if archive.failed:
+                names = ", ".join(f"{name} ({errors[name]})" for name in archive.failed[:5])
+                more = f" and {len(archive.failed) - 5} more" if len(archive.failed) > 5 else ""
+                return result.fail(errors[archive.failed[0]],
+                                   f"{len(archive.failed)} of {archive.members} members failed: {names}{more}")
+            if not archive.changed:
+                if self.manifest is None:
+                    return result.finish(STATUS_UNCHANGED)
+                return result.finish(STATUS_UNCHANGED, self._manifest_entry(file_path, file_hash(file_path)))
+            if self.dry_run:
+                result.diff = ''.join(diffs)
+                return result
+
+            if self.fsync == "file":
+                fsync_path(temp_path)
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+            result.bytes_out = os.path.getsize(temp_path)
+            timer.mark("write")
+            result.backup = self.backup.save_path(file_path) if self.backup is not None else None
+            timer.mark("backup")
+            result.pending = (temp_path, file_hash(temp_path) if self.manifest is not None else None)
+            temp_path = None
+            return result
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _prepare_large_file(self, result, entry, timer):
+        # 大文件不整体读入内存：通过 mmap 定位需要修改的位置，再分块复制拼接到临时文件
+        file_path = result.path
+        if entry is not None and file_hash(file_path) == entry["hash"]:
+            timer.mark("read")
+            return result.finish(STATUS_UNCHANGED, self._manifest_entry(file_path, entry["hash"]))
+
+        if self.dry_run:
+            return self._preview_large_file(result, timer)
+
+        steps = self.steps if self.mode == PIPELINE_MODE else [self]
+        source_path = file_path
+        written = []
+        digest = None
+        try:
+            # 组合操作逐步处理：每一步读取上一步的输出，没有修改的步骤直接跳过
+            for index, step in enumerate(steps):
+                with open(source_path, 'rb') as f:
+                    buffer = b''
+                    if os.fstat(f.fileno()).st_size:
+                        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        edits = step._large_edits(buffer, detect_newline(buffer))
+                        timer.mark("transform")
+                        if edits is None:
+                            return result.fail("no_body_tag", "</body> not found")
+                        if not edits:
+                            continue
+                        target_path = f"{_temp_path_for(file_path)}.{index}"
+                        written.append(target_path)
+                        digest = hashlib.sha1()
+                        with open(target_path, 'wb') as out:
+                            _write_with_edits(buffer, edits, out, digest)
+                        timer.mark("write")
+                    finally:
+                        if isinstance(buffer, mmap.mmap):
+                            buffer.close()
+                source_path = target_path
+
+            if source_path == file_path:
+                if self.manifest is None:
+                    return result.finish(STATUS_UNCHANGED)
+                return result.finish(STATUS_UNCHANGED, self._manifest_entry(file_path, file_hash(file_path)))
+
+            temp_path = _temp_path_for(file_path)
+            os.replace(source_path, temp_path)
+            written[-1] = temp_path
+            if self.fsync == "file":
+                fsync_path(temp_path)
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+            result.bytes_out = os.path.getsize(temp_path)
+            timer.mark("write")
+            result.backup = self.backup.save_path(file_path) if self.backup is not None else None
+            timer.mark("backup")
+            codecs = sibling_codecs(file_path, self.precompress, self.precompress_create) if self.precompress else None
+            if codecs:
+                result.siblings = write_siblings(temp_path, codecs, temp_path)
+                timer.mark("compress")
+
+            result.pending = (temp_path, digest.hexdigest() if self.manifest is not None else None)
+            written.pop()
+            return result
+        finally:
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _preview_large_file(self, result, timer):
+        # 大文件预演与实际处理一样按字节修改；单一操作只解码修改位置附近的行来生成差异
+        if self.mode == PIPELINE_MODE:
+            return self._preview_large_pipeline(result, timer)
+        with open(result.path, 'rb') as f:
+            buffer = b''
+            if os.fstat(f.fileno()).st_size:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                edits = self._large_edits(buffer, detect_newline(buffer))
+                if edits is None:
+                    timer.mark("transform")
+                    return result.fail("no_body_tag", "</body> not found")
+                if edits:
+                    result.diff = region_diff(result.path, buffer, edits)
+                    result.bytes_out = len(buffer) + sum(len(replacement) - (end - start)
+                                                         for start, end, replacement in edits)
+            finally:
+                if isinstance(buffer, mmap.mmap):
+                    buffer.close()
+        timer.mark("transform")
+        return result if result.diff else result.finish(STATUS_UNCHANGED)
+
+    def _preview_large_pipeline(self, result, timer):
+        # 组合操作每一步都作用在上一步的结果上，只能在内存中逐步应用
+        with open(result.path, 'rb') as f:
+            original = data = f.read()
+        timer.mark("read")
+        newline = detect_newline(data)
+        for step in self.steps:
+            edits = step._large_edits(data, newline)
+            if edits is None:
+                timer.mark("transform")
+                return result.fail("no_body_tag", "</body> not found")
+            if edits:
+                out = io.BytesIO()
+                _write_with_edits(data, edits, out)
+                data = out.getvalue()
+        if data != original:
+            result.diff = unified_diff(result.path, diff_text(original), diff_text(data))
+            result.bytes_out = len(data)
+        timer.mark("transform")
+        return result if result.diff else result.finish(STATUS_UNCHANGED)
+
+    def _large_edits(self, buffer, newline='\n'):
+        # 返回按位置排序的修改列表；None 表示该文件无法处理
+        if self.mode == "update":
+            edits = []
+            if self._asset_versions:
+                for match in ASSET_PATTERN_BYTES.finditer(buffer):
+                    replacement = self._asset_replacement_bytes(match)
+                    if replacement != match.group(0):
+                        edits.append((match.start(), match.end(), replacement))
+                return edits
+            for match in JS_PATTERN_BYTES.finditer(buffer):
+                replacement = match.group(1) + b'?v=' + self._hash_bytes + match.group(2) + b'>'
+                if replacement != match.group(0):
+                    edits.append((match.start(), match.end(), replacement))
+            return edits
+        elif self.mode == "inject":
+            return self._inject_edits(buffer, newline)
+        elif self.mode == "delete":
+            return self._delete_edits(buffer, newline)
+        raise ValueError(f"Unknown mode: {self.mode}")
+
+    def _commit(self, results):
+        start = time.perf_counter()
+        # 备份必须先于替换落盘
+        if self.backup is not None:
+            self.backup.flush(sync=self.fsync == "file")
+        batch = results
+        if self.fsync == "batch":
+            results = self._sync_batch(results)
+
+        if self.journal is not None and results:
+            self.journal.append([{"event": "commit", "path": os.path.abspath(result.path), "backup": result.backup}
+                                 for result in results], sync=self.fsync != "none")
+
+        committed = []
+        directories = set()
+        for result in results:
+            temp_path, digest = result.pending
+            try:
+                os.replace(temp_path, result.path)
+                result.pending = None
+                if digest is not None:
+                    result.entry = self._manifest_entry(result.path, digest)
+                committed.append(result)
+                directories.add(os.path.dirname(os.path.abspath(result.path)))
+            except Exception as e:
+                self._abandon(result, e)
+                continue
+            # 预压缩文件可以随时重新生成，不参与 fsync；失败时页面已经提交，只报告错误
+            if result.siblings:
+                try:
+                    commit_siblings(result.path, result.siblings)
+                except Exception as e:
+                    discard_siblings(result.siblings)
+                    print(f"Error updating compressed copies of {result.path}: {e}")
+            result.siblings = []
+
+        # 重命名只有在目录落盘后才是持久的
+        if self.fsync_dir or self.fsync != "none":
+            for directory in directories:
+                fsync_directory(directory)
+
+        if self.journal is not None and committed:
+            self.journal.append([{"event": "done", "path": os.path.abspath(result.path)} for result in committed])
+
+        # 批量同步的耗时平摊到本批每个文件
+        elapsed = (time.perf_counter() - start) / len(batch)
+        for result in batch:
+            result.timings["commit"] = elapsed
+
+    def _sync_batch(self, results):
+        # 同步本批的临时文件与备份，返回可以提交的结果；同步失败的文件不替换，只将其标记为失败
+        store_error = None
+        if self.backup is not None:
+            try:
+                sync_paths(self.backup.paths())
+            except OSError as e:
+                store_error = e
+        synced = []
+        for result in results:
+            try:
+                # 备份存储没有落盘时，依赖它的文件都不能替换
+                if store_error is not None and result.backup is not None:
+                    raise store_error
+                paths = [result.pending[0]]
+                if result.backup and os.path.isfile(result.backup):
+                    paths.append(result.backup)
+                sync_paths(paths)
+                synced.append(result)
+            except OSError as e:
+                self._abandon(result, e)
+        return synced
+
+    def _abandon(self, result, error):
+        # 放弃提交：标记失败，删除临时文件与预压缩副本
+        temp_path = result.pending[0]
+        result.pending = None
+        result.fail(error_category(error), str(error))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        discard_siblings(result.siblings)
+        result.siblings = []
+
+    def transform_bytes(self, raw):
+        # 按原始字节修改整个文件：编码、BOM 与换行符都保持不变，只有 UTF-16/32 页面需要解码。
+        # 返回新的字节串，None 表示无法处理
+        encoding, bom = wide_encoding(raw)
+        content = raw if encoding is None else raw[len(bom):].decode(encoding)
+        new_content = self.transform(content, detect_newline(content))
+        if new_content is None or new_content is content:
+            return None if new_content is None else raw
+        return new_content if encoding is None else bom + new_content.encode(encoding)
+
+    def transform(self, content, newline='\n'):
+        # content 为 str 或 bytes；bytes 直接按字节修改，插入的代码使用页面的换行符
+        if self.mode == "update":
+            return self._update_version(content)
+        elif self.mode == "inject":
+            return self._inject_content(content, newline)
+        elif self.mode == "delete":
+            return self._delete_content(content, newline)
+        elif self.mode == PIPELINE_MODE:
+            for step in self.steps:
+                content = step.transform(content, newline)
+                if content is None:
+                    return None
+            return content
+        raise ValueError(f"Unknown mode: {self.mode}")
+
+    def _update_version(self, content):
+        if self._asset_versions:
+            if isinstance(content, str):
+                return ASSET_PATTERN.sub(self._asset_replacement, content)
+            return ASSET_PATTERN_BYTES.sub(self._asset_replacement_bytes, content)
+        if isinstance(content, str):
+            return JS_PATTERN.sub(self._js_replacement, content)
+        return JS_PATTERN_BYTES.sub(self._js_replacement_bytes, content)
+
+    def _asset_replacement(self, match):
+        # 不在版本表中的资源保持原样；与 JS_PATTERN 一致，以 CRCMenu.js 结尾的文件名（如 xx-CRCMenu.js）
+        # 未单独配置时使用 CRCMenu.js 的版本号
+        name = match.group(2).lower()
+        version = self._asset_versions.get(name)
+        if version is None and name.endswith("crcmenu.js"):
+            version = self._asset_versions["crcmenu.js"]
+        if version is None:
+            return match.group(0)
+        return match.group(1) + match.group(2) + '?v=' + version + match.group(3) + '>'
+
+    def _asset_replacement_bytes(self, match):
+        name = match.group(2).lower()
+        version = self._asset_versions_bytes.get(name)
+        if version is None and name.endswith(b"crcmenu.js"):
+            version = self._asset_versions_bytes[b"crcmenu.js"]
+        if version is None:
+            return match.group(0)
+        return match.group(1) + match.group(2) + b'?v=' + version + match.group(3) + b'>'
+
+    def _inject_content(self, content, newline='\n'):
+        edits = self._inject_edits(content, newline)
+        if edits is None:
+            return None
+        return _splice(content, edits) if edits else content
+
+    def _delete_content(self, content, newline='\n'):
+        edits = self._delete_edits(content, newline)
+        return _splice(content, edits) if edits else content
+
+    def _locator(self, newline):
+        locator = self._locators.get(newline)
+        if locator is None:
+            locator = self._locators[newline] = SnippetLocator(
+                *(code.replace('\r\n', '\n').replace('\n', newline) for code in (self.font_awesome_code, self.js_code)))
+        return locator
+
+    def _insert_codes(self, content, newline, encoding):
+        # 插入片段与页面的类型、换行符和编码一致；bytes 页面插入非 ASCII 代码时需要确定页面编码
+        if encoding is None and not isinstance(content, str):
+            raise UnicodeError("Cannot determine the page encoding to insert non-ASCII code, "
+                               "declare it with <meta charset>")
+        key = (encoding, newline)
+        inserts = self._inserts.get(key)
+        if inserts is None:
+            inserts = tuple(newline + code.replace('\r\n', '\n').replace('\n', newline) + newline
+                            for code in (self.font_awesome_code, self.js_code))
+            if encoding is not None:
+                inserts = tuple(insert.encode(encoding) for insert in inserts)
+            self._inserts[key] = inserts
+        return inserts
+
+    def _inject_edits(self, content, newline='\n'):
+        # 已经引入的代码不再重复注入；需要注入 JS 但没有真正的 </body> 时返回 None。
+        # 按插入时使用的编码查找已有代码，非 UTF-8 页面中插入过的片段同样能找到
+        encoding = snippet_encoding(content, self._ascii_codes)
+        layout = self._locator(newline).locate(content, encoding)
+        inject_js = self.js_code and not layout.present[1]
+        if inject_js and layout.body_close == -1:
+            return None
+        inject_font_awesome = self.font_awesome_code and not layout.present[0] and layout.head_close != -1
+        if not inject_js and not inject_font_awesome:
+            return []
+        font_awesome_insert, js_insert = self._insert_codes(content, newline, encoding)
+        edits = []
+        if inject_js:
+            edits.append((layout.body_close, layout.body_close, js_insert))
+        if inject_font_awesome:
+            edits.append((layout.head_close, layout.head_close, font_awesome_insert))
+        return sorted(edits, key=lambda edit: edit[0])
+
+    def _delete_edits(self, content, newline='\n'):
+        layout = self._locator(newline).locate(content, snippet_encoding(content, self._ascii_codes))
+        empty = content[:0]
+        return sorted((start, end, empty) for spans in layout.spans for start, end in spans)
+
+
+def resolve_workers(workers):
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+# 进程池中每个工作进程只接收一次 processor 与运行控制，之后只传递路径
+_worker_processor = None
+_worker_control = None
+
+
+def _init_worker(processor, control=None):
+    global _worker_processor, _worker_control
+    _worker_processor = processor
+    _worker_control = control
+    # Ctrl+C 由主进程处理：取消后等在途分块完成，工作进程不能被中途打断
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _process_chunk(paths, processor=None, control=None):
+    processor = processor or _worker_processor
+    control = control or _worker_control
+    return list(zip(paths, processor.process_files(paths, control)))
+
+
+def _controlled(file_paths, control):
+    for file_path in file_paths:
+        if not control.wait():
+            return
+        yield file_path
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_process(processor, file_paths, workers=0, executor="thread", chunk_size=None, control=None):
+    # 按完成顺序产出 (file_path, result)；路径惰性读取且在途分块数量有上限，
+    # 因此 file_paths 可以是仍在生成中的迭代器。
+    # control 在各种执行方式下都由处理分块的线程或工作进程逐文件检查
+    workers = resolve_workers(workers)
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}")
+    if chunk_size is None:
+        chunk_size = 32 if executor == "process" or processor.fsync == "batch" else 4
+
+    if workers == 1:
+        if control is not None:
+            file_paths = _controlled(file_paths, control)
+        for chunk in _chunks(file_paths, chunk_size):
+            for item in _process_chunk(chunk, processor, control):
+                yield item
+        return
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(processor, control))
+        submit_chunk = lambda chunk: pool.submit(_process_chunk, chunk)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        submit_chunk = lambda chunk: pool.submit(partial(_process_chunk, processor=processor, control=control),
+                                                 chunk)
+
+    max_in_flight = workers * 2
+    chunks = _chunks(file_paths, chunk_size)
+    pending = set()
+    try:
+        exhausted = False
+        while pending or not exhausted:
+            # 暂停时不再提交新的分块，已完成的分块照常产出，日志与检查点不会被推迟
+            while (not exhausted and len(pending) < max_in_flight and
+                   (control is None or not (control.paused or control.cancelled))):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.add(submit_chunk(chunk))
+            if not pending:
+                if exhausted:
+                    break
+                # 暂停且没有在途分块：等待继续；取消后不再读取路径
+                if not control.wait():
+                    exhausted = True
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if control is not None and control.cancelled:
+                # 尚未开始的分块直接撤销，已在运行的分块处理完当前文件即停止，已处理的结果照常产出
+                for future in pending:
+                    future.cancel()
+                exhausted = True
+            for future in done:
+                if future.cancelled():
+                    continue
+                for item in future.result():
+                    yield item
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+def run_batch(processor, file_paths, workers=0, executor="process", manifest=None, stats=None, control=None):
+    # 在 iter_process 之上维护 manifest、备份快照、日志与统计；提前中断时日志记录为 interrupted，
+    # 取消时记录为 cancelled，之后都可以从日志恢复
+    status = "interrupted"
+    store = processor.backup if isinstance(processor.backup, BackupStore) else None
+    snapshot = {}
+    checked = []
+    if store is not None:
+        store.begin_run(processor.run_id)
+    try:
+        for file_path, result in iter_process(processor, file_paths, workers, executor, control=control):
+            if manifest is not None and result.entry is not None:
+                manifest.update(os.path.abspath(file_path), result.entry)
+            if store is not None and result.backup is not None and result.status == STATUS_SUCCESS:
+                snapshot[os.path.abspath(file_path)] = result.backup[len(STORE_PREFIX):]
+            if processor.journal is not None and result.status == STATUS_UNCHANGED:
+                checked.append(os.path.abspath(file_path))
+                if len(checked) >= CHECKED_BATCH:
+                    processor.journal.append([{"event": "checked", "paths": checked}])
+                    checked = []
+            if stats is not None:
+                stats.add(result)
+            yield file_path, result
+        status = "cancelled" if control is not None and control.cancelled else "completed"
+    finally:
+        if stats is not None:
+            stats.finish()
+        if store is not None:
+            try:
+                store.close()
+                if snapshot:
+                    store.record_run(processor.run_id, snapshot, {"mode": processor.mode, "status": status})
+                store.evict()
+            except Exception as e:
+                print(f"Error finishing backup run: {e}")
+        if manifest is not None:
+            try:
+                manifest.save()
+            except Exception as e:
+                print(f"Error saving manifest: {e}")
+        if processor.journal is not None:
+            records = [{"event": "checked", "paths": checked}] if checked else []
+            records.append({"event": "end", "status": status, "time": time.time()})
+            processor.journal.append(records, sync=True)
+            processor.journal.close()
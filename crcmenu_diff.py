@@ -0,0 +1,188 @@
+import difflib
+import os
+
+DIFF_CONTEXT = 3
+# 大文件统计行号时按块读取 mmap，避免整体复制
+COUNT_CHUNK_SIZE = 1024 * 1024
+NO_NEWLINE = "\n\\ No newline at end of file\n"
+
+
+def diff_label(path):
+    # 补丁中的文件名：当前目录下的文件使用相对路径，便于 patch -p0 直接应用
+    try:
+        relative = os.path.relpath(path)
+    except ValueError:
+        return path.replace(os.sep, '/')
+    if relative.startswith('..'):
+        return path.replace(os.sep, '/')
+    return relative.replace(os.sep, '/')
+
+
+def _format_range(start, stop, offset):
+    # 与 difflib 相同的统一差异行号格式
+    beginning = start + 1 + offset
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _opcodes(old_lines, new_lines):
+    # 相同的首尾行直接作为 equal，只对中间变化的部分运行 SequenceMatcher
+    limit = min(len(old_lines), len(new_lines))
+    prefix = 0
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    old_end = len(old_lines) - suffix
+    new_end = len(new_lines) - suffix
+    codes = [("equal", 0, prefix, 0, prefix)] if prefix else []
+    if prefix < old_end or prefix < new_end:
+        matcher = difflib.SequenceMatcher(None, old_lines[prefix:old_end], new_lines[prefix:new_end])
+        codes.extend((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix)
+                     for tag, i1, i2, j1, j2 in matcher.get_opcodes())
+    if suffix:
+        codes.append(("equal", old_end, len(old_lines), new_end, len(new_lines)))
+    return codes
+
+
+def _grouped(codes, context):
+    # 按 difflib.SequenceMatcher.get_grouped_opcodes 的方式把修改分成带上下文的块
+    if not codes:
+        return
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _line(prefix, line):
+    return prefix + line if line.endswith('\n') else prefix + line + NO_NEWLINE
+
+
+def _hunks(old_lines, new_lines, old_offset=0, new_offset=0, context=DIFF_CONTEXT):
+    for group in _grouped(_opcodes(old_lines, new_lines), context):
+        first, last = group[0], group[-1]
+        yield (f"@@ -{_format_range(first[1], last[2], old_offset)} "
+               f"+{_format_range(first[3], last[4], new_offset)} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in old_lines[i1:i2]:
+                    yield _line(' ', line)
+                continue
+            for line in old_lines[i1:i2]:
+                yield _line('-', line)
+            for line in new_lines[j1:j2]:
+                yield _line('+', line)
+
+
+def unified_diff(path, old, new, context=DIFF_CONTEXT):
+    # 返回单个文件的统一差异文本；内容相同时返回空字符串
+    hunks = ''.join(_hunks(old.splitlines(keepends=True), new.splitlines(keepends=True), context=context))
+    if not hunks:
+        return ''
+    label = diff_label(path)
+    return f"--- {label}\n+++ {label}\n{hunks}"
+
+
+def _count_newlines(buffer, start, end):
+    count = 0
+    for position in range(start, end, COUNT_CHUNK_SIZE):
+        count += buffer[position:min(position + COUNT_CHUNK_SIZE, end)].count(b'\n')
+    return count
+
+
+def _forward_lines(buffer, position, count):
+    for _ in range(count):
+        if position >= len(buffer):
+            break
+        line_end = buffer.find(b'\n', position)
+        position = len(buffer) if line_end == -1 else line_end + 1
+    return position
+
+
+def _region_lines(buffer, region_start, region_end, edits, encoding):
+    parts = []
+    position = region_start
+    for start, end, replacement in edits:
+        parts.append(buffer[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(buffer[position:region_end])
+    # 与 diff_text 一致：无法解码的字节以 surrogateescape 保留，补丁可还原原始字节
+    old = buffer[region_start:region_end].decode(encoding, 'surrogateescape')
+    new = b''.join(parts).decode(encoding, 'surrogateescape')
+    return old.splitlines(keepends=True), new.splitlines(keepends=True)
+
+
+def region_diff(path, buffer, edits, context=DIFF_CONTEXT, encoding='utf-8'):
+    # 大文件（mmap）的差异：只解码修改位置附近的行，相距不超过 2*context 行的修改合并为同一区域
+    regions = []
+    for start, end, replacement in edits:
+        line_start = buffer.rfind(b'\n', 0, start) + 1
+        line_end = buffer.find(b'\n', end)
+        line_end = len(buffer) if line_end == -1 else line_end + 1
+        if regions:
+            region = regions[-1]
+            if line_start < region[1]:
+                region[1] = max(region[1], line_end)
+                region[3].append((start, end, replacement))
+                continue
+            gap = _count_newlines(buffer, region[1], line_start)
+            if gap <= 2 * context:
+                region[1] = line_end
+                region[3].append((start, end, replacement))
+                continue
+            first_line = region[2] + _count_newlines(buffer, region[0], region[1]) + gap
+        else:
+            first_line = 1 + _count_newlines(buffer, 0, line_start)
+        regions.append([line_start, line_end, first_line, [(start, end, replacement)]])
+
+    hunks = []
+    # 前面区域增删的行数，用于计算新文件中的行号
+    delta = 0
+    index = 0
+    while index < len(regions):
+        region_start, region_end, first_line, region_edits = regions[index]
+        # 向前后各扩展 context 行作为上下文
+        for _ in range(context):
+            if region_start == 0:
+                break
+            region_start = buffer.rfind(b'\n', 0, region_start - 1) + 1
+            first_line -= 1
+        region_end = _forward_lines(buffer, region_end, context)
+        while True:
+            old_lines, new_lines = _region_lines(buffer, region_start, region_end, region_edits, encoding)
+            codes = _opcodes(old_lines, new_lines)
+            # 重复行可能让修改位置向后滑动，尾部上下文不足时继续向后扩展
+            tail = codes[-1][2] - codes[-1][1] if codes and codes[-1][0] == "equal" else 0
+            if tail >= context or region_end >= len(buffer):
+                break
+            region_end = _forward_lines(buffer, region_end, context - tail)
+            if index + 1 < len(regions) and _forward_lines(buffer, region_end, context) > regions[index + 1][0]:
+                following = regions.pop(index + 1)
+                region_end = max(region_end, following[1])
+                region_edits = region_edits + following[3]
+        hunks.extend(_hunks(old_lines, new_lines, first_line - 1, first_line - 1 + delta, context))
+        delta += len(new_lines) - len(old_lines)
+        index += 1
+    if not hunks:
+        return ''
+    label = diff_label(path)
+    return f"--- {label}\n+++ {label}\n" + ''.join(hunks)
@@ -0,0 +1,263 @@
+import re
+
+# 内容按原始文本处理的元素：其中出现的 </body> 等不是真正的标签
+RAW_TEXT_ELEMENTS = ("script", "style")
+# 引用外部资源的标签及其 URL 属性，用于判断脚本或样式是否已经引入
+REFERENCE_ATTRS = {"script": "src", "link": "href"}
+URL_ATTRS = ("src", "href")
+
+# 属性部分允许引号内出现 >；以下片段都写成“字符类连续匹配”的展开形式，避免逐字符尝试分支
+ATTRS = r'''[^'">]*(?:(?:"[^"]*"|'[^']*')[^'">]*)*'''
+COMMENT = r'!--[^-]*(?:-(?!->)[^-]*)*(?:-->)?'
+PHP = r'\?[^?]*(?:\?(?!>)[^?]*)*(?:\?>)?'
+RAW_BODY = r'[^<]*(?:<(?!/(?P=raw)\s*>)[^<]*)*'
+ATTR_PATTERN = re.compile(r'''([^\s"'<>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'<>`=]+)))?''')
+# 与 JS_PATTERN 一致：?v= 之后的部分都视为版本号
+VERSION_SUFFIX = re.compile(r'\?v=.*$', re.DOTALL)
+SNIPPET_TAG_NAME = r'[a-zA-Z][\w:.-]*'
+WHITESPACE = re.compile(r'\s')
+
+
+class _Syntax:
+    # 同一组正则分别编译为 str 与各页面编码的 bytes 版本，大文件模式可以直接在 mmap 上扫描。
+    # 注释、PHP 代码块与原始文本元素的内容由正则整体匹配跳过，未闭合时一直延续到文件末尾
+    def __init__(self, names, encoding=None, needles=None):
+        self.encoding = encoding
+        # 标签名（小写）到属性过滤正则的映射：值为 None 的标签全部计算标准化形式，不在其中的标签直接跳过。
+        # 无法用页面编码表示的值不会出现在页面中，全部无法表示时该标签不可能匹配
+        self.filters = {}
+        for name, values in (needles or {}).items():
+            if values is None:
+                self.filters[self.encode(name)] = None
+                continue
+            alternatives = []
+            for value in sorted(values):
+                try:
+                    alternatives.append(re.escape(self.encode(value)))
+                except UnicodeEncodeError:
+                    pass
+            self.filters[self.encode(name)] = re.compile(self.encode('|').join(alternatives) or self.encode('(?!)'))
+        self.head = self.encode("head")
+        self.body = self.encode("body")
+        raw = '|'.join(RAW_TEXT_ELEMENTS)
+        self.token = re.compile(self.encode(
+            r'<(?:' + COMMENT + '|' + PHP +
+            r'|(?P<raw>' + raw + r')\b(?P<raw_attrs>' + ATTRS + r')>(?P<body>' + RAW_BODY + r')(?:</(?P=raw)\s*>)?'
+            r'|(?P<close>/)?(?P<name>' + names + r')\b(?P<attrs>' + ATTRS + r')>)'), re.IGNORECASE)
+
+    def encode(self, text):
+        return text if self.encoding is None else text.encode(self.encoding)
+
+    def text(self, value):
+        return value if self.encoding is None else value.decode(self.encoding, 'replace')
+
+
+SNIPPET_SYNTAX = _Syntax(SNIPPET_TAG_NAME)
+
+
+def _snippet_tokens(code):
+    # 片段中注释、PHP 代码块之外的每个标签 (start, end, 标准化形式)，script/style 连同内容作为一个整体
+    for match in SNIPPET_SYNTAX.token.finditer(code):
+        raw, raw_attrs, body, close, name, attrs = match.groups()
+        if raw is not None:
+            yield match.start(), match.end(), _tag_key(False, raw.lower(), raw_attrs, body)
+        elif name is not None:
+            yield match.start(), match.end(), _tag_key(close is not None, name.lower(), attrs, None)
+
+
+def _normalize(text):
+    return ' '.join(text.split())
+
+
+def _tag_key(close, name, attrs, body):
+    # 标准化后的标签：属性名小写并排序，属性值与内容折叠空白，URL 忽略 ?v= 版本号
+    attributes = []
+    for match in ATTR_PATTERN.finditer(attrs):
+        attr = match.group(1).lower()
+        value = next((value for value in match.group(2, 3, 4) if value is not None), '')
+        if attr in URL_ATTRS:
+            value = VERSION_SUFFIX.sub('', value)
+        attributes.append((attr, _normalize(value)))
+    return close, name, tuple(sorted(attributes)), None if body is None else _normalize(body)
+
+
+def _reference(key):
+    close, name, attributes, body = key
+    attr = REFERENCE_ATTRS.get(name)
+    if close or attr is None:
+        return None
+    return dict(attributes).get(attr) or None
+
+
+def _key_needles(key):
+    # 片段标签中最长的无空白属性值与引用的 URL；没有可用的值时返回 None
+    values = [value for attr, value in key[2] if value and not WHITESPACE.search(value)]
+    if not values:
+        return None
+    needles = {max(values, key=len)}
+    url = _reference(key)
+    if url:
+        if WHITESPACE.search(url):
+            return None
+        needles.add(url)
+    return needles
+
+
+def _overlaps(start, end, spans):
+    return any(start < span_end and span_start < end for span_start, span_end in spans)
+
+
+class _Snippet:
+    def __init__(self, code):
+        self.code = code
+        # {页面编码: 编码后的片段}，无法用该编码表示时为 None
+        self._encoded = {}
+        self.keys = []
+        self.gaps = []
+        self.urls = set()
+        outside = []
+        position = None
+        for start, end, key in _snippet_tokens(code):
+            if position is None:
+                outside.append(code[:start])
+            else:
+                self.gaps.append(_normalize(code[position:start]))
+            self.keys.append(key)
+            url = _reference(key)
+            if url:
+                self.urls.add(url)
+            position = end
+        outside.append(code[position or 0:])
+        # 不含标签，或标签之外还有其他文本（如注释）时按原文精确匹配
+        self.exact = not self.keys or any(text.strip() for text in outside)
+
+    def encoded(self, encoding):
+        if encoding not in self._encoded:
+            try:
+                self._encoded[encoding] = self.code.encode(encoding)
+            except UnicodeEncodeError:
+                self._encoded[encoding] = None
+        return self._encoded[encoding]
+
+
+class Layout:
+    # 一次扫描的结果：最后一个真正的 </head>、</body> 位置（-1 表示不存在），
+    # 以及每段代码在文档中的出现位置和是否已经引入
+    __slots__ = ("head_close", "body_close", "spans", "present")
+
+    def __init__(self, head_close, body_close, spans, present):
+        self.head_close = head_close
+        self.body_close = body_close
+        self.spans = spans
+        self.present = present
+
+
+class SnippetLocator:
+    # 针对一组要注入/删除的代码片段编译扫描器；locate() 可用于 str、bytes 或 mmap，
+    # bytes 页面按页面编码比较片段，各编码的扫描器在第一次用到时编译
+    def __init__(self, *codes):
+        self.snippets = [_Snippet(code) if code else None for code in codes]
+        # 只为片段中出现的标签计算标准化形式；needles 为 None 的标签全部计算，
+        # 否则属性原文至少包含其中一个值才可能与片段匹配
+        needles = {}
+        unfiltered = set()
+        for snippet in self.snippets:
+            if snippet is None or snippet.exact:
+                continue
+            for key in snippet.keys:
+                values = _key_needles(key)
+                if values is None:
+                    unfiltered.add(key[1])
+                needles[key[1]] = needles.get(key[1], set()) | (values or set())
+        needles.update(dict.fromkeys(unfiltered))
+        names = set(needles) | {"head", "body"}
+        self._pattern = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        self._needles = needles
+        self._syntax = {None: _Syntax(self._pattern, needles=needles)}
+
+    def _syntax_for(self, encoding):
+        syntax = self._syntax.get(encoding)
+        if syntax is None:
+            syntax = self._syntax[encoding] = _Syntax(self._pattern, encoding, self._needles)
+        return syntax
+
+    def locate(self, content, encoding=None):
+        # encoding 为 bytes 页面的编码（须与 ASCII 兼容），默认 UTF-8；str 页面忽略
+        binary = not isinstance(content, str)
+        encoding = (encoding or 'utf-8') if binary else None
+        syntax = self._syntax_for(encoding)
+        filters = syntax.filters
+        head_close = body_close = -1
+        tokens = []
+        urls = set()
+        # 与 _snippet_tokens 相同的扫描，先按标签名与属性原文过滤，只为可能匹配的标签计算标准化形式
+        for match in syntax.token.finditer(content):
+            raw, raw_attrs, body, close, name, attrs = match.groups()
+            if raw is not None:
+                name, attrs = raw.lower(), raw_attrs
+            elif name is None:
+                # 注释或 PHP 代码块
+                continue
+            else:
+                name = name.lower()
+                body = None
+                if close is not None:
+                    if name == syntax.head:
+                        head_close = match.start()
+                    elif name == syntax.body:
+                        body_close = match.start()
+            if name not in filters:
+                continue
+            candidates = filters[name]
+            if candidates is not None and candidates.search(attrs) is None:
+                continue
+            key = _tag_key(close is not None, syntax.text(name), syntax.text(attrs),
+                           None if body is None else syntax.text(body))
+            tokens.append((match.start(), match.end(), key))
+            url = _reference(key)
+            if url:
+                urls.add(url)
+
+        spans = []
+        present = []
+        taken = []
+        for snippet in self.snippets:
+            if snippet is None:
+                spans.append([])
+                present.append(False)
+                continue
+            if snippet.exact:
+                code = snippet.encoded(encoding) if binary else snippet.code
+                found = self._exact_spans(content, code) if code is not None else []
+            else:
+                found = self._token_spans(content, tokens, snippet, syntax)
+            # 多段代码重叠时只归属于先出现的一段
+            found = [(start, end) for start, end in found if not _overlaps(start, end, taken)]
+            taken.extend(found)
+            spans.append(found)
+            present.append(bool(found) or bool(snippet.urls) and snippet.urls <= urls)
+        return Layout(head_close, body_close, spans, present)
+
+    def _exact_spans(self, content, code):
+        found = []
+        index = content.find(code)
+        while index != -1:
+            found.append((index, index + len(code)))
+            index = content.find(code, index + len(code))
+        return found
+
+    def _token_spans(self, content, tokens, snippet, syntax):
+        # 标准化后的标签序列依次相同、且标签之间的文本折叠空白后相同即视为匹配
+        found = []
+        keys = snippet.keys
+        count = len(keys)
+        index = 0
+        while index + count <= len(tokens):
+            if (all(tokens[index + offset][2] == keys[offset] for offset in range(count)) and
+                    all(_normalize(syntax.text(content[tokens[index + offset - 1][1]:tokens[index + offset][0]])) ==
+                        snippet.gaps[offset - 1] for offset in range(1, count))):
+                found.append((tokens[index][0], tokens[index + count - 1][1]))
+                index += count
+            else:
+                index += 1
+        return found
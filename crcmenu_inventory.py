@@ -0,0 +1,220 @@
+import json
+import mmap
+import os
+import sqlite3
+import time
+
+from crcmenu_archive import archive_format
+from crcmenu_core import JS_PATTERN_BYTES, content_hash, error_category, expand_targets, iter_process, snippet_encoding
+from crcmenu_html import SnippetLocator
+
+INVENTORY_NAME = "CRCMenu-Manager_inventory.sqlite"
+SCAN_CHUNK_SIZE = 32
+# 每写入多少个页面提交一次事务
+COMMIT_BATCH = 1000
+# 可用于 missing/present 筛选的页面特征，与 pages 表的列同名
+FEATURES = ("js", "font_awesome", "head", "body")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS pages (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    scanned REAL,
+    head INTEGER,
+    body INTEGER,
+    font_awesome INTEGER,
+    js INTEGER,
+    includes INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS versions (path TEXT, version TEXT);
+CREATE INDEX IF NOT EXISTS versions_version ON versions (version);
+CREATE INDEX IF NOT EXISTS versions_path ON versions (path);
+"""
+
+
+def inventory_path_for(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), INVENTORY_NAME)
+
+
+class PageScanner:
+    # 只读扫描：记录页面是否有真正的 </head>、</body>，是否已引入两段代码，以及每个 CRCMenu.js 引用的版本号。
+    # 与 FileProcessor 一样提供 process_files，可以直接交给 iter_process 并行执行
+    def __init__(self, font_awesome_code, js_code, known=None, large_file_threshold=16 * 1024 * 1024):
+        self.locator = SnippetLocator(font_awesome_code, js_code)
+        self.ascii_codes = (font_awesome_code + js_code).isascii()
+        # {绝对路径: (size, mtime_ns)}，大小与 mtime 都未变化的文件不再读取
+        self.known = known or {}
+        self.large_file_threshold = large_file_threshold
+
+    def process_files(self, file_paths, control=None):
+        results = []
+        for file_path in file_paths:
+            if control is not None and not control.wait():
+                break
+            results.append(self.scan_file(file_path))
+        return results
+
+    def scan_file(self, file_path):
+        try:
+            stat = os.stat(file_path)
+            if self.known.get(os.path.abspath(file_path)) == (stat.st_size, stat.st_mtime_ns):
+                return {"status": "unchanged"}
+            with open(file_path, 'rb') as f:
+                if self.large_file_threshold and stat.st_size >= self.large_file_threshold:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    buffer = f.read()
+                try:
+                    page = self.scan_buffer(buffer)
+                finally:
+                    if isinstance(buffer, mmap.mmap):
+                        buffer.close()
+        except Exception as e:
+            return {"status": "failed", "error": f"{error_category(e)}: {e}"}
+        page.update(status="scanned", size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        return page
+
+    def scan_buffer(self, buffer):
+        layout = self.locator.locate(buffer, snippet_encoding(buffer, self.ascii_codes))
+        # 与 update 模式使用同一个 JS_PATTERN：两个分组之间是 ?v= 版本号，没有版本号时为空字符串
+        versions = [buffer[match.end(1):match.start(2)].decode('utf-8', 'replace')[len('?v='):]
+                    for match in JS_PATTERN_BYTES.finditer(buffer)]
+        return {
+            "head": layout.head_close != -1,
+            "body": layout.body_close != -1,
+            "font_awesome": layout.present[0],
+            "js": layout.present[1],
+            "includes": len(versions),
+            "versions": sorted(set(versions))
+        }
+
+
+class Inventory:
+    # 站点页面清单，保存在 SQLite 中；按大小与 mtime 增量更新，查询结果可直接作为文件列表处理
+    def __init__(self, inventory_path):
+        self.inventory_path = inventory_path
+        self.connection = sqlite3.connect(inventory_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def update(self, targets, font_awesome_code, js_code, workers=0, executor="thread", full=False,
+               large_file_threshold=16 * 1024 * 1024, control=None):
+        # 按完成顺序产出 (file_path, status)，status 为 scanned / unchanged / failed。
+        # 代码片段变化后全部重新扫描；完整扫描结束后删除不再属于目标的页面，取消时保留旧记录
+        snippets = content_hash(json.dumps([font_awesome_code, js_code]))
+        known = {}
+        if not full and self._meta("snippets") == snippets:
+            known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                     self.connection.execute("SELECT path, size, mtime_ns FROM pages WHERE error IS NULL")}
+        scanner = PageScanner(font_awesome_code, js_code, known, large_file_threshold)
+        seen = set()
+        written = 0
+        # 归档中的页面不编入清单
+        paths = (path for path in expand_targets(targets) if archive_format(path) is None)
+        try:
+            for file_path, page in iter_process(scanner, paths, workers, executor, SCAN_CHUNK_SIZE, control):
+                key = os.path.abspath(file_path)
+                seen.add(key)
+                if page["status"] != "unchanged":
+                    self._store(key, page)
+                    written += 1
+                    if written % COMMIT_BATCH == 0:
+                        self.connection.commit()
+                yield file_path, page["status"]
+            if control is None or not control.cancelled:
+                self._prune(seen)
+                self._set_meta("snippets", snippets)
+                self._set_meta("updated", str(time.time()))
+        finally:
+            self.connection.commit()
+
+    def _store(self, key, page):
+        connection = self.connection
+        connection.execute("DELETE FROM versions WHERE path = ?", (key,))
+        if page["status"] == "failed":
+            connection.execute("INSERT OR REPLACE INTO pages (path, scanned, error) VALUES (?, ?, ?)",
+                               (key, time.time(), page["error"]))
+            return
+        connection.execute(
+            "INSERT OR REPLACE INTO pages (path, size, mtime_ns, scanned, head, body, font_awesome, js, includes, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+            (key, page["size"], page["mtime_ns"], time.time(), page["head"], page["body"],
+             page["font_awesome"], page["js"], page["includes"]))
+        connection.executemany("INSERT INTO versions (path, version) VALUES (?, ?)",
+                               [(key, version) for version in page["versions"]])
+
+    def _prune(self, seen):
+        connection = self.connection
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+        connection.execute("DELETE FROM seen")
+        connection.executemany("INSERT OR IGNORE INTO seen (path) VALUES (?)", ((path,) for path in seen))
+        connection.execute("DELETE FROM versions WHERE path NOT IN (SELECT path FROM seen)")
+        connection.execute("DELETE FROM pages WHERE path NOT IN (SELECT path FROM seen)")
+        connection.execute("DELETE FROM seen")
+
+    def query(self, version=None, other_version=None, missing=(), present=(), duplicates=False, failed=False,
+              pattern=None):
+        # 各条件同时满足；version 为 "" 表示不带 ?v= 的引用，other_version 匹配引用了其他版本的页面
+        clauses = []
+        params = []
+        if version is not None:
+            clauses.append("path IN (SELECT path FROM versions WHERE version = ?)")
+            params.append(version)
+        if other_version is not None:
+            clauses.append("path IN (SELECT path FROM versions WHERE version != ?)")
+            params.append(other_version)
+        for feature in missing:
+            if feature not in FEATURES:
+                raise ValueError(f"Unknown feature: {feature}")
+            clauses.append(f"{feature} = 0")
+        for feature in present:
+            if feature not in FEATURES:
+                raise ValueError(f"Unknown feature: {feature}")
+            clauses.append(f"{feature} = 1")
+        if duplicates:
+            clauses.append("includes > 1")
+        if failed:
+            clauses.append("error IS NOT NULL")
+        if pattern:
+            clauses.append("path GLOB ?")
+            params.append(pattern)
+        sql = "SELECT path FROM pages"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return [row[0] for row in self.connection.execute(sql + " ORDER BY path", params)]
+
+    def summary(self):
+        connection = self.connection
+        pages, failed, duplicates = connection.execute(
+            "SELECT COUNT(*), COUNT(error), COALESCE(SUM(includes > 1), 0) FROM pages").fetchone()
+        missing = {feature: connection.execute(f"SELECT COUNT(*) FROM pages WHERE {feature} = 0").fetchone()[0]
+                   for feature in FEATURES}
+        versions = connection.execute("SELECT version, COUNT(DISTINCT path) FROM versions GROUP BY version "
+                                      "ORDER BY COUNT(DISTINCT path) DESC, version").fetchall()
+        updated = self._meta("updated")
+        return {
+            "pages": pages,
+            "failed": failed,
+            "duplicates": duplicates,
+            "missing": missing,
+            "versions": versions,
+            "updated": float(updated) if updated else None
+        }
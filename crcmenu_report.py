@@ -0,0 +1,127 @@
+import csv
+import heapq
+import json
+import os
+import time
+from collections import Counter
+
+from crcmenu_core import STATUS_SUCCESS, STATUS_UNCHANGED, STATUS_FAILED
+
+REPORT_DIR_NAME = "CRCMenu-Manager_reports"
+STAGES = ("read", "transform", "backup", "write", "compress", "commit")
+CSV_FIELDS = ("path", "status") + STAGES + ("total", "bytes_in", "bytes_out", "error_category", "error")
+
+
+def report_dir_for(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), REPORT_DIR_NAME)
+
+
+class RunStats:
+    # 汇总一次运行中每个文件的阶段耗时、字节数与错误分类，可随时读取实时数据，结束后导出 JSON/CSV
+    def __init__(self, run_id=None, mode=None, slowest=10):
+        self.run_id = run_id
+        self.mode = mode
+        self.slowest_count = slowest
+        self.started = time.time()
+        self.start = time.monotonic()
+        self.elapsed_final = None
+        self.counts = {STATUS_SUCCESS: 0, STATUS_UNCHANGED: 0, STATUS_FAILED: 0}
+        self.stage_totals = dict.fromkeys(STAGES, 0.0)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = Counter()
+        self.rows = []
+        self._slowest = []
+
+    def add(self, result):
+        total = sum(result.timings.values())
+        self.counts[result.status] += 1
+        for stage, seconds in result.timings.items():
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + seconds
+        self.bytes_in += result.bytes_in
+        self.bytes_out += result.bytes_out
+        category, message = result.error or ("", "")
+        if result.error is not None:
+            self.errors[category] += 1
+        self.rows.append((result.path, result.status) +
+                         tuple(round(result.timings.get(stage, 0.0), 6) for stage in STAGES) +
+                         (round(total, 6), result.bytes_in, result.bytes_out, category, message))
+        # 用小顶堆只保留最慢的 N 个文件
+        item = (total, len(self.rows) - 1)
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def finish(self):
+        if self.elapsed_final is None:
+            self.elapsed_final = time.monotonic() - self.start
+
+    @property
+    def files(self):
+        return sum(self.counts.values())
+
+    @property
+    def elapsed(self):
+        return self.elapsed_final if self.elapsed_final is not None else time.monotonic() - self.start
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_in / self.elapsed / (1024 * 1024) if self.elapsed > 0 else 0.0
+
+    def slowest(self):
+        return [self.rows[index] for total, index in sorted(self._slowest, reverse=True)]
+
+    def summary(self):
+        return {
+            "run": self.run_id,
+            "mode": self.mode,
+            "started": self.started,
+            "elapsed": self.elapsed,
+            "files": self.files,
+            "counts": dict(self.counts),
+            "files_per_second": self.files_per_second,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "mb_per_second": self.mb_per_second,
+            # 各阶段为所有工作线程/进程累计的耗时，并行时总和可能大于 elapsed
+            "stage_seconds": dict(self.stage_totals),
+            "errors": dict(self.errors),
+            "slowest": [dict(zip(CSV_FIELDS, row)) for row in self.slowest()]
+        }
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=4, ensure_ascii=False)
+
+    def write_csv(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            writer.writerows(self.rows)
+
+    def save(self, report_dir):
+        os.makedirs(report_dir, exist_ok=True)
+        name = self.run_id or time.strftime("%Y%m%d-%H%M%S")
+        json_path = os.path.join(report_dir, name + ".json")
+        csv_path = os.path.join(report_dir, name + ".csv")
+        self.write_json(json_path)
+        self.write_csv(csv_path)
+        return json_path, csv_path
+
+    def format_summary(self, top=5):
+        lines = [f"{self.files} files in {self.elapsed:.2f}s, {self.files_per_second:.1f} files/s, "
+                 f"{self.mb_per_second:.1f} MB/s read, {self.bytes_out / (1024 * 1024):.1f} MB written"]
+        lines.append("Stage time: " + ", ".join(f"{stage} {self.stage_totals.get(stage, 0.0):.3f}s"
+                                                for stage in STAGES))
+        if self.errors:
+            lines.append("Errors: " + ", ".join(f"{category} {count}" for category, count in self.errors.most_common()))
+        slowest = self.slowest()[:top]
+        if slowest:
+            lines.append("Slowest files:")
+            lines.extend(f"  {row[len(STAGES) + 2] * 1000:9.3f} ms  {row[0]}" for row in slowest)
+        return '\n'.join(lines)
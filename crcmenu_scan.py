@@ -0,0 +1,107 @@
+import os
+import re
+
+# 目录目标默认匹配的文件
+DEFAULT_RULES = ("**/*.html", "**/*.htm", "**/*.php")
+
+
+def _translate_segment(segment):
+    parts = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[':
+            end = segment.find(']', i + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = segment[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return ''.join(parts)
+
+
+def compile_rule(pattern):
+    # 相对于根目录、以 / 分隔的 glob：* 和 ? 不跨目录，** 匹配任意层目录；
+    # 不含 / 的规则匹配任意目录下的同名文件，以 /** 结尾的规则同时匹配该目录本身
+    pattern = pattern.strip().replace('\\', '/').lstrip('/')
+    if '/' not in pattern:
+        pattern = '**/' + pattern
+    segments = pattern.split('/')
+    regex = ''
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == '**':
+            if last:
+                regex = regex[:-1] + '(?:/.*)?' if regex else '.*'
+            else:
+                regex += '(?:[^/]+/)*'
+        else:
+            regex += _translate_segment(segment) + ('' if last else '/')
+    # 与旧版按扩展名匹配时一样不区分大小写
+    return re.compile(regex, re.IGNORECASE)
+
+
+class Rules:
+    # include/exclude 规则：以 ! 开头的是排除规则，排除优先于包含
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = list(rules)
+        self.includes = []
+        self.excludes = []
+        for rule in self.rules:
+            if rule.startswith('!'):
+                self.excludes.append(compile_rule(rule[1:]))
+            elif rule.strip():
+                self.includes.append(compile_rule(rule))
+
+    def excluded(self, relative_path):
+        return any(regex.fullmatch(relative_path) for regex in self.excludes)
+
+    def match(self, relative_path):
+        return (any(regex.fullmatch(relative_path) for regex in self.includes)
+                and not self.excluded(relative_path))
+
+
+def normalize_root(root):
+    if isinstance(root, str):
+        return {"path": root, "rules": list(DEFAULT_RULES)}
+    return {"path": root["path"], "rules": list(root.get("rules") or DEFAULT_RULES)}
+
+
+def scan_root(root, rules=DEFAULT_RULES):
+    # 基于 os.scandir 的惰性遍历：边扫描边产出文件路径，被排除的目录整棵跳过，不跟随目录符号链接
+    if not isinstance(rules, Rules):
+        rules = Rules(rules)
+    stack = [(root, '')]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Error scanning {directory}: {e}")
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative_path = prefix + entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if not rules.excluded(relative_path):
+                    subdirectories.append((entry.path, relative_path + '/'))
+            elif rules.match(relative_path):
+                yield entry.path
+        # 倒序入栈，使输出顺序与按名称排序的深度优先遍历一致
+        stack.extend(reversed(subdirectories))
@@ -0,0 +1,262 @@
+import ctypes
+import ctypes.util
+import glob
+import os
+import select
+import struct
+import time
+
+from crcmenu_core import run_batch, expand_targets
+from crcmenu_scan import DEFAULT_RULES, Rules, normalize_root
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+# 少量文件直接在当前线程处理，避免每批都启动进程池
+POOL_MIN_FILES = 64
+
+
+def watch_roots(targets):
+    # 把目标统一成 (目录根, 规则) 与单独文件两类：glob 拆成不含通配符的目录前缀和相对规则
+    roots = []
+    files = set()
+    for target in targets:
+        if isinstance(target, dict):
+            root = normalize_root(target)
+            roots.append((os.path.abspath(root["path"]), Rules(root["rules"])))
+        elif os.path.isdir(target):
+            roots.append((os.path.abspath(target), Rules(DEFAULT_RULES)))
+        elif glob.has_magic(target):
+            parts = target.replace('\\', '/').split('/')
+            index = next(i for i, part in enumerate(parts) if glob.has_magic(part))
+            base = '/'.join(parts[:index]) or '.'
+            roots.append((os.path.abspath(base), Rules(['/'.join(parts[index:])])))
+        else:
+            files.add(os.path.abspath(target))
+    return roots, files
+
+
+class TargetMatcher:
+    def __init__(self, targets):
+        self.roots, self.files = watch_roots(targets)
+
+    def root_for(self, directory):
+        for root, rules in self.roots:
+            if directory == root or directory.startswith(root.rstrip(os.sep) + os.sep):
+                return root, rules
+        return None, None
+
+    def relative(self, root, path):
+        return os.path.relpath(path, root).replace(os.sep, '/')
+
+    def match(self, path):
+        if path in self.files:
+            return True
+        root, rules = self.root_for(os.path.dirname(path))
+        return root is not None and rules.match(self.relative(root, path))
+
+    def excluded_dir(self, directory):
+        root, rules = self.root_for(directory)
+        return root is not None and directory != root and rules.excluded(self.relative(root, directory))
+
+
+def _load_libc():
+    if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher:
+    # Linux inotify（通过 ctypes 调用）：监视目录而非单个文件，生成器的原子替换和新建目录都能捕获
+    def __init__(self, matcher, libc):
+        self.matcher = matcher
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for root, rules in matcher.roots:
+            self.add_tree(root)
+        for path in matcher.files:
+            self.add_directory(os.path.dirname(path))
+
+    def add_directory(self, directory):
+        if directory in self.directories.values():
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.directories[wd] = directory
+
+    def add_tree(self, root):
+        # 为目录树中每个未被排除的目录添加监视，返回其中已有的匹配文件
+        found = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self.add_directory(directory)
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.matcher.excluded_dir(entry.path):
+                        stack.append(entry.path)
+                elif self.matcher.match(entry.path):
+                    found.append(entry.path)
+        return found
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                changed.update(self.handle(wd, mask, os.fsdecode(name)))
+        return changed
+
+    def handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出时无法确定哪些文件变化，重新检查全部目标（增量清单会跳过未变化的文件）
+            return {os.path.abspath(path) for path in expand_targets(
+                list(self.matcher.files) + [{"path": root, "rules": rules.rules} for root, rules in self.matcher.roots])}
+        if mask & IN_IGNORED:
+            self.directories.pop(wd, None)
+            return ()
+        directory = self.directories.get(wd)
+        if directory is None or not name:
+            return ()
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and self.matcher.root_for(path)[0] is not None \
+                    and not self.matcher.excluded_dir(path):
+                return self.add_tree(path)
+            return ()
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and self.matcher.match(path):
+            return (path,)
+        return ()
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # 不支持 inotify 的平台：按固定间隔扫描目标并比较大小和 mtime
+    def __init__(self, matcher, targets, interval=1.0):
+        self.matcher = matcher
+        self.targets = targets
+        self.interval = interval
+        self.known = self.scan()
+        self.next_scan = time.monotonic() + interval
+
+    def scan(self):
+        known = {}
+        for path in expand_targets(self.targets):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            known[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns)
+        return known
+
+    def wait(self, timeout):
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(delay, 0))
+        self.next_scan = time.monotonic() + self.interval
+        known = self.scan()
+        changed = {path for path, state in known.items() if self.known.get(path) != state}
+        self.known = known
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(targets, poll_interval=1.0):
+    matcher = TargetMatcher(targets)
+    libc = _load_libc()
+    if libc is not None:
+        try:
+            return InotifyWatcher(matcher, libc)
+        except OSError as e:
+            print(f"inotify unavailable, falling back to polling: {e}")
+    return PollingWatcher(matcher, targets, poll_interval)
+
+
+def watch_batches(processor, targets, workers=0, executor="process", manifest=None, stop_event=None,
+                  debounce=0.1, max_delay=1.0, poll_interval=1.0):
+    # 持续监视目标，把一段时间内的事件合并成一批，只对变化的文件重新执行操作，按 run_batch 的格式产出结果。
+    # 工具自身写入的文件会再次触发事件，按写入后的大小和 mtime 识别并忽略
+    watcher = create_watcher(targets, poll_interval)
+    own_writes = {}
+    pending = set()
+    first_pending = None
+    try:
+        while stop_event is None or not stop_event.is_set():
+            changed = watcher.wait(debounce if pending else 0.5)
+            for path in changed:
+                expected = own_writes.pop(path, None)
+                if expected is not None:
+                    try:
+                        stat = os.stat(path)
+                        if (stat.st_size, stat.st_mtime_ns) == expected:
+                            continue
+                    except OSError:
+                        continue
+                pending.add(path)
+            if not pending:
+                continue
+            if first_pending is None:
+                first_pending = time.monotonic()
+            if changed and time.monotonic() - first_pending < max_delay:
+                continue
+
+            batch = sorted(path for path in pending if os.path.isfile(path))
+            pending = set()
+            first_pending = None
+            batch_workers = workers if len(batch) >= POOL_MIN_FILES else 1
+            for file_path, result in run_batch(processor, batch, batch_workers, executor, manifest):
+                if result.success:
+                    try:
+                        stat = os.stat(file_path)
+                        own_writes[os.path.abspath(file_path)] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        pass
+                yield file_path, result
+    finally:
+        watcher.close()
+        # 每批结束时 run_batch 都会记录 completed，停止监视时补记一次，避免被当作中断的运行
+        if processor.journal is not None:
+            processor.journal.append([{"event": "end", "status": "stopped", "time": time.time()}], sync=True)
+            processor.journal.close()
@@ -0,0 +1,158 @@
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+import crcmenu_archive
+from crcmenu_archive import archive_format, rewrite_archive
+from crcmenu_backup import BackupStore
+from crcmenu_core import FileProcessor, STATUS_SUCCESS, STATUS_UNCHANGED, rollback_journal, run_batch, start_journal
+
+PAGE = b"<html><head></head><body><p>x</p></body></html>\n"
+SCRIPT = b"console.log('unchanged');\n" * 50
+TIMESTAMP = time.mktime((2024, 5, 6, 7, 8, 10, 0, 0, -1))
+
+
+def add_include(name, data):
+    return data.replace(b"</body>", b"<script src=\"/js/CRCMenu.js\"></script>\n</body>")
+
+
+def make_zip(path):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.comment = b"site export"
+        archive.writestr("index.html", PAGE)
+        archive.writestr("js/app.js", SCRIPT)
+        archive.writestr("docs/", b"")
+        archive.writestr("docs/about.htm", PAGE.replace(b"x", b"about"))
+
+
+def make_tar(path, mode):
+    with tarfile.open(path, mode, format=tarfile.PAX_FORMAT) as archive:
+        for name, data in (("site/index.html", PAGE), ("site/app.js", SCRIPT)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1000
+            info.mode = 0o640
+            info.pax_headers = {"mtime": "1000.5", "comment": "kept"}
+            archive.addfile(info, io.BytesIO(data))
+
+
+def test_archive_format_by_suffix():
+    assert archive_format("site.ZIP") == "zip"
+    assert archive_format("site.tar.gz") == archive_format("site.tgz") == "gz"
+    assert archive_format("site.tar.xz") == "xz"
+    assert archive_format("page.html") is None
+
+
+def test_zip_pages_are_rewritten_and_other_members_copied_raw(tmp_path):
+    source, target = str(tmp_path / "site.zip"), str(tmp_path / "out.zip")
+    make_zip(source)
+    seen = []
+
+    def transform(name, data):
+        seen.append(name)
+        return add_include(name, data)
+
+    result = rewrite_archive(source, target, transform, timestamp=TIMESTAMP)
+    assert (result.members, result.changed, result.failed) == (2, 2, [])
+    assert sorted(seen) == ["docs/about.htm", "index.html"]
+
+    with zipfile.ZipFile(source) as before, zipfile.ZipFile(target) as after:
+        assert after.testzip() is None
+        assert after.comment == b"site export"
+        assert after.namelist() == before.namelist()
+        assert after.read("index.html") == add_include("index.html", PAGE)
+        assert after.getinfo("index.html").date_time == (2024, 5, 6, 7, 8, 10)
+        assert after.getinfo("index.html").compress_type == zipfile.ZIP_DEFLATED
+        # 未修改的成员连同压缩数据原样复制
+        old, new = before.getinfo("js/app.js"), after.getinfo("js/app.js")
+        assert (new.CRC, new.compress_size, new.date_time) == (old.CRC, old.compress_size, old.date_time)
+        assert after.read("js/app.js") == SCRIPT
+
+
+def test_zip_members_are_recompressed_where_raw_copy_is_unverified(tmp_path, monkeypatch):
+    monkeypatch.setattr(crcmenu_archive, "RAW_COPY_VERSIONS", ((3, 0), (3, 0)))
+    source, target = str(tmp_path / "site.zip"), str(tmp_path / "out.zip")
+    make_zip(source)
+    with zipfile.ZipFile(source, 'a') as archive:
+        info = zipfile.ZipInfo("bin/tool", (2020, 1, 2, 3, 4, 6))
+        info.external_attr = 0o755 << 16
+        info.comment = b"executable"
+        archive.writestr(info, SCRIPT)
+
+    assert rewrite_archive(source, target, add_include, timestamp=TIMESTAMP).changed == 2
+    with zipfile.ZipFile(source) as before, zipfile.ZipFile(target) as after:
+        assert after.testzip() is None
+        assert after.comment == b"site export"
+        assert after.namelist() == before.namelist()
+        for name in ("js/app.js", "docs/", "bin/tool"):
+            old, new = before.getinfo(name), after.getinfo(name)
+            assert (new.date_time, new.compress_type, new.external_attr, new.comment, new.CRC) == \
+                (old.date_time, old.compress_type, old.external_attr, old.comment, old.CRC)
+            assert after.read(name) == before.read(name)
+        assert after.read("index.html") == add_include("index.html", PAGE)
+
+
+def test_failed_members_are_kept_and_reported(tmp_path):
+    source, target = str(tmp_path / "site.zip"), str(tmp_path / "out.zip")
+    make_zip(source)
+    result = rewrite_archive(source, target,
+                             lambda name, data: None if name == "index.html" else add_include(name, data))
+    assert (result.members, result.changed, result.failed) == (2, 1, ["index.html"])
+    with zipfile.ZipFile(target) as after:
+        assert after.read("index.html") == PAGE
+
+
+def test_dry_run_reads_without_writing(tmp_path):
+    source = str(tmp_path / "site.zip")
+    make_zip(source)
+    result = rewrite_archive(source, None, add_include)
+    assert (result.members, result.changed) == (2, 2)
+    assert os.listdir(str(tmp_path)) == ["site.zip"]
+
+
+@pytest.mark.parametrize("suffix, mode", [(".tar", "w"), (".tar.gz", "w:gz"), (".tar.bz2", "w:bz2"),
+                                          (".tar.xz", "w:xz")])
+def test_tar_pages_are_rewritten_in_the_same_compression(tmp_path, suffix, mode):
+    source, target = str(tmp_path / ("site" + suffix)), str(tmp_path / ("out" + suffix))
+    make_tar(source, mode)
+    result = rewrite_archive(source, target, add_include, timestamp=TIMESTAMP)
+    assert (result.members, result.changed, result.failed) == (1, 1, [])
+
+    with tarfile.open(target, 'r:*') as after:
+        page = after.getmember("site/index.html")
+        assert after.extractfile(page).read() == add_include("", PAGE)
+        # pax 头中的旧 mtime 不能覆盖新的修改时间，其他扩展头保留
+        assert page.mtime == int(TIMESTAMP)
+        assert page.pax_headers.get("comment") == "kept"
+        assert page.mode == 0o640
+        script = after.getmember("site/app.js")
+        assert after.extractfile(script).read() == SCRIPT
+        assert script.mtime == 1000.5
+
+
+def test_processor_rewrites_archive_and_rollback_restores_it(tmp_path):
+    path = str(tmp_path / "site.zip")
+    make_zip(path)
+    with open(path, 'rb') as f:
+        original = f.read()
+    js_code = '<script src="/js/CRCMenu.js"></script>'
+
+    def run():
+        processor = FileProcessor("", js_code, "inject", fsync="none", backup=BackupStore(str(tmp_path / "backups")))
+        processor.journal = start_journal(str(tmp_path / "journal"), processor, [path])
+        return processor.journal, dict(run_batch(processor, [path], workers=1, executor="thread"))[path]
+
+    journal, result = run()
+    assert result.status == STATUS_SUCCESS
+    with zipfile.ZipFile(path) as archive:
+        assert archive.read("index.html").count(js_code.encode()) == 1
+        assert archive.read("js/app.js") == SCRIPT
+    assert run()[1].status == STATUS_UNCHANGED
+
+    assert rollback_journal(journal, BackupStore(str(tmp_path / "backups"))) == (1, [])
+    with open(path, 'rb') as f:
+        assert f.read() == original
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from crcmenu_backup import BackupStore, STORE_PREFIX
+from crcmenu_core import FileProcessor, restore_run, run_batch
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+PAGE = b"<html><head><title>t</title></head><body>" + b"<p>lorem ipsum dolor sit amet</p>" * 200 + b"</body></html>\n"
+
+
+def pack_files(store, suffix):
+    return [name for name in os.listdir(store.pack_dir) if name.endswith(suffix)]
+
+
+def test_identical_backups_are_stored_once_and_restored(tmp_path):
+    store = BackupStore(str(tmp_path / "store")).begin_run("run1")
+    refs = [store.save(str(tmp_path / f"page{i}.html"), PAGE) for i in range(3)]
+    other = PAGE.replace(b"lorem", b"other")
+    refs.append(store.save(str(tmp_path / "other.html"), other))
+    store.close()
+
+    assert refs[0] == refs[1] == refs[2] and refs[0].startswith(STORE_PREFIX)
+    index = BackupStore(str(tmp_path / "store")).index()
+    assert len(index) == 2
+    # 第二个备份以第一个为字典压缩，只需存储差异部分
+    assert [entry["codec"] for entry in sorted(index.values(), key=lambda entry: entry["offset"])] == ["zlib", "zdict"]
+    assert sum(entry["length"] for entry in index.values()) < len(PAGE) // 4
+
+    reader = BackupStore(str(tmp_path / "store"))
+    assert reader.load(refs[0]) == PAGE
+    assert reader.load(refs[3]) == other
+
+    # 之后的运行不再存储已有的内容
+    store = BackupStore(str(tmp_path / "store")).begin_run("run2")
+    assert store.save(str(tmp_path / "page0.html"), PAGE) == refs[0]
+    store.close()
+    assert len(BackupStore(str(tmp_path / "store")).index()) == 2
+
+
+def test_streamed_backups_share_the_content_address(tmp_path):
+    page = tmp_path / "big.html"
+    page.write_bytes(PAGE * 10)
+    store = BackupStore(str(tmp_path / "store")).begin_run("run1")
+    ref = store.save_path(str(page))
+    assert store.save(str(page), PAGE * 10) == ref
+    store.close()
+    assert BackupStore(str(tmp_path / "store")).load(ref) == PAGE * 10
+
+
+def test_corrupted_backup_is_detected(tmp_path):
+    store = BackupStore(str(tmp_path / "store"), level=0).begin_run("run1")
+    ref = store.save("page.html", PAGE)
+    store.close()
+    pack = os.path.join(store.pack_dir, pack_files(store, ".pack")[0])
+    with open(pack, 'r+b') as f:
+        f.seek(10)
+        f.write(b"X")
+    with pytest.raises(ValueError):
+        BackupStore(str(tmp_path / "store")).load(ref)
+
+
+def test_runs_are_recorded_restored_and_evicted(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"page{i}.html"
+        path.write_bytes(PAGE)
+        paths.append(str(path))
+
+    def run(mode):
+        processor = FileProcessor("", JS_CODE, mode, fsync="none", backup=BackupStore(str(tmp_path / "store"),
+                                                                                     keep_runs=1))
+        list(run_batch(processor, paths, workers=1, executor="thread"))
+        return processor.run_id
+
+    first = run("inject")
+    store = BackupStore(str(tmp_path / "store"))
+    assert store.runs() == [first]
+    assert set(store.run_snapshot(first)["files"]) == set(paths)
+    assert len(store.index()) == 1
+
+    second = run("delete")
+    # 只保留最近一次运行，第一次运行的 pack 不再被引用而被删除
+    assert store.runs() == [second]
+    assert all(not name.startswith(first) for name in os.listdir(store.pack_dir))
+
+    assert restore_run(store, second, [paths[0]]) == (1, [])
+    with open(paths[0], 'rb') as f:
+        assert JS_CODE.encode() in f.read()
+    with open(paths[1], 'rb') as f:
+        assert JS_CODE.encode() not in f.read()
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import crcmenu_bench
+
+
+def test_repeat_must_be_positive(capsys):
+    with pytest.raises(SystemExit) as exc:
+        crcmenu_bench.main(["small", "--scale", "0.02", "--repeat", "0"])
+    assert exc.value.code == 2
+    assert "--repeat must be at least 1" in capsys.readouterr().err
+
+
+def test_single_repeat_summarizes_every_mode(tmp_path, capsys):
+    assert crcmenu_bench.main(["small", "--scale", "0.02", "--repeat", "1", "--no-memory",
+                               "--work-dir", str(tmp_path)]) == 0
+    output = capsys.readouterr().out
+    for mode in crcmenu_bench.BENCH_MODES:
+        assert f"small       {mode:<7}" in output
+
+
+def test_memory_pass_measures_the_rss_of_the_run_and_its_workers(tmp_path):
+    pytest.importorskip("resource")
+    assert crcmenu_bench.main(["small", "--scale", "0.02", "--repeat", "1", "-w", "2", "--executor", "process",
+                               "--work-dir", str(tmp_path), "--baseline-dir", str(tmp_path),
+                               "--save-baseline", "rss"]) == 0
+    with open(tmp_path / "rss.json", encoding='utf-8') as f:
+        results = json.load(f)["results"]["small"]
+    for mode in crcmenu_bench.BENCH_MODES:
+        assert results[mode]["peak_rss_mb"] > 0
+        assert results[mode]["worker_rss_mb"] > 0
+        assert "peak_mb" not in results[mode]
+
+
+def test_compare_ignores_peaks_measured_another_way():
+    current = {"files_per_second": 100.0, "peak_rss_mb": 40.0, "worker_rss_mb": None}
+    old = {"results": {"small": {"inject": {"files_per_second": 100.0, "peak_mb": 2.0}}}}
+    assert crcmenu_bench.compare({"small": {"inject": current}}, old, 0.1) == []
+    new = {"results": {"small": {"inject": {"files_per_second": 100.0, "peak_rss_mb": 30.0}}}}
+    assert crcmenu_bench.compare({"small": {"inject": current}}, new, 0.1) == \
+        ["small/inject: peak RSS 40.0 MB, baseline 30.0 MB"]
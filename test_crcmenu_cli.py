@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import crcmenu_cli
+import crcmenu_core
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+PAGE = "<html><head></head><body><p>x</p></body></html>\n"
+
+
+def write_page(directory, name="page.html", content=PAGE):
+    path = directory / name
+    path.write_text(content, encoding='utf-8')
+    return path
+
+
+def cli(tmp_path, command, *args):
+    # 默认单线程处理，测试中不启动进程池
+    return crcmenu_cli.main([command, "-w", "1", "-c", str(tmp_path / "config.json"), "--no-report", "-q"] +
+                            list(args))
+
+
+def test_inject_reports_success_then_unchanged(tmp_path, capsys):
+    page = write_page(tmp_path)
+    assert cli(tmp_path, "inject", str(page), "--js", JS_CODE, "-w", "2", "--executor", "thread") == 0
+    assert page.read_text(encoding='utf-8').count(JS_CODE) == 1
+    assert "1 files, 1 succeeded, 0 unchanged, 0 failed" in capsys.readouterr().out
+
+    assert cli(tmp_path, "inject", str(page), "--js", JS_CODE, "--full") == 0
+    assert "1 files, 0 succeeded, 1 unchanged, 0 failed" in capsys.readouterr().out
+
+
+def test_codes_and_targets_come_from_the_config(tmp_path, capsys):
+    page = write_page(tmp_path)
+    (tmp_path / "config.json").write_text(json.dumps({"js_code": JS_CODE, "files": [str(page)]}), encoding='utf-8')
+    assert cli(tmp_path, "inject") == 0
+    assert JS_CODE in page.read_text(encoding='utf-8')
+    assert cli(tmp_path, "delete") == 0
+    assert JS_CODE not in page.read_text(encoding='utf-8')
+
+
+def test_exit_codes(tmp_path, capsys):
+    page = write_page(tmp_path)
+    # 1：有文件处理失败，其余文件照常处理
+    assert cli(tmp_path, "inject", str(page), str(tmp_path / "missing.html"), "--js", JS_CODE) == 1
+    assert JS_CODE in page.read_text(encoding='utf-8')
+    assert "missing.html (not_found" in capsys.readouterr().err
+    # 2：输入无效
+    assert cli(tmp_path, "inject", str(page)) == 2
+    assert "Please provide JS code" in capsys.readouterr().err
+    assert cli(tmp_path, "update") == 2
+    assert "Please select files" in capsys.readouterr().err
+
+
+@pytest.mark.skipif(shutil.which("patch") is None, reason="patch is not installed")
+def test_dry_run_writes_a_patch_and_leaves_pages_untouched(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    pages = [write_page(tmp_path, f"page{i}.html") for i in range(2)]
+    write_page(tmp_path, "done.html", PAGE.replace("</body>", JS_CODE + "\n</body>"))
+    patch = tmp_path / "out.patch"
+    assert cli(tmp_path, "inject", str(tmp_path), "--js", JS_CODE, "--dry-run", "--patch", str(patch)) == 0
+    assert "3 files, 2 would change, 1 unchanged, 0 would fail" in capsys.readouterr().out
+    assert all(page.read_text(encoding='utf-8') == PAGE for page in pages)
+
+    text = patch.read_text(encoding='utf-8')
+    assert text.count("--- ") == 2 and "+++ page0.html\n" in text and "+" + JS_CODE + "\n" in text
+    # 补丁应用后与实际执行的结果一致
+    subprocess.run(["patch", "-p0", "-s", "-i", str(patch)], cwd=str(tmp_path), check=True)
+    patched = [page.read_text(encoding='utf-8') for page in pages]
+    for page in pages:
+        page.write_text(PAGE, encoding='utf-8')
+    assert cli(tmp_path, "inject", str(tmp_path), "--js", JS_CODE) == 0
+    assert [page.read_text(encoding='utf-8') for page in pages] == patched
+
+
+def test_content_version_follows_the_script_and_is_cached(tmp_path, monkeypatch, capsys):
+    script = tmp_path / "CRCMenu.js"
+    script.write_text("console.log(1);\n", encoding='utf-8')
+    page = write_page(tmp_path, content=PAGE.replace("</body>", '<script src="/js/CRCMenu.js?v=old"></script></body>'))
+    cache_path = tmp_path / crcmenu_core.VERSION_CACHE_NAME
+
+    assert cli(tmp_path, "update", str(page), "--js-file", str(script)) == 0
+    version = crcmenu_core.file_hash(str(script))[:crcmenu_core.VERSION_LENGTH]
+    assert f"CRCMenu.js?v={version}\"" in page.read_text(encoding='utf-8')
+    assert json.loads(cache_path.read_text(encoding='utf-8'))["entries"][str(script)]["version"] == version
+
+    # 脚本未变时版本号不变，页面无需改写，也不再重新计算哈希
+    monkeypatch.setattr(crcmenu_core, "file_hash", lambda path: pytest.fail("unchanged script was hashed"))
+    assert cli(tmp_path, "update", str(page), "--js-file", str(script)) == 0
+    assert "0 succeeded, 1 unchanged" in capsys.readouterr().out
+    monkeypatch.undo()
+
+    script.write_text("console.log(2);\n", encoding='utf-8')
+    os.utime(str(script), ns=(0, 10 ** 9))
+    assert cli(tmp_path, "update", str(page), "--js-file", str(script)) == 0
+    new_version = crcmenu_core.file_hash(str(script))[:crcmenu_core.VERSION_LENGTH]
+    assert new_version != version and f"CRCMenu.js?v={new_version}\"" in page.read_text(encoding='utf-8')
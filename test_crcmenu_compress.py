@@ -0,0 +1,53 @@
+import gzip
+import os
+
+import pytest
+
+from crcmenu_compress import parse_codecs, sibling_codecs
+from crcmenu_core import FileProcessor, STATUS_SUCCESS, STATUS_UNCHANGED
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+PAGE = b"<html><head></head><body><p>x</p></body></html>\n"
+
+
+def test_sibling_codecs_keeps_only_existing_copies(tmp_path):
+    page = str(tmp_path / "page.html")
+    (tmp_path / "page.html.gz").write_bytes(gzip.compress(PAGE))
+    codecs = parse_codecs("gzip")
+    assert sibling_codecs(page, codecs) == codecs
+    assert sibling_codecs(str(tmp_path / "other.html"), codecs) == []
+    assert sibling_codecs(str(tmp_path / "other.html"), codecs, create=True) == codecs
+
+
+@pytest.mark.parametrize("large_file_threshold", [0, 1])
+def test_existing_copy_is_regenerated_with_the_page_mtime(tmp_path, large_file_threshold):
+    path = tmp_path / "page.html"
+    path.write_bytes(PAGE)
+    (tmp_path / "page.html.gz").write_bytes(gzip.compress(PAGE))
+
+    def run():
+        processor = FileProcessor("", JS_CODE, "inject", fsync="none", precompress="gzip",
+                                  large_file_threshold=large_file_threshold)
+        return processor.process_file(str(path)).status
+
+    assert run() == STATUS_SUCCESS
+    assert gzip.decompress((tmp_path / "page.html.gz").read_bytes()) == path.read_bytes()
+    assert os.stat(str(tmp_path / "page.html.gz")).st_mtime == os.stat(str(path)).st_mtime
+    assert run() == STATUS_UNCHANGED
+
+
+@pytest.mark.parametrize("large_file_threshold", [0, 1])
+def test_missing_copies_are_created_only_when_asked(tmp_path, large_file_threshold):
+    def run(name, **options):
+        path = tmp_path / name
+        path.write_bytes(PAGE)
+        processor = FileProcessor("", JS_CODE, "inject", fsync="none", precompress="gzip",
+                                  large_file_threshold=large_file_threshold, **options)
+        assert processor.process_file(str(path)).status == STATUS_SUCCESS
+        return path
+
+    run("plain.html")
+    assert sorted(os.listdir(str(tmp_path))) == ["plain.html"]
+
+    path = run("created.html", precompress_create=True)
+    assert gzip.decompress((tmp_path / "created.html.gz").read_bytes()) == path.read_bytes()
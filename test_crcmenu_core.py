@@ -0,0 +1,521 @@
+import json
+import os
+import threading
+
+import pytest
+
+import crcmenu_core
+from crcmenu_backup import BakBackup, BackupStore
+from crcmenu_core import FileProcessor, STATUS_SUCCESS, STATUS_UNCHANGED
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+PAGE = "<html><head><title>t</title></head><body><p>x</p></body></html>\n"
+
+
+def write_pages(directory, count=3, content=PAGE):
+    paths = []
+    for i in range(count):
+        path = os.path.join(str(directory), f"page{i}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def sync_calls(monkeypatch):
+    calls = {"files": [], "directories": []}
+
+    def no_global_sync():
+        raise AssertionError("os.sync() flushes every mounted file system")
+
+    monkeypatch.setattr(os, "sync", no_global_sync, raising=False)
+    monkeypatch.setattr(crcmenu_core, "fsync_path", calls["files"].append)
+    monkeypatch.setattr(crcmenu_core, "fsync_directory", calls["directories"].append)
+    return calls
+
+
+def test_batch_commit_syncs_only_written_files_and_directory(tmp_path, sync_calls):
+    paths = write_pages(tmp_path)
+    processor = FileProcessor("", JS_CODE, "inject", fsync="batch")
+    results = processor.process_files(paths)
+
+    assert [result.status for result in results] == [STATUS_SUCCESS] * 3
+    assert len(sync_calls["files"]) == 3
+    assert all(os.path.dirname(path) == str(tmp_path) and os.path.basename(path).startswith(".page")
+               for path in sync_calls["files"])
+    assert sync_calls["directories"] == [str(tmp_path)]
+
+
+def test_fsync_none_leaves_syncing_to_the_os(tmp_path, sync_calls):
+    paths = write_pages(tmp_path)
+    FileProcessor("", JS_CODE, "inject", fsync="none").process_files(paths)
+    assert sync_calls == {"files": [], "directories": []}
+
+    write_pages(tmp_path)
+    FileProcessor("", JS_CODE, "inject", fsync="none", fsync_dir=True).process_files(paths)
+    assert sync_calls["files"] == []
+    assert set(sync_calls["directories"]) == {str(tmp_path)}
+
+
+def test_read_only_page_is_synced_and_keeps_its_mode(tmp_path):
+    path = write_pages(tmp_path, 1)[0]
+    os.chmod(path, 0o444)
+    try:
+        result = FileProcessor("", JS_CODE, "inject", fsync="batch").process_files([path])[0]
+        assert result.status == STATUS_SUCCESS
+        assert os.stat(path).st_mode & 0o777 == 0o444
+        assert os.listdir(str(tmp_path)) == ["page0.html"]
+    finally:
+        os.chmod(path, 0o644)
+
+
+def test_failed_batch_sync_fails_only_that_file(tmp_path, monkeypatch):
+    paths = write_pages(tmp_path)
+
+    def fsync_path(path):
+        if os.path.basename(path).startswith(".page1.html"):
+            raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(crcmenu_core, "fsync_path", fsync_path)
+    processor = FileProcessor("", JS_CODE, "inject", fsync="batch")
+    processor.journal = crcmenu_core.start_journal(str(tmp_path / "journal"), processor, paths)
+    results = processor.process_files(paths)
+
+    assert [result.status for result in results] == [STATUS_SUCCESS, crcmenu_core.STATUS_FAILED, STATUS_SUCCESS]
+    assert results[1].error[0] == "permission"
+    assert sorted(name for name in os.listdir(str(tmp_path)) if name != "journal") == \
+        ["page0.html", "page1.html", "page2.html"]
+    assert read(paths[1]) == PAGE and JS_CODE in read(paths[0]) and JS_CODE in read(paths[2])
+    state = processor.journal.state()
+    assert set(state["committed"]) == state["done"] == {paths[0], paths[2]}
+
+
+def run_with_journal(tmp_path, paths, backup, mode="inject"):
+    processor = FileProcessor("", JS_CODE, mode, fsync="none", backup=backup)
+    processor.journal = crcmenu_core.start_journal(str(tmp_path / "journal"), processor, paths)
+    results = dict(crcmenu_core.run_batch(processor, paths, workers=1, executor="thread"))
+    return processor.journal, results
+
+
+def interrupt_after_commit(journal, file_path):
+    # 模拟提交记录已写入、done 记录尚未写入时崩溃
+    records = [record for record in journal.read()
+               if record["event"] != "end" and not (record["event"] == "done" and record["path"] == file_path)]
+    with open(journal.journal_path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_rollback_restores_every_committed_file(tmp_path):
+    paths = write_pages(tmp_path)
+    store = BackupStore(str(tmp_path / "backups"))
+    journal, results = run_with_journal(tmp_path, paths, store)
+    assert all(JS_CODE in read(path) for path in paths)
+
+    restored, failed = crcmenu_core.rollback_journal(journal, BackupStore(str(tmp_path / "backups")))
+    assert (restored, failed) == (3, [])
+    assert [read(path) for path in paths] == [PAGE] * 3
+    assert crcmenu_core.journal_status(journal.state()) == "rolled back"
+    with pytest.raises(ValueError):
+        crcmenu_core.prepare_resume(journal)
+
+
+def test_resume_restores_committed_file_and_reprocesses_it(tmp_path):
+    paths = write_pages(tmp_path)
+    journal, results = run_with_journal(tmp_path, paths, BackupStore(str(tmp_path / "backups")))
+    interrupted = os.path.abspath(paths[1])
+    interrupt_after_commit(journal, interrupted)
+    assert crcmenu_core.journal_status(journal.state()) == "interrupted"
+
+    state = crcmenu_core.prepare_resume(journal, BackupStore(str(tmp_path / "backups")))
+    assert read(paths[1]) == PAGE
+    assert list(crcmenu_core.remaining_targets(state)) == [paths[1]]
+
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none", journal=journal)
+    results = dict(crcmenu_core.run_batch(processor, crcmenu_core.remaining_targets(state), workers=1,
+                                          executor="thread"))
+    assert results[paths[1]].status == STATUS_SUCCESS
+    assert read(paths[1]).count(JS_CODE) == 1
+    assert interrupted in journal.state()["done"]
+
+
+def test_resume_without_backups_reverifies_committed_files(tmp_path):
+    paths = write_pages(tmp_path)
+    journal, results = run_with_journal(tmp_path, paths, None)
+    interrupted = os.path.abspath(paths[0])
+    interrupt_after_commit(journal, interrupted)
+    assert journal.state()["committed"][interrupted] is None
+
+    state = crcmenu_core.prepare_resume(journal, BackupStore(str(tmp_path / "backups")))
+    assert list(crcmenu_core.remaining_targets(state)) == [paths[0]]
+
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none", journal=journal)
+    results = dict(crcmenu_core.run_batch(processor, crcmenu_core.remaining_targets(state), workers=1,
+                                          executor="thread"))
+    assert results[paths[0]].status == STATUS_UNCHANGED
+    assert read(paths[0]).count(JS_CODE) == 1
+
+
+def test_cancelled_run_is_journaled_and_resumed_where_it_stopped(tmp_path):
+    paths = write_pages(tmp_path, 5)
+    with open(paths[0], 'w', encoding='utf-8') as f:
+        f.write(PAGE.replace("</body>", JS_CODE + "\n</body>"))
+    control = crcmenu_core.RunControl()
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none", backup=BackupStore(str(tmp_path / "backups")))
+    processor.journal = crcmenu_core.start_journal(str(tmp_path / "journal"), processor, [str(tmp_path)])
+    prepare_file = processor._prepare_file
+
+    def cancel_during(file_path):
+        if file_path == paths[1]:
+            control.cancel()
+        return prepare_file(file_path)
+
+    processor._prepare_file = cancel_during
+    targets = crcmenu_core.expand_targets([str(tmp_path)])
+    results = [result.status for file_path, result in crcmenu_core.run_batch(processor, targets, workers=1,
+                                                                             executor="thread", control=control)]
+
+    # 正在处理的文件完成并提交后停止；跳过的与已完成的文件都记录在日志中
+    assert results == [STATUS_UNCHANGED, STATUS_SUCCESS]
+    journal = processor.journal
+    assert crcmenu_core.journal_status(journal.state()) == "cancelled"
+    state = crcmenu_core.prepare_resume(journal, BackupStore(str(tmp_path / "backups")))
+    assert list(crcmenu_core.remaining_targets(state)) == paths[2:]
+
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none", journal=journal)
+    results = dict(crcmenu_core.run_batch(processor, crcmenu_core.remaining_targets(state), workers=1,
+                                          executor="thread"))
+    assert [results[path].status for path in paths[2:]] == [STATUS_SUCCESS] * 3
+    assert all(read(path).count(JS_CODE) == 1 for path in paths)
+    assert crcmenu_core.journal_status(journal.state()) == "completed"
+
+
+def test_pipeline_text_round_trip():
+    steps = [{"op": "delete", "js_code": '<script src="/旧.js"></script>'}, "inject", "update"]
+    text = crcmenu_core.format_pipeline(steps)
+    assert text.splitlines()[1:] == ["inject", "update"]
+    assert crcmenu_core.parse_pipeline(text.splitlines() + ["", "  "]) == steps
+    with pytest.raises(ValueError):
+        crcmenu_core.parse_pipeline(['{"op": "delete"'])
+    with pytest.raises(ValueError):
+        crcmenu_core.normalize_pipeline([["inject"]], "", JS_CODE)
+
+
+@pytest.mark.parametrize("large_file_threshold", [0, 1])
+def test_non_ascii_snippets_on_a_gbk_page_are_not_injected_twice(tmp_path, large_file_threshold):
+    font_awesome_code = '<link rel="stylesheet" href="/css/all.min.css" title="图标">'
+    js_code = '<script src="/js/CRCMenu.js"></script>\n<!-- 菜单 -->'
+    page = '<html><head><meta charset="gbk"><title>中文页面</title></head><body><p>你好</p></body></html>\n'
+    path = tmp_path / "gbk.html"
+    path.write_bytes(page.encode('gbk'))
+
+    def run(mode):
+        processor = FileProcessor(font_awesome_code, js_code, mode, fsync="none",
+                                  large_file_threshold=large_file_threshold)
+        return processor.process_file(str(path)).status
+
+    assert run("inject") == STATUS_SUCCESS
+    injected = path.read_bytes().decode('gbk')
+    assert injected.count(js_code) == 1 and injected.count(font_awesome_code) == 1
+
+    assert run("inject") == STATUS_UNCHANGED
+    assert path.read_bytes().decode('gbk') == injected
+
+    assert run("delete") == STATUS_SUCCESS
+    deleted = path.read_bytes().decode('gbk')
+    assert js_code not in deleted and font_awesome_code not in deleted
+    assert deleted.replace('\n', '') == page.replace('\n', '')
+
+
+@pytest.mark.parametrize("large_file_threshold", [0, 1])
+def test_assets_keep_matching_suffixed_crcmenu_names(tmp_path, large_file_threshold):
+    page = ('<html><head><link rel="stylesheet" href="/css/CRCMenu.css?v=old"></head><body>\n'
+            '<script src="/js/CRCMenu.js?v=old"></script>\n'
+            '<script src="/js/xx-CRCMenu.js"></script>\n'
+            '<script src="/js/site-crcmenu.js?v=old"></script>\n'
+            '<script src="/js/CRCMenu.json"></script>\n'
+            '</body></html>\n')
+
+    def run(name, assets):
+        path = tmp_path / name
+        path.write_text(page, encoding='utf-8')
+        processor = FileProcessor("", "", "update", fsync="none", version="abc", assets=assets,
+                                  large_file_threshold=large_file_threshold)
+        assert processor.process_file(str(path)).status == STATUS_SUCCESS
+        return path.read_text(encoding='utf-8')
+
+    # 设置 assets 后 CRCMenu.js 的匹配与 JS_PATTERN 相同
+    plain = run("plain.html", None)
+    with_assets = run("assets.html", {"CRCMenu.css": "2"})
+    assert with_assets == plain.replace("CRCMenu.css?v=old", "CRCMenu.css?v=2")
+    assert with_assets.count("CRCMenu.js?v=abc") == 2 and "site-crcmenu.js?v=abc" in with_assets
+    assert '"/js/CRCMenu.json"' in with_assets
+
+    # 单独配置的文件名优先
+    assert 'xx-CRCMenu.js?v=9"' in run("explicit.html", {"xx-CRCMenu.js": "9"})
+
+
+def test_configured_assets_are_versioned_in_one_pass():
+    page = ('<html><head>\n'
+            '<link rel="stylesheet" href="/css/all.min.css?v=6.4">\n'
+            "<link href='../css/CRCMenu.CSS?v=old' rel=stylesheet>\n"
+            '<link rel="icon" href="/favicon.ico">\n'
+            '<script src="js/vendor.js#top" defer></script>\n'
+            '</head><body><script src="https://cdn.example.com/js/CRCMenu.js"></script>\n'
+            '<a href="/css/all.min.css">not an include</a></body></html>\n')
+    assets = {"all.min.css": "6.5.1", "CRCMenu.css": "", "vendor.js": "2"}
+    processor = FileProcessor("", "", "update", version="abc", assets=assets)
+    updated = processor.transform(page)
+    assert updated == (page.replace("all.min.css?v=6.4", "all.min.css?v=6.5.1", 1)
+                       .replace("CRCMenu.CSS?v=old", "CRCMenu.CSS?v=abc")
+                       .replace("CRCMenu.js", "CRCMenu.js?v=abc"))
+    # 带 # 片段的 URL 保持原样
+    assert 'js/vendor.js#top' in updated
+    assert processor.transform(page.encode('utf-8')) == updated.encode('utf-8')
+
+    # 资源版本表参与操作哈希，修改后 manifest 中的记录不再适用
+    other = FileProcessor("", "", "update", version="abc", assets=dict(assets, **{"vendor.js": "3"}))
+    assert other.operation_key != processor.operation_key
+    with pytest.raises(ValueError):
+        FileProcessor("", "", "update", assets={"bad name.js": ""})
+
+
+def test_cancel_stops_process_workers_between_files(tmp_path):
+    paths = write_pages(tmp_path, 1000)
+    control = crcmenu_core.RunControl()
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none")
+    results = []
+    for file_path, result in crcmenu_core.iter_process(processor, paths, workers=2, executor="process",
+                                                       chunk_size=100, control=control):
+        results.append((file_path, result.status))
+        control.cancel()
+
+    # 取消时正在运行的两个分块停在文件之间，已排队的分块不再处理
+    assert len(results) < 250
+    written = {path for path in paths if JS_CODE in read(path)}
+    assert written == {file_path for file_path, status in results if status == STATUS_SUCCESS}
+
+
+def test_finished_results_are_yielded_while_paused(tmp_path):
+    paths = write_pages(tmp_path, 8)
+    control = crcmenu_core.RunControl()
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none")
+    gate = threading.Event()
+    prepare_file = processor._prepare_file
+
+    def slow_prepare(file_path):
+        if file_path == paths[1]:
+            gate.wait(5)
+        return prepare_file(file_path)
+
+    processor._prepare_file = slow_prepare
+    resume = threading.Timer(1, control.resume)
+    paused_when = {}
+    try:
+        for file_path, result in crcmenu_core.iter_process(processor, paths, workers=2, executor="thread",
+                                                           chunk_size=1, control=control):
+            if not paused_when:
+                control.pause()
+                threading.Timer(0.2, gate.set).start()
+                resume.start()
+            paused_when[file_path] = control.paused
+    finally:
+        resume.cancel()
+        gate.set()
+
+    # 暂停前已开始的文件完成后立即产出，不等到继续
+    assert paused_when[paths[1]]
+    assert sorted(paused_when) == sorted(paths)
+
+
+def run_with_manifest(tmp_path, paths, js_code=JS_CODE, mode="inject"):
+    manifest = crcmenu_core.Manifest(str(tmp_path / "manifest.json")).load()
+    processor = FileProcessor("", js_code, mode, manifest=manifest.entries, fsync="none")
+    results = dict(crcmenu_core.run_batch(processor, paths, workers=1, executor="thread", manifest=manifest))
+    return processor, results
+
+
+def fail_transform(content):
+    raise AssertionError("an up-to-date file was transformed again")
+
+
+def test_manifest_skips_files_processed_by_the_same_operation(tmp_path, monkeypatch):
+    paths = write_pages(tmp_path, 2)
+    processor, results = run_with_manifest(tmp_path, paths)
+    assert [results[path].status for path in paths] == [STATUS_SUCCESS] * 2
+    entries = crcmenu_core.Manifest(str(tmp_path / "manifest.json")).load().entries
+    assert set(entries) == set(paths)
+    assert entries[paths[0]]["op"] == processor.operation_key
+
+    monkeypatch.setattr(FileProcessor, "transform_bytes", fail_transform)
+    processor, results = run_with_manifest(tmp_path, paths)
+    assert [results[path].status for path in paths] == [STATUS_UNCHANGED] * 2
+
+    # mtime 变化但内容相同：按哈希确认后仍然跳过，并记录新的 mtime
+    os.utime(paths[0], ns=(0, 10 ** 9))
+    processor, results = run_with_manifest(tmp_path, paths)
+    assert results[paths[0]].status == STATUS_UNCHANGED
+    assert crcmenu_core.Manifest(str(tmp_path / "manifest.json")).load().entries[paths[0]]["mtime_ns"] == 10 ** 9
+
+
+def test_manifest_entries_are_invalidated_by_edits_and_other_operations(tmp_path):
+    paths = write_pages(tmp_path, 2)
+    run_with_manifest(tmp_path, paths)
+
+    # 文件被外部修改后重新处理
+    with open(paths[0], 'w', encoding='utf-8') as f:
+        f.write(PAGE.replace("<p>x</p>", "<p>edited</p>"))
+    processor, results = run_with_manifest(tmp_path, paths)
+    assert (results[paths[0]].status, results[paths[1]].status) == (STATUS_SUCCESS, STATUS_UNCHANGED)
+    assert "edited" in read(paths[0]) and JS_CODE in read(paths[0])
+
+    # 操作或代码不同时，记录不再适用
+    other_code = '<script src="/js/other.js"></script>'
+    processor, results = run_with_manifest(tmp_path, paths, other_code)
+    assert [results[path].status for path in paths] == [STATUS_SUCCESS] * 2
+    processor, results = run_with_manifest(tmp_path, paths, other_code, "delete")
+    assert all(other_code not in read(path) for path in paths)
+
+
+@pytest.mark.parametrize("large_file_threshold", [0, 1])
+def test_unchanged_content_is_neither_backed_up_nor_rewritten(tmp_path, large_file_threshold):
+    path = write_pages(tmp_path, 1, PAGE.replace("</body>", JS_CODE + "\n</body>"))[0]
+    os.utime(path, ns=(0, 10 ** 9))
+    inode = os.stat(path).st_ino
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none", backup=BakBackup(),
+                              large_file_threshold=large_file_threshold)
+
+    assert processor.process_file(path).status == STATUS_UNCHANGED
+    assert os.listdir(str(tmp_path)) == ["page0.html"]
+    assert (os.stat(path).st_ino, os.stat(path).st_mtime_ns) == (inode, 10 ** 9)
+
+
+def test_always_write_rewrites_and_backs_up_unchanged_content(tmp_path):
+    content = PAGE.replace("</body>", JS_CODE + "\n</body>")
+    path = write_pages(tmp_path, 1, content)[0]
+    processor = FileProcessor("", JS_CODE, "inject", write_only_on_change=False, fsync="none",
+                              backup=BakBackup())
+
+    assert processor.process_file(path).status == STATUS_SUCCESS
+    assert read(path) == read(path + ".bak") == content
+
+
+@pytest.mark.parametrize("mode", ["update", "inject", "delete"])
+def test_str_and_bytes_pages_are_transformed_alike(mode):
+    font_awesome_code = '<link rel="stylesheet" href="/css/all.min.css">'
+    page = ('<html><HEAD><title>t</title></HEAD><body>\r\n'
+            '<script src="/js/CRCMenu.js?v=old" defer></script>\r\n'
+            '<SCRIPT SRC="/js/crcmenu.js"></SCRIPT>\r\n'
+            '<p>x</p></BODY></html>\r\n')
+    if mode == "inject":
+        # 带版本号的引用视为已经引入，注入时使用没有脚本的页面
+        page = '<html><HEAD><title>t</title></HEAD><body>\r\n<p>x</p></BODY></html>\r\n'
+    elif mode == "delete":
+        page = page.replace('</BODY>', '\r\n' + JS_CODE + '\r\n</BODY>')
+    processor = FileProcessor(font_awesome_code, JS_CODE, mode, version="abc")
+    result = processor.transform(page, '\r\n')
+    assert processor.transform(page.encode('utf-8'), '\r\n') == result.encode('utf-8')
+    # 每次运行预先构建的替换串与插入片段可重复使用：再次处理结果不变
+    assert processor.transform(result, '\r\n') == result
+
+    if mode == "update":
+        assert '/js/CRCMenu.js?v=abc" defer>' in result and '/js/crcmenu.js?v=abc">' in result
+        assert "v=old" not in result
+    elif mode == "inject":
+        assert result == page.replace('</HEAD>', '\r\n' + font_awesome_code + '\r\n</HEAD>').replace(
+            '</BODY>', '\r\n' + JS_CODE + '\r\n</BODY>')
+    else:
+        assert result == page.replace(JS_CODE, '')
+
+
+def test_large_files_are_streamed_to_the_same_bytes(tmp_path, monkeypatch):
+    old_code = '<script src="/js/old.js"></script>'
+    pipeline = [{"op": "delete", "js_code": old_code}, "inject", "update"]
+    page = ('<html><head><title>t</title></head><body>\r\n' + '<p>lorem ipsum</p>\r\n' * 5000 +
+            old_code + '\r\n</body></html>\r\n').encode('utf-8')
+
+    def run(name, large_file_threshold, backup=None):
+        path = tmp_path / name
+        path.write_bytes(page)
+        processor = FileProcessor("", JS_CODE, "pipeline", fsync="none", pipeline=pipeline, version="abc",
+                                  large_file_threshold=large_file_threshold, backup=backup)
+        [(_, result)] = crcmenu_core.run_batch(processor, [str(path)], workers=1, executor="thread")
+        assert result.status == STATUS_SUCCESS
+        return path.read_bytes(), processor
+
+    in_memory, _ = run("small.html", 0)
+    # 大文件不经过整体读入的 transform_bytes
+    monkeypatch.setattr(FileProcessor, "transform_bytes", fail_transform)
+    streamed, processor = run("large.html", 1, BackupStore(str(tmp_path / "store")))
+    assert streamed == in_memory
+    assert b'/js/CRCMenu.js?v=abc"' in streamed and old_code.encode() not in streamed
+    assert b'\n' not in streamed.replace(b'\r\n', b'')
+
+    # 大文件的备份按流压缩，恢复后与原文件一致
+    store = BackupStore(str(tmp_path / "store"))
+    assert [entry["codec"] for entry in store.index().values()] == ["stream"]
+    assert store.load(store.find_backup(str(tmp_path / "large.html"))[1]) == page
+    assert sorted(os.listdir(str(tmp_path))) == ["large.html", "small.html", "store"]
+
+
+def test_config_writer_coalesces_submissions(tmp_path, monkeypatch):
+    config_path = str(tmp_path / "config.json")
+    saves = []
+    save_config = crcmenu_core.save_config
+    monkeypatch.setattr(crcmenu_core, "save_config",
+                        lambda *args: saves.append(args[2] is not None) or save_config(*args))
+    writer = crcmenu_core.ConfigWriter(config_path, delay=60)
+    try:
+        config = crcmenu_core.normalize_config({})
+        writer.submit(dict(config, js_code="1"), ["a.html"])
+        for code in "234":
+            writer.submit(dict(config, js_code=code))
+        assert writer.busy() and saves == []
+        # flush 不再等待 delay，立即写入最后一次提交的配置与文件列表
+        assert writer.flush(5)
+    finally:
+        writer.close()
+
+    assert saves == [True] and not writer.busy()
+    loaded = crcmenu_core.load_config(config_path)
+    assert (loaded["js_code"], loaded["files"]) == ("4", ["a.html"])
+    assert "files" not in json.loads((tmp_path / "config.json").read_text(encoding='utf-8'))
+    assert writer.written_mtimes == {path: os.stat(path).st_mtime_ns
+                                     for path in (config_path, crcmenu_core.file_list_path_for(config_path))}
+
+
+@pytest.mark.parametrize("large_file_threshold", [0, 1])
+def test_tags_in_comments_and_scripts_do_not_move_the_injection(tmp_path, large_file_threshold):
+    page = ('<html><head><title>t</title>\n<!-- </head> -->\n</head><body>\n'
+            '<script>document.write("</body>");</script>\n<p>x</p>\n</body></html>\n<!-- </body> -->\n')
+    path = write_pages(tmp_path, 1, page)[0]
+    font_awesome_code = '<link rel="stylesheet" href="/css/all.min.css">'
+
+    def run(mode, js_code=JS_CODE):
+        processor = FileProcessor(font_awesome_code, js_code, mode, fsync="none",
+                                  large_file_threshold=large_file_threshold)
+        return processor.process_file(path)
+
+    assert run("inject").status == STATUS_SUCCESS
+    injected = read(path)
+    assert injected == page.replace('\n</head><body>', '\n\n' + font_awesome_code + '\n</head><body>').replace(
+        '<p>x</p>\n</body>', '<p>x</p>\n\n' + JS_CODE + '\n</body>')
+
+    # 属性顺序、空白与版本号不同的同一引用同样视为已存在，删除时一并移除
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(page.replace('<p>x</p>', '<p>x</p><SCRIPT  src="/js/CRCMenu.js?v=1" ></SCRIPT>').replace(
+            '</head><body>', '<LINK href="/css/all.min.css"\n  rel="stylesheet"></head><body>'))
+    assert run("inject").status == STATUS_UNCHANGED
+    assert run("delete").status == STATUS_SUCCESS
+    assert read(path) == page
+
+    only_commented = page.replace('\n</body></html>', '\n</html>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(only_commented)
+    assert run("inject", '<script src="/js/other.js"></script>').error[0] == "no_body_tag"
+    assert read(path) == only_commented
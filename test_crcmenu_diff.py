@@ -0,0 +1,49 @@
+import difflib
+
+import pytest
+
+from crcmenu_diff import region_diff, unified_diff
+
+
+def apply_edits(buffer, edits):
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(buffer[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(buffer[position:])
+    return b''.join(parts)
+
+
+def edits_at(buffer, markers):
+    # 每个标记替换为两行新内容
+    return [(buffer.index(marker), buffer.index(marker) + len(marker), b"new\n" + marker + b"\n") for marker in markers]
+
+
+LINES = b''.join(b"line %d\n" % i for i in range(100))
+
+
+@pytest.mark.parametrize("buffer, markers", [
+    (LINES, [b"line 0\n"]),
+    (LINES, [b"line 10\n", b"line 14\n"]),
+    (LINES, [b"line 10\n", b"line 40\n", b"line 99\n"]),
+    (LINES + b"tail without newline", [b"tail without newline"]),
+    (b"same\n" * 20 + b"</body>\n" + b"same\n" * 20, [b"</body>\n"]),
+])
+def test_region_diff_matches_a_full_diff(buffer, markers):
+    edits = edits_at(buffer, markers)
+    new = apply_edits(buffer, edits)
+    expected = unified_diff("page.html", buffer.decode(), new.decode())
+    assert region_diff("page.html", buffer, edits) == expected
+
+    # 去掉文件头后与 difflib 的结果一致（没有结尾换行时附加标记行）
+    reference = ''.join(difflib.unified_diff(buffer.decode().splitlines(keepends=True),
+                                             new.decode().splitlines(keepends=True), n=3))
+    if buffer.endswith(b"\n"):
+        assert expected.split("\n", 2)[2] == reference.split("\n", 2)[2]
+
+
+def test_identical_content_has_no_diff():
+    assert unified_diff("page.html", "a\nb\n", "a\nb\n") == ''
+    assert region_diff("page.html", LINES, []) == ''
@@ -0,0 +1,62 @@
+from crcmenu_html import SnippetLocator
+
+FONT_AWESOME_CODE = '<link rel="stylesheet" href="/css/all.min.css" title="图标">'
+JS_CODE = '<script src="/js/CRCMenu.js"></script>\n<!-- 菜单 -->'
+PAGE = ('<html><head><title>页面</title>\n'
+        '<!-- </head> in a comment -->\n'
+        '<script>var s = "</body>";</script>\n'
+        '<?php echo "</head>"; ?>\n'
+        '</head><body><p>内容</p></body></html>\n')
+
+
+def test_real_head_and_body_close_are_found():
+    layout = SnippetLocator(FONT_AWESOME_CODE, JS_CODE).locate(PAGE)
+    assert PAGE[layout.head_close:].startswith('</head><body>')
+    assert PAGE[layout.body_close:] == '</body></html>\n'
+    assert layout.present == [False, False]
+    assert layout.spans == [[], []]
+
+
+def test_tags_match_regardless_of_attribute_order_spacing_and_version():
+    locator = SnippetLocator('<link rel="stylesheet" href="/css/all.min.css">', '<script src="/js/CRCMenu.js"></script>')
+    page = ('<head><LINK  href="/css/all.min.css"\n rel="stylesheet" ></head>'
+            '<body><script src="/js/CRCMenu.js?v=abc123"></script></body>')
+    layout = locator.locate(page)
+    assert layout.present == [True, True]
+    assert [page[start:end] for start, end in layout.spans[0]] == ['<LINK  href="/css/all.min.css"\n rel="stylesheet" >']
+    assert [page[start:end] for start, end in layout.spans[1]] == ['<script src="/js/CRCMenu.js?v=abc123"></script>']
+
+
+def test_bytes_and_text_give_the_same_layout():
+    page = PAGE.replace('</body>', JS_CODE + '</body>', 1).replace('</head><body>', FONT_AWESOME_CODE + '</head><body>')
+    locator = SnippetLocator(FONT_AWESOME_CODE, JS_CODE)
+    text = locator.locate(page)
+    raw = locator.locate(page.encode('utf-8'))
+    assert text.present == raw.present == [True, True]
+
+    def characters(spans):
+        return [(len(page.encode('utf-8')[:start].decode('utf-8')), len(page.encode('utf-8')[:end].decode('utf-8')))
+                for start, end in spans]
+
+    assert [characters(spans) for spans in raw.spans] == text.spans
+
+
+def test_non_ascii_snippets_are_matched_in_the_page_encoding():
+    page = PAGE.replace('</body>', JS_CODE + '</body>', 1).replace('</head><body>', FONT_AWESOME_CODE + '</head><body>')
+    raw = page.encode('gbk')
+    locator = SnippetLocator(FONT_AWESOME_CODE, JS_CODE)
+
+    layout = locator.locate(raw, 'gbk')
+    assert layout.present == [True, True]
+    assert [raw[start:end].decode('gbk') for spans in layout.spans for start, end in spans] == [FONT_AWESOME_CODE, JS_CODE]
+
+    # 按 UTF-8 比较时找不到 GBK 页面中的片段
+    assert locator.locate(raw).spans == [[], []]
+
+
+def test_snippet_that_the_page_encoding_cannot_represent_is_absent():
+    locator = SnippetLocator('<link href="/a.css" title="✓">', '<script src="/b.js"></script>\n<!-- ✓ -->')
+    layout = locator.locate(PAGE.encode('gbk'), 'gbk')
+    assert layout.present == [False, False]
+    assert layout.spans == [[], []]
+    assert layout.body_close != -1
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from crcmenu_inventory import Inventory, PageScanner
+
+
+def test_scanner_finds_non_ascii_snippets_on_a_gbk_page():
+    js_code = '<script src="/js/CRCMenu.js"></script>\n<!-- 菜单 -->'
+    page = ('<html><head><meta charset="gbk"></head><body><p>你好</p>\n'
+            + js_code + '\n</body></html>\n').encode('gbk')
+    scanned = PageScanner("", js_code).scan_buffer(page)
+    assert scanned["head"] and scanned["body"]
+    assert scanned["js"] is True
+    assert scanned["includes"] == 1
+
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+FONT_AWESOME_CODE = '<link rel="stylesheet" href="/css/all.min.css">'
+PAGES = {
+    "current.html": '<html><head>{fa}</head><body><script src="/js/CRCMenu.js?v=new"></script></body></html>',
+    "old.html": '<html><head></head><body><script src="/js/CRCMenu.js?v=old"></script></body></html>',
+    "twice.html": '<html><head></head><body>{js}{js}</body></html>',
+    "plain.html": '<html><head></head><body></body></html>',
+    "nobody.html": '<html><head></head></html>',
+}
+
+
+def build_site(root):
+    for name, content in PAGES.items():
+        (root / name).write_text(content.format(fa=FONT_AWESOME_CODE, js=JS_CODE), encoding='utf-8')
+
+
+def scan(inventory, root, **kwargs):
+    return dict(inventory.update([str(root)], FONT_AWESOME_CODE, JS_CODE, workers=1, **kwargs))
+
+
+def test_inventory_queries(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    build_site(site)
+    with Inventory(str(tmp_path / "inventory.sqlite")) as inventory:
+        assert set(scan(inventory, site).values()) == {"scanned"}
+
+        def names(**conditions):
+            return [os.path.basename(path) for path in inventory.query(**conditions)]
+
+        assert names(version="old") == ["old.html"]
+        assert names(version="") == ["twice.html"]
+        assert names(other_version="new") == ["old.html", "twice.html"]
+        assert names(missing=["js"]) == ["nobody.html", "plain.html"]
+        assert names(missing=["body"]) == ["nobody.html"]
+        assert names(present=["js", "font_awesome"]) == ["current.html"]
+        assert names(duplicates=True) == ["twice.html"]
+        assert names(missing=["font_awesome"], pattern=str(site / "p*.html")) == ["plain.html"]
+        with pytest.raises(ValueError):
+            inventory.query(missing=["title"])
+
+        summary = inventory.summary()
+        assert (summary["pages"], summary["failed"], summary["duplicates"]) == (5, 0, 1)
+        assert summary["missing"]["js"] == 2
+        assert summary["versions"] == [("", 1), ("new", 1), ("old", 1)]
+
+
+def test_inventory_updates_incrementally_and_prunes_removed_pages(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    build_site(site)
+    with Inventory(str(tmp_path / "inventory.sqlite")) as inventory:
+        scan(inventory, site)
+        (site / "plain.html").write_text(PAGES["old.html"] + "\n", encoding='utf-8')
+        (site / "nobody.html").unlink()
+
+        statuses = {os.path.basename(path): status for path, status in scan(inventory, site).items()}
+        assert statuses == {"current.html": "unchanged", "old.html": "unchanged", "twice.html": "unchanged",
+                            "plain.html": "scanned"}
+        assert [os.path.basename(path) for path in inventory.query(version="old")] == ["old.html", "plain.html"]
+        assert inventory.summary()["pages"] == 4
+
+        # 代码片段变化后全部重新扫描
+        statuses = dict(inventory.update([str(site)], "", JS_CODE, workers=1))
+        assert set(statuses.values()) == {"scanned"}
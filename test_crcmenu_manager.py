@@ -0,0 +1,181 @@
+import ast
+import importlib.util
+import os
+import time
+
+import pytest
+
+import crcmenu_core
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CRCMenu-Manager.py")
+
+
+def test_gui_has_no_unused_imports():
+    with open(GUI_PATH, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    imported = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imported.update(alias.asname or alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imported.update(alias.asname or alias.name for alias in node.names)
+    used = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    assert imported - used == set()
+
+
+@pytest.fixture(scope="module")
+def gui():
+    pytest.importorskip("PySide6")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    spec = importlib.util.spec_from_file_location("crcmenu_manager", GUI_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    app = module.QApplication.instance() or module.QApplication([])
+    yield module
+    app.processEvents()
+
+
+@pytest.fixture
+def window(gui, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    warnings = []
+    monkeypatch.setattr(gui.QMessageBox, "warning", lambda parent, title, text: warnings.append(text))
+    window = gui.CRCMenuManager()
+    window.warnings = warnings
+    yield window
+    window.close()
+
+
+def test_pipeline_steps_are_edited_and_validated_in_the_window(window):
+    window.toggle_language()
+    window.set_mode_by_code("pipeline")
+    assert window.pipeline_edit.isVisibleTo(window)
+
+    window.js_code_edit.setPlainText('<script src="/js/CRCMenu.js"></script>')
+    window.pipeline_edit.setPlainText('{"op": "delete", "js_code": "<script src=\\"/old.js\\"></script>"}\ninject\nupdate')
+    assert window.settings["pipeline"] == [{"op": "delete", "js_code": '<script src="/old.js"></script>'},
+                                           "inject", "update"]
+    steps_text = "Delete Content → Inject Content → Update JS Version"
+    assert window.pipeline_status_label.text() == "Order: " + steps_text
+    assert window.validate_operation("pipeline", ["page.html"], []) == steps_text
+
+    window.pipeline_edit.setPlainText("inject\nrename")
+    assert "rename" in window.pipeline_status_label.text()
+    assert window.validate_operation("pipeline", ["page.html"], []) is None
+    assert "rename" in window.warnings[-1]
+
+    # 未写完的 JSON 不覆盖上一次有效的步骤
+    window.pipeline_edit.setPlainText('delete\n{"op": "inj')
+    assert window.settings["pipeline"] == ["inject", "rename"]
+    assert window.validate_operation("pipeline", ["page.html"], []) is None
+
+    window.set_mode_by_code("update")
+    assert not window.pipeline_edit.isVisibleTo(window)
+
+
+def run_watch_thread(gui, tmp_path, mode="inject", settings=None, roots=None):
+    thread = gui.WatchThread([], "", '<script src="/js/CRCMenu.js"></script>', mode, settings,
+                             str(tmp_path / "config.json"), roots or [str(tmp_path)])
+    completed = []
+    thread.operation_completed.connect(completed.append)
+    thread.run()
+    return completed
+
+
+def test_watch_thread_reports_a_processor_that_cannot_be_created(gui, tmp_path):
+    assert run_watch_thread(gui, tmp_path, "pipeline", {"pipeline": ["rename"]}) == [False]
+
+
+def test_watch_thread_reports_errors_while_watching(gui, tmp_path, monkeypatch):
+    def missing_directory(*args, **kwargs):
+        raise FileNotFoundError(str(tmp_path / "missing"))
+        yield
+
+    monkeypatch.setattr(gui, "watch_batches", missing_directory)
+    assert run_watch_thread(gui, tmp_path, settings={"journal": False}) == [False]
+
+
+def test_process_thread_completes_when_the_batch_raises(gui, tmp_path, monkeypatch):
+    page = tmp_path / "page.html"
+    page.write_text("<html><head></head><body></body></html>\n", encoding='utf-8')
+
+    def broken_batch(processor, targets, *args):
+        raise OSError("journal disk full")
+        yield
+
+    monkeypatch.setattr(gui, "run_batch", broken_batch)
+    thread = gui.ProcessThread([str(page)], "", '<script src="/js/CRCMenu.js"></script>', "inject",
+                               {"journal": False, "report": False}, str(tmp_path / "config.json"))
+    completed, stats = [], []
+    thread.operation_completed.connect(completed.append)
+    thread.stats_updated.connect(stats.append)
+    thread.run()
+    assert completed == [False]
+    assert stats[-1]["files"] == 0
+
+
+def test_scattered_rows_are_removed_from_a_large_model(gui):
+    model = gui.FileListModel()
+    paths = [f"/site/page{i}.html" for i in range(200000)]
+    model.add_targets(paths)
+    start = time.perf_counter()
+    model.remove_rows(range(0, len(paths), 2))
+    # 逐段删除是 O(n²)，并且每段都要调用一次 Qt
+    assert time.perf_counter() - start < 5
+    assert model.targets == paths[1::2]
+    assert model.keys == set(paths[1::2])
+
+
+def test_filtered_selection_is_removed_through_the_proxy(window):
+    paths = [f"/site/page{i}.html" for i in range(20000)]
+    window.file_model.add_targets(paths)
+    window.filter_edit.setText("7")
+    window.file_list_view.selectAll()
+    window.remove_selected_files()
+
+    window.filter_edit.setText("")
+    kept = [path for path in paths if "7" not in path]
+    assert window.file_model.targets == kept
+    assert window.file_model.keys == set(kept)
+    assert window.file_proxy.rowCount() == len(kept)
+
+
+def test_contiguous_rows_are_removed_in_place(gui):
+    model = gui.FileListModel()
+    model.add_targets([f"/site/page{i}.html" for i in range(10)])
+    removed = []
+    model.rowsRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+    model.remove_rows([8, 2, 3, 4, 9])
+    assert removed == [(8, 9), (2, 4)]
+    assert model.targets == [f"/site/page{i}.html" for i in (0, 1, 5, 6, 7)]
+    model.apply_diff(["/site/page1.html", "/site/page7.html", "/site/new.html"])
+    assert model.targets == ["/site/page1.html", "/site/page7.html", "/site/new.html"]
+    assert model.keys == set(model.targets)
+
+
+def wait_until(gui, predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        gui.QApplication.processEvents()
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_external_config_changes_are_reloaded_but_own_writes_are_not(gui, window, tmp_path, monkeypatch):
+    js_code = '<script src="/js/CRCMenu.js"></script>'
+    config = crcmenu_core.normalize_config({"js_code": js_code})
+    crcmenu_core.save_config(window.file_list_path, config, ["/site/a.html", "/site/b.html"])
+    # 原子替换触发目录事件，防抖后重新加载代码和文件列表
+    assert wait_until(gui, lambda: window.js_code_edit.toPlainText() == js_code)
+    assert wait_until(gui, lambda: window.file_model.targets == ["/site/a.html", "/site/b.html"])
+
+    reloads = []
+    monkeypatch.setattr(window, "load_config_file", lambda: reloads.append(True))
+    window.js_code_edit.setPlainText(js_code + "\n<!-- menu -->")
+    window.perform_save()
+    assert window.config_writer.flush(5)
+    assert not wait_until(gui, lambda: reloads, timeout=1.5)
+    assert crcmenu_core.load_config(window.file_list_path)["js_code"] == js_code + "\n<!-- menu -->"
+
+    crcmenu_core.save_config(window.file_list_path, config)
+    assert wait_until(gui, lambda: reloads)
@@ -0,0 +1,62 @@
+import csv
+import json
+import os
+
+from crcmenu_core import FileProcessor, FileResult, STATUS_FAILED, STATUS_SUCCESS, run_batch
+from crcmenu_report import CSV_FIELDS, STAGES, RunStats
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+
+
+def make_result(path, status, timings, error=None):
+    result = FileResult(path, status)
+    result.timings = timings
+    result.bytes_in = 100
+    result.bytes_out = 120 if status == STATUS_SUCCESS else 0
+    result.error = error
+    return result
+
+
+def test_stats_keep_totals_errors_and_the_slowest_files():
+    stats = RunStats("run1", "inject", slowest=2)
+    stats.add(make_result("a.html", STATUS_SUCCESS, {"read": 0.1, "write": 0.2}))
+    stats.add(make_result("b.html", STATUS_FAILED, {"read": 0.5}, ("no_body_tag", "</body> not found")))
+    stats.add(make_result("c.html", STATUS_SUCCESS, {"read": 0.05, "transform": 0.01}))
+    stats.add(make_result("d.html", STATUS_FAILED, {"read": 0.01}, ("no_body_tag", "</body> not found")))
+    stats.finish()
+
+    summary = stats.summary()
+    assert summary["counts"] == {"success": 2, "unchanged": 0, "failed": 2}
+    assert summary["errors"] == {"no_body_tag": 2}
+    assert round(summary["stage_seconds"]["read"], 6) == 0.66
+    assert (summary["bytes_in"], summary["bytes_out"]) == (400, 240)
+    assert [row["path"] for row in summary["slowest"]] == ["b.html", "a.html"]
+    assert summary["slowest"][1]["total"] == 0.3
+    assert "Errors: no_body_tag 2" in stats.format_summary()
+
+
+def test_run_report_is_saved_as_json_and_csv(tmp_path):
+    paths = []
+    for name, content in (("ok.html", "<html><body></body></html>"), ("bad.html", "<html></html>")):
+        path = tmp_path / name
+        path.write_text(content, encoding='utf-8')
+        paths.append(str(path))
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none")
+    stats = RunStats(processor.run_id, processor.mode)
+    list(run_batch(processor, paths, workers=1, executor="thread", stats=stats))
+    stats.finish()
+
+    json_path, csv_path = stats.save(str(tmp_path / "reports"))
+    assert os.path.basename(json_path) == processor.run_id + ".json"
+    with open(json_path, encoding='utf-8') as f:
+        summary = json.load(f)
+    assert summary["counts"]["success"] == summary["counts"]["failed"] == 1
+    assert summary["errors"] == {"no_body_tag": 1}
+
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        rows = {row["path"]: row for row in csv.DictReader(f)}
+    assert list(rows[paths[0]]) == list(CSV_FIELDS)
+    assert rows[paths[0]]["status"] == STATUS_SUCCESS and float(rows[paths[0]]["commit"]) > 0
+    assert float(rows[paths[0]]["total"]) >= max(float(rows[paths[0]][stage]) for stage in STAGES)
+    assert int(rows[paths[0]]["bytes_out"]) == int(rows[paths[0]]["bytes_in"]) + len(JS_CODE) + 2
+    assert (rows[paths[1]]["error_category"], rows[paths[1]]["error"]) == ("no_body_tag", "</body> not found")
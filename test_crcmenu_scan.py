@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import crcmenu_scan
+from crcmenu_core import expand_targets
+from crcmenu_scan import Rules, compile_rule, scan_root
+
+
+def make_tree(root, names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("<html></html>", encoding='utf-8')
+
+
+def relative(root, paths):
+    return [os.path.relpath(path, str(root)).replace(os.sep, '/') for path in paths]
+
+
+@pytest.mark.parametrize("pattern, matches, misses", [
+    ("*.html", ["a.html", "x/y/A.HTML"], ["a.htm", "a.html.bak"]),
+    ("docs/*.html", ["docs/a.html"], ["docs/x/a.html", "x/docs/a.html"]),
+    ("docs/**/*.html", ["docs/a.html", "docs/x/y/a.html"], ["x/docs/a.html"]),
+    ("build/**", ["build", "build/x/a.html"], ["builder/a.html"]),
+    ("page?.htm", ["page1.htm", "x/pageA.htm"], ["page10.htm", "page/.htm"]),
+    ("page[!0-9].html", ["pageA.html"], ["page1.html"]),
+])
+def test_rules_are_matched_as_path_globs(pattern, matches, misses):
+    regex = compile_rule(pattern)
+    assert all(regex.fullmatch(path) for path in matches)
+    assert not any(regex.fullmatch(path) for path in misses)
+
+
+def test_excluded_directories_are_pruned_from_the_scan(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["b.html", "a.php", "notes.txt", "sub/c.htm", "sub/skip.html",
+                         "node_modules/x/d.html", "z/e.html"])
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(crcmenu_scan.os, "scandir", lambda path: listed.append(path) or scandir(path))
+
+    rules = list(crcmenu_scan.DEFAULT_RULES) + ["!node_modules/**", "!skip.html"]
+    assert relative(tmp_path, scan_root(str(tmp_path), rules)) == ["a.php", "b.html", "sub/c.htm", "z/e.html"]
+    assert not any("node_modules" in path for path in listed)
+
+
+def test_scan_is_lazy(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["a/1.html", "b/2.html"])
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(crcmenu_scan.os, "scandir", lambda path: listed.append(path) or scandir(path))
+
+    paths = scan_root(str(tmp_path))
+    assert relative(tmp_path, [next(paths)]) == ["a/1.html"]
+    assert not any(path.endswith("b") for path in listed)
+
+
+def test_targets_mix_files_globs_and_roots_without_duplicates(tmp_path):
+    make_tree(tmp_path, ["site/index.html", "site/old/a.html", "site/a.htm", "extra/b.html"])
+    targets = [
+        str(tmp_path / "site" / "index.html"),
+        {"path": str(tmp_path / "site"), "rules": ["*.html", "!old/**"]},
+        str(tmp_path / "**" / "*.htm*"),
+        str(tmp_path / "missing.html"),
+    ]
+    paths = relative(tmp_path, expand_targets(targets))
+    # 目录根排除了 old/，glob 重新找到的 index.html 不重复产出
+    assert paths[0] == "site/index.html" and paths[-1] == "missing.html"
+    assert sorted(paths[1:-1]) == ["extra/b.html", "site/a.htm", "site/old/a.html"]
+    assert Rules(["*.html", "!old/**"]).match("old") is False
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import pytest
+
+import crcmenu_watch
+from crcmenu_core import FileProcessor, STATUS_SUCCESS
+from crcmenu_watch import InotifyWatcher, PollingWatcher, TargetMatcher, create_watcher, watch_batches
+
+JS_CODE = '<script src="/js/CRCMenu.js"></script>'
+PAGE = "<html><head></head><body><p>x</p></body></html>\n"
+
+
+def write(path, content=PAGE):
+    # 与生成器一样先写临时文件再原子替换
+    temp_path = str(path) + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, str(path))
+
+
+def collect(watcher, expected, timeout=5):
+    changed = set()
+    deadline = time.monotonic() + timeout
+    while not expected <= changed and time.monotonic() < deadline:
+        changed |= watcher.wait(0.1)
+    return changed
+
+
+@pytest.fixture
+def libc():
+    libc = crcmenu_watch._load_libc()
+    if libc is None:
+        pytest.skip("inotify is not available")
+    return libc
+
+
+def test_inotify_reports_matching_files_in_new_and_existing_directories(tmp_path, libc):
+    (tmp_path / "build").mkdir()
+    targets = [{"path": str(tmp_path), "rules": ["*.html", "!build/**"]}]
+    watcher = InotifyWatcher(TargetMatcher(targets), libc)
+    try:
+        assert str(tmp_path / "build") not in watcher.directories.values()
+        write(tmp_path / "a.html")
+        write(tmp_path / "notes.txt")
+        write(tmp_path / "build" / "b.html")
+        assert collect(watcher, {str(tmp_path / "a.html")}) == {str(tmp_path / "a.html")}
+
+        # 新建的目录加入监视，其中已有的匹配文件一并报告
+        (tmp_path / "new").mkdir()
+        write(tmp_path / "new" / "c.html")
+        changed = collect(watcher, {str(tmp_path / "new" / "c.html")})
+        assert changed == {str(tmp_path / "new" / "c.html")}
+        write(tmp_path / "new" / "d.html")
+        assert collect(watcher, {str(tmp_path / "new" / "d.html")}) == {str(tmp_path / "new" / "d.html")}
+    finally:
+        watcher.close()
+
+
+def test_polling_is_used_without_inotify(tmp_path, monkeypatch):
+    monkeypatch.setattr(crcmenu_watch, "_load_libc", lambda: None)
+    write(tmp_path / "a.html")
+    watcher = create_watcher([str(tmp_path)], poll_interval=0.05)
+    assert isinstance(watcher, PollingWatcher)
+    write(tmp_path / "a.html", PAGE + "\n")
+    write(tmp_path / "b.htm")
+    assert collect(watcher, {str(tmp_path / "a.html"), str(tmp_path / "b.htm")}) == \
+        {str(tmp_path / "a.html"), str(tmp_path / "b.htm")}
+
+
+def test_watch_reprocesses_changed_files_but_not_its_own_writes(tmp_path):
+    processor = FileProcessor("", JS_CODE, "inject", fsync="none")
+    stop_event = threading.Event()
+    results = []
+
+    def watch():
+        for file_path, result in watch_batches(processor, [str(tmp_path)], workers=1, executor="thread",
+                                               stop_event=stop_event, debounce=0.05, poll_interval=0.05):
+            results.append((file_path, result.status))
+
+    thread = threading.Thread(target=watch)
+    thread.start()
+    try:
+        time.sleep(0.2)
+        write(tmp_path / "a.html")
+        deadline = time.monotonic() + 5
+        while not results and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # 注入后的写入同样产生事件，按大小与 mtime 识别为自身写入而忽略
+        time.sleep(1)
+    finally:
+        stop_event.set()
+        thread.join(5)
+
+    assert results == [(str(tmp_path / "a.html"), STATUS_SUCCESS)]
+    with open(str(tmp_path / "a.html"), encoding='utf-8') as f:
+        assert f.read().count(JS_CODE) == 1